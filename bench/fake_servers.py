@@ -0,0 +1,292 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Путь API партнерского поиска Tripster на локальном сервере
+TRIPSTER_API_PATH = "/api/partners/travelpayouts/search/experiences/"
+WP_API_PATH = "/wp-json/wp/v2/posts"
+TRIPSTER_API_PAGE_SIZE = 50
+
+CITIES = ("Moscow", "Kazan", "Sochi", "Kaliningrad", "Pskov")
+PAUSE_REASONS = ("Гид в отпуске", "Экскурсия временно не проводится", "Гид приостановил продажи")
+# Виды ответов, отдаваемых с ETag (ответ 304 на If-None-Match с тем же ETag)
+CONDITIONAL_KINDS = ('wp_post', 'tripster_page')
+
+
+class SyntheticSite:
+    """
+    Детерминированный синтетический сайт WordPress со ссылками на экскурсии Tripster.
+
+    Посты и страницы не хранятся в памяти, а строятся по номеру при каждом запросе,
+    поэтому размер сайта (1k, 10k, 100k постов) не влияет на память серверов.
+    Тип экскурсии определяется ее ID: примерно 5% не существуют, 10% на паузе,
+    5% - страницы Спутника, остальные активны.
+    """
+
+    def __init__(self, posts, tripster_base_url, seed=1, widgets_per_post=3, deeplinks_per_post=5, page_size=60000):
+        self.posts = posts
+        self.tripster_base_url = tripster_base_url.rstrip('/')
+        self.seed = seed
+        self.widgets_per_post = widgets_per_post
+        self.deeplinks_per_post = deeplinks_per_post
+        self.page_size = page_size
+        # Число экскурсий растет медленнее числа постов: одни экскурсии упоминаются во многих постах
+        self.experiences = max(50, posts // 4)
+
+    def experience_state(self, experience_id):
+        """Возвращает тип экскурсии: 'missing', 'paused', 'sputnik' или 'active'."""
+        bucket = zlib.crc32(f"{self.seed}:{experience_id}".encode()) % 20
+        if bucket == 0:
+            return 'missing'
+        if bucket in (1, 2):
+            return 'paused'
+        if bucket == 3:
+            return 'sputnik'
+        return 'active'
+
+    def experience_title(self, experience_id):
+        """Возвращает название экскурсии."""
+        return f"Экскурсия №{experience_id}"
+
+    def experience_url(self, experience_id):
+        """Возвращает URL страницы экскурсии."""
+        return f"{self.tripster_base_url}/experience/{experience_id}/"
+
+    def post_content(self, post_id):
+        """Строит HTML-контент поста с виджетами, диплинками и обычным текстом."""
+        rnd = random.Random(self.seed * 1000003 + post_id)
+        parts = [f"<p>Текст поста {post_id}. " + "Описание маршрута. " * rnd.randint(20, 60) + "</p>"]
+
+        for _ in range(rnd.randint(0, self.widgets_per_post * 2)):
+            experience_id = rnd.randint(1, self.experiences)
+            url = self.experience_url(experience_id)
+            parts.append(
+                f'<div class="tripster-widget" data-experience-id="{experience_id}" data-experience-href="{url}">'
+                f'<a class="expcard__title expcard__title__link" href="{url}">{self.experience_title(experience_id)}</a></div>'
+            )
+
+        links = []
+        for _ in range(rnd.randint(0, self.deeplinks_per_post * 2)):
+            kind = rnd.random()
+            if kind < 0.8:
+                experience_id = rnd.randint(1, self.experiences)
+                links.append(f'<a href="{self.experience_url(experience_id)}">Ссылка на экскурсию {experience_id}</a>')
+            elif kind < 0.9:
+                city = rnd.choice(CITIES)
+                links.append(f'<a href="{self.tripster_base_url}/experience/{city}/">Экскурсии: {city}</a>')
+            else:
+                guide_id = rnd.randint(1, 500)
+                links.append(f'<a href="{self.tripster_base_url}/guide/{guide_id}/">Гид {guide_id}</a>')
+        if links:
+            parts.append("<p>" + " ".join(links) + "</p>")
+
+        parts.append('<p><a href="https://example.com/">Другая ссылка</a></p>')
+        return "\n".join(parts)
+
+    def post(self, post_id):
+        """Возвращает пост в формате WordPress REST API."""
+        minute, second = divmod(post_id % 3600, 60)
+        modified = f"2024-01-01T{post_id // 3600 % 24:02d}:{minute:02d}:{second:02d}"
+        return {
+            'id': post_id,
+            'title': {'rendered': f"Пост &laquo;{post_id}&raquo;"},
+            'content': {'rendered': self.post_content(post_id)},
+            'modified': modified,
+            'modified_gmt': modified,
+        }
+
+    def _padded_page(self, body):
+        """Дополняет страницу разметкой до размера page_size; маркеры типа страницы находятся в начале."""
+        head = "<html><head><meta charset=\"utf-8\"><title>Tripster</title>" + "<meta name=\"x\" content=\"y\">" * 50 + "</head><body>"
+        page = (head + body).encode('utf-8')
+        review = "<div class=\"review\">Отзыв путешественника.</div>".encode('utf-8')
+        filler = review * max(0, (self.page_size - len(page)) // len(review))
+        return page + filler + b"</body></html>"
+
+    def experience_page(self, experience_id):
+        """Возвращает HTML страницы экскурсии или None, если экскурсии нет."""
+        state = self.experience_state(experience_id)
+        title = self.experience_title(experience_id)
+        if state == 'missing':
+            return None
+        if state == 'sputnik':
+            return self._padded_page(f'<div class="sputnik-hr"><h1>{title}</h1></div>')
+        if state == 'paused':
+            reason = PAUSE_REASONS[experience_id % len(PAUSE_REASONS)]
+            return self._padded_page(
+                '<div class="page-experience"><div class="page-experience__wrap" style="display:none;"></div>'
+                f'<div class="exp-paused"><h3 class="exp-paused__preview-name">{title}</h3><p>{reason}</p></div></div>'
+            )
+        return self._padded_page(f'<div class="page-experience"><div class="page-experience__wrap"><h1>{title}</h1></div></div>')
+
+    def listing_page(self, city):
+        """Возвращает HTML страницы со списком экскурсий города."""
+        return self._padded_page(f'<div class="product-header"><h1>Экскурсии: {city}</h1></div>')
+
+    def guide_page(self, guide_id):
+        """Возвращает HTML авторской страницы гида."""
+        return self._padded_page(f'<div class="author_page"><h1>Гид {guide_id}</h1></div>')
+
+    def api_experience(self, experience_id, paused):
+        """Возвращает экскурсию в формате API Tripster или None, если она не подходит под запрос."""
+        state = self.experience_state(experience_id)
+        if experience_id > self.experiences or state == 'missing':
+            return None
+        if (state == 'paused') != paused:
+            return None
+        return {
+            'id': experience_id,
+            'title': self.experience_title(experience_id),
+            'status': 'paused' if paused else 'active',
+        }
+
+
+class RequestStats:
+    """Потокобезопасные счетчики запросов к локальным серверам по видам."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.bytes = 0
+
+    def add(self, kind, size):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.bytes += size
+
+    def snapshot(self):
+        with self._lock:
+            return {'requests': dict(self.counts), 'total_requests': sum(self.counts.values()), 'bytes_sent': self.bytes}
+
+
+def make_handler(site, stats, latency=0.0, error_rate=0.0):
+    """
+    Создает обработчик HTTP-запросов к синтетическому сайту.
+
+    Args:
+        site (SyntheticSite): Синтетический сайт.
+        stats (RequestStats): Счетчики запросов.
+        latency (float): Задержка каждого ответа в секундах.
+        error_rate (float): Доля запросов, на которые возвращается 503.
+
+    Returns:
+        type: Класс обработчика для ThreadingHTTPServer.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, kind, status, body, content_type='text/html; charset=utf-8', headers=None):
+            if status == 200 and kind in CONDITIONAL_KINDS:
+                # Страницы и посты отдаются с ETag и поддерживают условные запросы
+                etag = f'"{zlib.crc32(body):08x}"'
+                headers = dict(headers or {}, ETag=etag)
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    stats.add(kind + '_not_modified', 0)
+                    return
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент прекратил чтение, определив тип страницы по ее началу
+                pass
+            stats.add(kind, len(body))
+
+        def _send_json(self, kind, data, headers=None):
+            self._send(kind, 200, json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8', headers)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if error_rate and random.random() < error_rate:
+                self._send('error_503', 503, b'Service Unavailable')
+                return
+
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+            path = parts.path
+
+            if path.rstrip('/') == WP_API_PATH:
+                self._wp_listing(query)
+            elif path.startswith(WP_API_PATH + '/'):
+                post_id = path[len(WP_API_PATH) + 1:].strip('/')
+                if post_id.isdigit() and 1 <= int(post_id) <= site.posts:
+                    self._send_json('wp_post', site.post(int(post_id)))
+                else:
+                    self._send('wp_post', 404, b'{}', 'application/json')
+            elif path == TRIPSTER_API_PATH:
+                self._tripster_api(query)
+            elif path.startswith('/experience/'):
+                slug = path.strip('/').split('/')[1] if path.count('/') >= 2 else ''
+                if slug.isdigit():
+                    body = site.experience_page(int(slug)) if int(slug) <= site.experiences else None
+                    if body is None:
+                        self._send('tripster_page', 404, b'Not Found')
+                    else:
+                        self._send('tripster_page', 200, body)
+                else:
+                    self._send('tripster_page', 200, site.listing_page(slug))
+            elif path.startswith('/guide/'):
+                self._send('tripster_page', 200, site.guide_page(path.strip('/').split('/')[-1]))
+            else:
+                self._send('not_found', 404, b'Not Found')
+
+        def _wp_listing(self, query):
+            per_page = min(int(query.get('per_page', ['10'])[0]), 100)
+            page = int(query.get('page', ['1'])[0])
+            total_pages = max(1, -(-site.posts // per_page))
+            if page > total_pages:
+                self._send('wp_listing', 400, b'{"code":"rest_post_invalid_page_number"}', 'application/json')
+                return
+            first = (page - 1) * per_page + 1
+            posts = [site.post(post_id) for post_id in range(first, min(site.posts, first + per_page - 1) + 1)]
+            fields = query.get('_fields', [''])[0]
+            if fields:
+                keep = set(fields.split(','))
+                posts = [{key: value for key, value in post.items() if key in keep} for post in posts]
+            self._send_json('wp_listing', posts, {'X-WP-Total': str(site.posts), 'X-WP-TotalPages': str(total_pages)})
+
+        def _tripster_api(self, query):
+            ids = [int(i) for i in query.get('ids', [''])[0].split(',') if i.strip().isdigit()]
+            paused = query.get('paused', ['false'])[0].lower() == 'true'
+            offset = int(query.get('offset', ['0'])[0])
+            found = [experience for experience in (site.api_experience(i, paused) for i in ids) if experience]
+            results = found[offset:offset + TRIPSTER_API_PAGE_SIZE]
+            next_url = None
+            if offset + TRIPSTER_API_PAGE_SIZE < len(found):
+                host = self.headers.get('Host')
+                next_url = f"http://{host}{TRIPSTER_API_PATH}?ids={','.join(map(str, ids))}&offset={offset + TRIPSTER_API_PAGE_SIZE}"
+                if paused:
+                    next_url += "&paused=true"
+            self._send_json('tripster_api', {'count': len(found), 'next': next_url, 'previous': None, 'results': results})
+
+    return Handler
+
+
+def start_server(handler):
+    """
+    Запускает HTTP-сервер на свободном локальном порту в фоновом потоке.
+
+    Returns:
+        ThreadingHTTPServer: Запущенный сервер (адрес - server.server_address).
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,219 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dotenv import load_dotenv
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench.fake_servers import SyntheticSite, RequestStats, make_handler, start_server, WP_API_PATH, TRIPSTER_API_PATH
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Отдельная база MySQL для бенчмарка: ее таблицы очищаются перед каждым запуском
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "")
+
+# Таблицы, в которые пишет обход; очищаются перед запуском бенчмарка (кроме режима --warm)
+BENCH_TABLES = (
+    'wptq_tripster_links',
+    'wptq_tripster_post_fingerprints',
+    'wptq_tripster_run_journal',
+    'wptq_tripster_work_queue',
+    'wptq_tripster_runs',
+    'wptq_tripster_sites',
+)
+
+TARGETS = {
+    'pipeline': [sys.executable, '-m', 'scripts.link_pipeline'],
+    'main': [sys.executable, 'main.py'],
+}
+
+
+def prepare_database(truncate):
+    """
+    Создает таблицы в базе бенчмарка BENCH_DB_NAME (на сервере DB_HOST) и при необходимости очищает их.
+
+    Слой db работает только с MySQL (PyMySQL), поэтому бенчмарку нужна MySQL. Чтобы не очистить
+    рабочую базу DB_NAME, бенчмарк работает только с явно заданной базой BENCH_DB_NAME.
+
+    Args:
+        truncate (bool): Очистить таблицы обхода (BENCH_TABLES) перед запуском.
+
+    Returns:
+        bool: True, если база готова.
+    """
+    from db import db
+
+    if not BENCH_DB_NAME:
+        logging.error("Не задана база бенчмарка BENCH_DB_NAME: таблицы бенчмарка очищаются, поэтому рабочая база DB_NAME не используется.")
+        return False
+    if BENCH_DB_NAME == os.getenv("DB_NAME"):
+        logging.error(f"BENCH_DB_NAME совпадает с рабочей базой DB_NAME ({BENCH_DB_NAME}); укажите отдельную базу для бенчмарка.")
+        return False
+
+    # Процесс бенчмарка и процесс обхода подключаются к базе бенчмарка
+    os.environ['DB_NAME'] = BENCH_DB_NAME
+    connection = db.connect()
+    if connection is None:
+        logging.error("Не удалось подключиться к MySQL. Задайте DB_HOST, DB_USER, DB_PASSWORD и BENCH_DB_NAME локальной базы.")
+        return False
+    try:
+        db.execute_sql_file(connection, os.path.join(PROJECT_ROOT, 'db', 'sql', 'db_create_tables.sql'))
+        if truncate:
+            with connection.cursor() as cursor:
+                for table in BENCH_TABLES:
+                    cursor.execute(f"TRUNCATE TABLE `{table}`")
+        return True
+    finally:
+        connection.close()
+
+
+def run_target(target, env):
+    """
+    Запускает обход в отдельном процессе и измеряет время и пиковый объем памяти.
+
+    Кроме RSS самого процесса обхода возвращается RUSAGE_CHILDREN: наибольший RSS среди всех
+    завершенных дочерних процессов бенчмарка и их потомков (процессы разбора страниц, локальные
+    обработчики очереди). Это максимум с начала работы бенчмарка, а не только этого запуска.
+
+    Args:
+        target (str): 'pipeline' (scripts.link_pipeline) или 'main' (main.py с отчетом и уведомлением).
+        env (dict): Переменные окружения процесса.
+
+    Returns:
+        tuple: (код завершения, время в секундах, пиковый RSS процесса в МБ, пиковый RSS RUSAGE_CHILDREN в МБ).
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(TARGETS[target], cwd=PROJECT_ROOT, env=env)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss в Linux указывается в килобайтах
+    return process.returncode, elapsed, usage.ru_maxrss / 1024, children_usage.ru_maxrss / 1024
+
+
+def benchmark(posts, args):
+    """
+    Выполняет полный обход синтетического сайта из posts постов и возвращает результаты.
+
+    Args:
+        posts (int): Количество постов.
+        args (argparse.Namespace): Параметры бенчмарка.
+
+    Returns:
+        dict: Результаты запуска.
+    """
+    site = SyntheticSite(posts, "http://127.0.0.1", seed=args.seed, page_size=args.page_size)
+    wp_stats = RequestStats()
+    tripster_stats = RequestStats()
+    wp_server = start_server(make_handler(site, wp_stats, args.latency_ms / 1000, args.error_rate))
+    tripster_server = start_server(make_handler(site, tripster_stats, args.latency_ms / 1000, args.error_rate))
+    wp_host = "127.0.0.1:%d" % wp_server.server_address[1]
+    tripster_host = "127.0.0.1:%d" % tripster_server.server_address[1]
+    site.tripster_base_url = f"http://{tripster_host}"
+
+    work_dir = tempfile.mkdtemp(prefix=f"blink-bench-{posts}-")
+    env = dict(os.environ)
+    env.update({
+        'DB_NAME': BENCH_DB_NAME,
+        'PROJECT_ROOT': PROJECT_ROOT,
+        'DOMAIN_TO_CHECK': wp_host,
+        'API_SCHEME': 'http',
+        'API_PATH': WP_API_PATH,
+        'TRIPSTER_DOMAIN': tripster_host,
+        'TRIPSTER_API_URL': f"http://{tripster_host}{TRIPSTER_API_PATH}",
+        'INCREMENTAL_INDEXING': 'false',
+        'JSON_DIR': work_dir,
+        'CACHE_DIR': work_dir,
+        'METRICS_FILE': 'metrics.json',
+        'RETRY_DELAY': '0',
+    })
+
+    try:
+        if not args.skip_db_setup and not prepare_database(truncate=not args.warm):
+            return None
+
+        logging.info(f"Бенчмарк: {posts} постов, цель {args.target}, WordPress {wp_host}, Tripster {tripster_host}")
+        returncode, elapsed, peak_rss_mb, peak_rss_children_mb = run_target(args.target, env)
+    finally:
+        wp_server.shutdown()
+        tripster_server.shutdown()
+
+    try:
+        with open(os.path.join(work_dir, 'metrics.json'), 'r', encoding='utf-8') as f:
+            run_metrics = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        run_metrics = {'counters': {}}
+
+    counters = run_metrics['counters']
+    processed = counters.get('posts_processed_total', 0)
+    links = sum(value for name, value in counters.items() if name.startswith('links_checked_total'))
+    return {
+        'posts': posts,
+        'target': args.target,
+        'returncode': returncode,
+        'seconds': round(elapsed, 2),
+        'posts_processed': processed,
+        'links_checked': links,
+        'posts_per_second': round(processed / elapsed, 1) if elapsed else None,
+        'links_per_second': round(links / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'peak_rss_children_mb': round(peak_rss_children_mb, 1),
+        'wordpress': wp_stats.snapshot(),
+        'tripster': tripster_stats.snapshot(),
+        'metrics_file': os.path.join(work_dir, 'metrics.json'),
+    }
+
+
+def main():
+    """Разбирает аргументы командной строки и запускает бенчмарк для каждого размера сайта."""
+    if not BENCH_DB_NAME:
+        logging.error("Задайте отдельную базу MySQL для бенчмарка в BENCH_DB_NAME.")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description="Бенчмарк полного обхода на локальных серверах WordPress и Tripster.")
+    parser.add_argument('--sizes', default='1000', help="Размеры синтетических сайтов через запятую, например 1000,10000,100000.")
+    parser.add_argument('--target', choices=sorted(TARGETS), default='pipeline',
+                        help="pipeline - только обход (scripts.link_pipeline), main - полный запуск main.py с отчетом.")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Задержка каждого ответа серверов в миллисекундах.")
+    parser.add_argument('--error-rate', type=float, default=0, help="Доля запросов, на которые серверы отвечают 503.")
+    parser.add_argument('--page-size', type=int, default=60000, help="Размер страницы Tripster в байтах.")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора синтетического сайта.")
+    parser.add_argument('--warm', action='store_true', help="Не очищать таблицы перед запуском (повторный обход с сохраненными отпечатками).")
+    parser.add_argument('--skip-db-setup', action='store_true', help="Не создавать и не очищать таблицы.")
+    parser.add_argument('--output', help="Файл для сохранения результатов в JSON.")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',') if size.strip()):
+        result = benchmark(size, args)
+        if result is None:
+            sys.exit(1)
+        results.append(result)
+        logging.info(
+            f"{size} постов: {result['seconds']} с, {result['posts_per_second']} постов/с, "
+            f"{result['links_per_second']} ссылок/с, запросов WordPress {result['wordpress']['total_requests']}, "
+            f"Tripster {result['tripster']['total_requests']}, пиковый RSS {result['peak_rss_mb']} МБ, "
+            f"пиковый RSS дочерних процессов {result['peak_rss_children_mb']} МБ"
+        )
+
+    print(json.dumps(results, ensure_ascii=False, indent=4))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from core import metrics
+from core.status_cache import construct_cache_file_path
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_FILE = os.getenv("HTTP_CACHE_FILE", "http_cache.sqlite3")
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", 30 * 24 * 3600))
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", 200000))
+
+# Результат загрузки страницы, не изменившейся с прошлого запроса (ответ 304 Not Modified)
+NOT_MODIFIED = 'not-modified'
+
+_connection = None
+_lock = threading.RLock()
+
+
+def _get_connection():
+    """
+    Открывает (при первом обращении) SQLite-базу HTTP-кеша и удаляет устаревшие записи.
+
+    Returns:
+        sqlite3.Connection: Соединение с базой кеша, или None, если кеш отключен или недоступен.
+    """
+    global _connection
+    if _connection is not None or not HTTP_CACHE_ENABLED:
+        return _connection
+
+    try:
+        path = construct_cache_file_path(HTTP_CACHE_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache (
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                etag TEXT NULL,
+                last_modified TEXT NULL,
+                result TEXT NOT NULL,
+                validated_at REAL NOT NULL,
+                PRIMARY KEY (kind, url)
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_validated_at ON http_cache (validated_at)")
+        connection.commit()
+        _evict(connection)
+        _connection = connection
+    except Exception as e:
+        logging.error(f"Ошибка при открытии HTTP-кеша: {e}")
+        return None
+    return _connection
+
+
+def get_entries(kind, urls):
+    """
+    Возвращает сохраненные валидаторы и результаты обработки ответов.
+
+    Args:
+        kind (str): Вид ответов (например, 'tripster_page:1'); включает версию формата результата,
+            чтобы после ее изменения сохраненные результаты не использовались.
+        urls (iterable): URL запросов.
+
+    Returns:
+        dict: Словарь {url: {'etag', 'last_modified', 'result'}} для найденных в кеше URL.
+    """
+    urls = list(urls)
+    with _lock:
+        connection = _get_connection()
+        if connection is None or not urls:
+            return {}
+
+        entries = {}
+        try:
+            # SQLite ограничивает число параметров запроса, поэтому читаем частями
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT url, etag, last_modified, result FROM http_cache WHERE kind = ? AND url IN ({placeholders})",
+                    [kind] + chunk
+                )
+                for url, etag, last_modified, result in rows:
+                    entries[url] = {'etag': etag, 'last_modified': last_modified, 'result': json.loads(result)}
+        except (sqlite3.Error, ValueError) as e:
+            logging.error(f"Ошибка при чтении HTTP-кеша: {e}")
+            return {}
+    return entries
+
+
+def get_entry(kind, url):
+    """Возвращает сохраненную запись для одного URL или None (см. get_entries)."""
+    return get_entries(kind, [url]).get(url)
+
+
+def conditional_headers(entry):
+    """
+    Формирует заголовки условного запроса по сохраненной записи.
+
+    Args:
+        entry (dict): Запись get_entries или None.
+
+    Returns:
+        dict: Заголовки If-None-Match и If-Modified-Since (пустой словарь, если записи нет).
+    """
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def response_validators(headers):
+    """
+    Извлекает валидаторы из заголовков ответа.
+
+    Args:
+        headers (Mapping): Заголовки ответа (requests или aiohttp).
+
+    Returns:
+        tuple: (etag, last_modified) или None, если сервер не передал ни одного валидатора.
+    """
+    etag = headers.get('ETag')
+    last_modified = headers.get('Last-Modified')
+    if not etag and not last_modified:
+        return None
+    return etag, last_modified
+
+
+def put_entries(kind, entries):
+    """
+    Сохраняет валидаторы ответов вместе с результатами их обработки.
+
+    Args:
+        kind (str): Вид ответов (см. get_entries).
+        entries (dict): Словарь {url: ((etag, last_modified), result)}; result должен сериализоваться в JSON.
+    """
+    if not entries:
+        return
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return
+
+        now = time.time()
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO http_cache (kind, url, etag, last_modified, result, validated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(kind, url, etag, last_modified, json.dumps(result, ensure_ascii=False), now)
+                 for url, ((etag, last_modified), result) in entries.items()]
+            )
+            connection.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logging.error(f"Ошибка при записи в HTTP-кеш: {e}")
+
+
+def mark_not_modified(kind, urls):
+    """
+    Отмечает записи подтвержденными ответом 304, продлевая срок их жизни.
+
+    Args:
+        kind (str): Вид ответов (см. get_entries).
+        urls (iterable): URL, на которые сервер ответил 304 Not Modified.
+    """
+    urls = list(urls)
+    metrics.inc('cache_hits_total', len(urls), {'cache': 'http_cache'})
+    if not urls:
+        return
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return
+
+        now = time.time()
+        try:
+            connection.executemany(
+                "UPDATE http_cache SET validated_at = ? WHERE kind = ? AND url = ?",
+                [(now, kind, url) for url in urls]
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при записи в HTTP-кеш: {e}")
+
+
+def mark_modified(count=1):
+    """Учитывает в метриках ответы, полученные полностью вместо ответа 304."""
+    metrics.inc('cache_misses_total', count, {'cache': 'http_cache'})
+
+
+def evict():
+    """
+    Удаляет из кеша записи, не подтверждавшиеся дольше HTTP_CACHE_TTL, и самые старые записи сверх HTTP_CACHE_MAX_ENTRIES.
+    """
+    with _lock:
+        if _connection is not None:
+            _evict(_connection)
+
+
+def _evict(connection):
+    """Выполняет очистку кеша в переданном соединении."""
+    try:
+        connection.execute("DELETE FROM http_cache WHERE validated_at < ?", (time.time() - HTTP_CACHE_TTL,))
+        connection.execute(
+            "DELETE FROM http_cache WHERE rowid IN ("
+            "SELECT rowid FROM http_cache ORDER BY validated_at DESC LIMIT -1 OFFSET ?)",
+            (HTTP_CACHE_MAX_ENTRIES,)
+        )
+        connection.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Ошибка при очистке HTTP-кеша: {e}")
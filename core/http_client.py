@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from dotenv import load_dotenv
+from core import metrics
+from core import rate_limiter
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util import make_headers
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Константы
+USER_AGENT = os.getenv("USER_AGENT", 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 30))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 10))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+# gzip/deflate и br, если установлен пакет Brotli
+ACCEPT_ENCODING = make_headers(accept_encoding=True)['accept-encoding']
+
+DEFAULT_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Возвращает общую HTTP-сессию процесса.
+
+    Сессия хранит пулы keep-alive соединений для каждого хоста (до HTTP_POOL_HOSTS хостов,
+    до HTTP_POOL_SIZE соединений на хост) и заголовки по умолчанию.
+
+    Returns:
+        requests.Session: Общая сессия.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(DEFAULT_HEADERS)
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def get(url, **kwargs):
+    """
+    Выполняет GET-запрос через общую сессию.
+
+    Запросы к каждому хосту проходят через ограничитель rate_limiter. Ответы 429 и 503
+    повторяются до RATE_LIMIT_MAX_RETRIES раз с паузой из Retry-After; если хост продолжает
+    так отвечать, возвращается последний ответ. Если ограничение запросов отключено, паузу
+    перед повтором (Retry-After или RATE_LIMIT_BACKOFF) выдерживает сама функция.
+
+    Args:
+        url (str): URL запроса.
+        **kwargs: Аргументы requests.Session.get. Если timeout не указан, используется REQUEST_TIMEOUT.
+
+    Returns:
+        requests.Response: Ответ сервера.
+
+    Raises:
+        requests.exceptions.RequestException: При ошибке запроса.
+    """
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    labels = {'host': urlsplit(url).hostname}
+    for attempt in range(rate_limiter.RATE_LIMIT_MAX_RETRIES + 1):
+        with rate_limiter.limit(url) as result:
+            try:
+                response = get_session().get(url, **kwargs)
+            except requests.exceptions.RequestException:
+                metrics.inc('http_errors_total', labels=labels)
+                raise
+            retry_after = rate_limiter.parse_retry_after(response.headers.get('Retry-After'))
+            result(response.status_code, retry_after)
+        metrics.inc('http_requests_total', labels=labels)
+        metrics.inc('http_response_bytes_total', len(response.content), labels)
+        if response.status_code not in rate_limiter.THROTTLE_STATUSES or attempt == rate_limiter.RATE_LIMIT_MAX_RETRIES:
+            return response
+        metrics.inc('retries_total', labels={'operation': 'http_get'})
+        logging.warning(f"Ответ {response.status_code} от {labels['host']}, повтор запроса (попытка {attempt + 1}): {url}")
+        if rate_limiter.get_limiter(url) is None:
+            # Без ограничителя хоста повтор не задерживается, поэтому пауза выдерживается здесь
+            time.sleep(retry_after if retry_after is not None else rate_limiter.RATE_LIMIT_BACKOFF)
+    return response
+
+
+def is_rate_limited(error):
+    """Проверяет, вызвана ли ошибка запроса ответом 429 или 503."""
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code in rate_limiter.THROTTLE_STATUSES
+
+
+def close():
+    """Закрывает общую сессию и ее соединения."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,4 @@
+# Результат загрузки страницы, которую не удалось получить из-за ограничения запросов (429/503)
+RATE_LIMITED = 'rate-limited'
+# Статус ссылки, которую не удалось проверить из-за ограничения запросов: в БД сохраняется прежний статус
+UNCHECKED = 'unchecked'
@@ -0,0 +1,232 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.json")
+METRICS_PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "")
+METRICS_PREFIX = "blink_"
+
+# Верхние границы интервалов гистограмм длительности, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+# Время начала запуска задает start() при начале обхода (wp_api_utils.start_run)
+_started_at = None
+
+
+def start():
+    """
+    Отмечает начало запуска, от которого считается duration_seconds.
+
+    Повторные вызовы до reset() время начала не меняют: при обходе нескольких сайтов
+    длительность считается от начала первого из них.
+    """
+    global _started_at
+    with _lock:
+        if _started_at is None:
+            _started_at = time.time()
+
+
+def _key(name, labels):
+    """Возвращает ключ метрики: имя и отсортированные метки."""
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name, value=1, labels=None):
+    """
+    Увеличивает счетчик.
+
+    Args:
+        name (str): Имя счетчика (например, 'wp_listing_pages_total').
+        value (int): Величина увеличения.
+        labels (dict, optional): Метки, например {'host': 'tripster.ru'}.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, labels=None):
+    """
+    Добавляет значение длительности в гистограмму.
+
+    Args:
+        name (str): Имя гистограммы (например, 'db_upsert_seconds').
+        seconds (float): Длительность в секундах.
+        labels (dict, optional): Метки.
+    """
+    key = _key(name, labels)
+    index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+            _histograms[key] = histogram
+        histogram['count'] += 1
+        histogram['sum'] += seconds
+        histogram['max'] = max(histogram['max'], seconds)
+        histogram['buckets'][index] += 1
+
+
+@contextmanager
+def timer(name, labels=None):
+    """
+    Измеряет длительность блока кода и добавляет ее в гистограмму name.
+
+    Args:
+        name (str): Имя гистограммы.
+        labels (dict, optional): Метки.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, labels)
+
+
+def _quantile(histogram, q):
+    """Оценивает квантиль по интервалам гистограммы (верхняя граница интервала)."""
+    if not histogram['count']:
+        return None
+    rank = q * histogram['count']
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+        seen += count
+        if seen >= rank:
+            return bound
+    return histogram['max']
+
+
+def _format_name(name, labels):
+    """Форматирует имя метрики с метками для JSON-сводки: name{label="value"}."""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
+
+
+def snapshot():
+    """
+    Возвращает текущие значения метрик.
+
+    Returns:
+        dict: {'duration_seconds', 'counters': {...}, 'histograms': {...}}. Для гистограмм
+              приводятся count, sum, avg, max и оценки p50 и p95. duration_seconds равно None,
+              если начало запуска не отмечено (start).
+    """
+    with _lock:
+        started_at = _started_at
+        counters = {_format_name(name, labels): value for (name, labels), value in sorted(_counters.items())}
+        histograms = {}
+        for (name, labels), histogram in sorted(_histograms.items()):
+            histograms[_format_name(name, labels)] = {
+                'count': histogram['count'],
+                'sum': round(histogram['sum'], 6),
+                'avg': round(histogram['sum'] / histogram['count'], 6) if histogram['count'] else None,
+                'max': round(histogram['max'], 6),
+                'p50': _quantile(histogram, 0.5),
+                'p95': _quantile(histogram, 0.95),
+            }
+    return {
+        'duration_seconds': round(time.time() - started_at, 3) if started_at is not None else None,
+        'counters': counters,
+        'histograms': histograms,
+    }
+
+
+def _escape_label(value):
+    """Экранирует значение метки для текстового формата Prometheus."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _prometheus_labels(labels, extra=()):
+    """Форматирует метки для текстового формата Prometheus."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape_label(value)}"' for label, value in pairs) + '}'
+
+
+def to_prometheus():
+    """
+    Возвращает метрики в текстовом формате Prometheus (text exposition format 0.0.4).
+
+    Returns:
+        str: Текст метрик.
+    """
+    lines = []
+    with _lock:
+        typed = set()
+        for (name, labels), value in sorted(_counters.items()):
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(_histograms.items()):
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_prometheus_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric}_bucket{_prometheus_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{metric}_sum{_prometheus_labels(labels)} {histogram['sum']}")
+            lines.append(f"{metric}_count{_prometheus_labels(labels)} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def construct_metrics_file_path(filename):
+    """Строит полный путь к файлу метрик, учитывая директорию JSON_DIR."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.abspath(os.path.join(script_dir, '..'))
+    return os.path.join(project_root, os.getenv("JSON_DIR", "json"), filename)
+
+
+def dump():
+    """
+    Сохраняет сводку метрик запуска в JSON-файл METRICS_FILE и, если задан
+    METRICS_PROMETHEUS_FILE, в текстовом формате Prometheus.
+
+    Returns:
+        dict: Сводка метрик (результат snapshot).
+    """
+    summary = snapshot()
+    try:
+        filename = construct_metrics_file_path(METRICS_FILE)
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=4)
+        logging.info(f"Метрики запуска сохранены в файл: {filename}")
+
+        if METRICS_PROMETHEUS_FILE:
+            filename = construct_metrics_file_path(METRICS_PROMETHEUS_FILE)
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(to_prometheus())
+            logging.info(f"Метрики в формате Prometheus сохранены в файл: {filename}")
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении метрик: {e}")
+    return summary
+
+
+def reset():
+    """Сбрасывает все метрики; вызывается перед началом нового обхода в том же процессе."""
+    global _started_at
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started_at = None
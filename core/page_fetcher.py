@@ -0,0 +1,313 @@
+import asyncio
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+from dotenv import load_dotenv
+from core.http_client import DEFAULT_HEADERS, REQUEST_TIMEOUT
+from core import metrics
+from core import rate_limiter
+from core import http_cache
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Константы
+MAX_REQUESTS_PER_HOST = int(os.getenv("MAX_REQUESTS_PER_HOST", 4))
+READ_CHUNK_SIZE = 64 * 1024
+
+# Цикл событий загрузчика работает в отдельном потоке и общий для всего процесса: все вызовы fetch_pages
+# используют одну HTTP-сессию (keep-alive соединения с хостами) и общие семафоры хостов.
+_loop = None
+_loop_thread = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_session = None
+_semaphores = {}
+
+
+def _get_loop():
+    """
+    Возвращает цикл событий загрузчика, запуская его в фоновом потоке при первом обращении.
+
+    После fork поток цикла родительского процесса в дочернем не работает, поэтому дочерний
+    процесс запускает собственный цикл.
+
+    Returns:
+        asyncio.AbstractEventLoop: Цикл событий загрузчика.
+    """
+    global _loop, _loop_thread, _loop_pid, _session
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='page-fetcher', daemon=True)
+            _loop_thread.start()
+            _loop_pid = os.getpid()
+            _session = None
+            _semaphores.clear()
+        return _loop
+
+
+def _get_session():
+    """Возвращает HTTP-сессию загрузчика, создавая ее при первом обращении. Вызывается только в цикле загрузчика."""
+    global _session
+    if _session is None or _session.closed:
+        headers = dict(DEFAULT_HEADERS)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        # Число одновременных запросов к хосту ограничивают семафоры хостов (_get_semaphore)
+        connector = aiohttp.TCPConnector(limit=0)
+        _session = aiohttp.ClientSession(headers=headers, timeout=timeout, connector=connector)
+    return _session
+
+
+def _get_semaphore(url, max_per_host):
+    """
+    Возвращает семафор хоста URL. Вызывается только в цикле загрузчика.
+
+    Семафор общий для всех вызовов fetch_pages в процессе, поэтому max_per_host ограничивает число
+    одновременных запросов к хосту во всем процессе. Размер семафора задает первый запрос к хосту.
+    """
+    host = urlparse(url).netloc
+    semaphore = _semaphores.get(host)
+    if semaphore is None:
+        semaphore = _semaphores[host] = asyncio.Semaphore(max_per_host)
+    return semaphore
+
+
+async def _close_session():
+    """Закрывает HTTP-сессию загрузчика."""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def close():
+    """
+    Закрывает HTTP-сессию и останавливает цикл событий загрузчика.
+
+    Вызывается при завершении процесса (atexit). Следующий вызов fetch_pages снова запустит цикл.
+    """
+    global _loop, _loop_thread
+    with _loop_lock:
+        loop, thread = _loop, _loop_thread
+        if loop is None or _loop_pid != os.getpid():
+            return
+        _loop = _loop_thread = None
+    try:
+        asyncio.run_coroutine_threadsafe(_close_session(), loop).result(timeout=REQUEST_TIMEOUT)
+    except Exception as e:
+        logging.error(f"Ошибка при закрытии HTTP-сессии загрузчика страниц: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+atexit.register(close)
+
+
+def _is_dns_error(error):
+    """Проверяет, вызвана ли ошибка соединения невозможностью разрешить доменное имя."""
+    return isinstance(error, aiohttp.ClientConnectorError) and isinstance(error.os_error, socket.gaierror)
+
+
+async def _read_body(response, stop_when=None, max_bytes=None):
+    """
+    Читает тело ответа по частям, прекращая чтение досрочно.
+
+    Args:
+        response (aiohttp.ClientResponse): Ответ сервера.
+        stop_when (callable, optional): Функция, получающая прочитанное начало тела (bytes)
+            и возвращающая True, когда дальнейшее чтение не нужно.
+        max_bytes (int, optional): Максимальное количество читаемых байт.
+
+    Returns:
+        bytes: Тело ответа или его начало.
+    """
+    if stop_when is None and max_bytes is None:
+        return await response.read()
+
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+        body.extend(chunk)
+        if max_bytes is not None and len(body) >= max_bytes:
+            logging.info(f"    Достигнут лимит {max_bytes} байт, чтение остановлено: {response.url}")
+            del body[max_bytes:]
+            break
+        if stop_when is not None and stop_when(body):
+            break
+    return bytes(body)
+
+
+async def _fetch_page(session, url, semaphore, max_retries, retry_delay, stop_when=None, max_bytes=None,
+                      headers=None, validators=None):
+    """
+    Загружает одну страницу, ограничивая число одновременных запросов к хосту семафором.
+
+    Запросы также проходят через ограничитель хоста rate_limiter: ответы 429 и 503 снижают
+    скорость запросов к хосту и повторяются после паузы из Retry-After.
+
+    Args:
+        session (aiohttp.ClientSession): HTTP-сессия.
+        url (str): URL страницы.
+        semaphore (asyncio.Semaphore): Семафор хоста.
+        max_retries (int): Максимальное количество попыток.
+        retry_delay (int): Задержка между попытками в секундах.
+        stop_when (callable, optional): Условие досрочной остановки чтения (см. _read_body).
+        max_bytes (int, optional): Максимальное количество читаемых байт.
+        headers (dict, optional): Дополнительные заголовки запроса (например, условного, http_cache.conditional_headers).
+        validators (dict, optional): Словарь, в который записываются валидаторы ответа
+            {url: (etag, last_modified)} (http_cache.response_validators).
+
+    Returns:
+        bytes: Тело ответа (или его начало), http_cache.NOT_MODIFIED для ответа 304,
+               rate_limiter.RATE_LIMITED, если хост продолжал отвечать 429/503 после всех попыток,
+               или None в случае ошибки.
+    """
+    labels = {'host': urlparse(url).hostname}
+    limiter = rate_limiter.get_limiter(url)
+    status = None
+    for attempt in range(max_retries):
+        try:
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.acquire_async()
+                status = None
+                retry_after = None
+                try:
+                    started = time.perf_counter()
+                    async with session.get(url, headers=headers) as response:
+                        status = response.status
+                        if status in rate_limiter.THROTTLE_STATUSES:
+                            retry_after = rate_limiter.parse_retry_after(response.headers.get('Retry-After'))
+                        elif status == 304:
+                            body = http_cache.NOT_MODIFIED
+                        else:
+                            response.raise_for_status()
+                            body = await _read_body(response, stop_when, max_bytes)
+                            if validators is not None:
+                                response_validators = http_cache.response_validators(response.headers)
+                                if response_validators:
+                                    validators[url] = response_validators
+                finally:
+                    if limiter is not None:
+                        limiter.release(status, retry_after)
+
+            if status in rate_limiter.THROTTLE_STATUSES:
+                logging.warning(f"    Ответ {status}, повтор запроса (попытка {attempt + 1}/{max_retries}): {url}")
+                metrics.inc('retries_total', labels={'operation': 'page_fetch'})
+                if limiter is None:
+                    await asyncio.sleep(retry_after if retry_after is not None else retry_delay)
+                continue
+
+            metrics.observe('page_fetch_seconds', time.perf_counter() - started, labels)
+            metrics.inc('page_fetches_total', labels=labels)
+            if body is not http_cache.NOT_MODIFIED:
+                metrics.inc('http_response_bytes_total', len(body), labels)
+            return body
+
+        except aiohttp.ClientError as e:
+            # Ошибки DNS повторяем, остальные считаем окончательными
+            if _is_dns_error(e):
+                logging.error(f"    Ошибка при запросе URL: Не удалось разрешить доменное имя (попытка {attempt + 1}/{max_retries}): {url}")
+                metrics.inc('retries_total', labels={'operation': 'page_fetch'})
+                await asyncio.sleep(retry_delay)
+                continue
+
+            logging.error(f"    Ошибка при запросе URL {url}: {e}")
+            metrics.inc('page_fetch_errors_total', labels=labels)
+            return None
+
+        except asyncio.TimeoutError:
+            logging.error(f"    Превышено время ожидания ответа: {url}")
+            metrics.inc('page_fetch_errors_total', labels=labels)
+            return None
+
+        except Exception as e:
+            logging.error(f"    Ошибка при обработке URL {url}: {e}")
+            metrics.inc('page_fetch_errors_total', labels=labels)
+            return None
+
+    if status in rate_limiter.THROTTLE_STATUSES:
+        logging.error(f"    Хост продолжает ограничивать запросы, страница не проверена: {url}")
+        metrics.inc('page_fetch_errors_total', labels=labels)
+        return rate_limiter.RATE_LIMITED
+    return None  # Если все попытки неудачны
+
+
+async def _fetch_pages_async(urls, max_per_host=MAX_REQUESTS_PER_HOST, max_retries=3, retry_delay=2,
+                             stop_when=None, max_bytes=None, request_headers=None, validators=None):
+    """
+    Конкурентно загружает страницы в цикле событий загрузчика, ограничивая число одновременных
+    запросов к каждому хосту.
+
+    Args:
+        urls (iterable): URL страниц. Повторяющиеся URL загружаются один раз.
+        max_per_host (int): Максимальное число одновременных запросов к одному хосту.
+        max_retries (int): Максимальное количество попыток для каждой страницы.
+        retry_delay (int): Задержка между попытками в секундах.
+        stop_when (callable, optional): Условие досрочной остановки чтения страницы (см. _read_body).
+        max_bytes (int, optional): Максимальное количество байт, читаемых с одной страницы.
+        request_headers (dict, optional): Дополнительные заголовки запросов {url: dict}, например заголовки
+            условного запроса If-None-Match / If-Modified-Since. Страницы, на которые сервер ответит
+            304 Not Modified, получают результат http_cache.NOT_MODIFIED.
+        validators (dict, optional): Словарь, в который записываются валидаторы полученных страниц
+            {url: (etag, last_modified)}.
+
+    Returns:
+        dict: Словарь {url: bytes, http_cache.NOT_MODIFIED, rate_limiter.RATE_LIMITED или None}.
+    """
+    unique_urls = list(dict.fromkeys(url for url in urls if url))
+    if not unique_urls:
+        return {}
+
+    session = _get_session()
+    tasks = []
+    for url in unique_urls:
+        semaphore = _get_semaphore(url, max_per_host)
+        page_headers = (request_headers or {}).get(url)
+        tasks.append(_fetch_page(session, url, semaphore, max_retries, retry_delay, stop_when, max_bytes,
+                                 page_headers, validators))
+    results = await asyncio.gather(*tasks)
+
+    return dict(zip(unique_urls, results))
+
+
+def fetch_pages(urls, max_per_host=MAX_REQUESTS_PER_HOST, max_retries=3, retry_delay=2,
+                stop_when=None, max_bytes=None, request_headers=None, validators=None):
+    """
+    Загружает страницы в цикле событий загрузчика и ожидает результат в текущем потоке.
+
+    Цикл событий и HTTP-сессия общие для процесса и запускаются при первом вызове, поэтому соединения
+    с хостами переиспользуются между вызовами, а max_per_host ограничивает число одновременных
+    запросов к хосту во всем процессе. Функцию можно вызывать из любого потока, кроме потока
+    цикла загрузчика.
+
+    Args:
+        urls (iterable): URL страниц.
+        max_per_host (int): Максимальное число одновременных запросов к одному хосту.
+        max_retries (int): Максимальное количество попыток для каждой страницы.
+        retry_delay (int): Задержка между попытками в секундах.
+        stop_when (callable, optional): Условие досрочной остановки чтения страницы (см. _read_body).
+        max_bytes (int, optional): Максимальное количество байт, читаемых с одной страницы.
+        request_headers (dict, optional): Дополнительные заголовки запросов {url: dict} (см. _fetch_pages_async).
+        validators (dict, optional): Словарь для валидаторов полученных страниц (см. _fetch_pages_async).
+
+    Returns:
+        dict: Словарь {url: bytes, http_cache.NOT_MODIFIED, rate_limiter.RATE_LIMITED или None}.
+    """
+    coroutine = _fetch_pages_async(urls, max_per_host, max_retries, retry_delay, stop_when, max_bytes,
+                                   request_headers, validators)
+    loop = _get_loop()
+    if threading.current_thread() is _loop_thread:
+        coroutine.close()
+        raise RuntimeError("fetch_pages нельзя вызывать из цикла событий загрузчика страниц")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
@@ -0,0 +1,120 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _parse_workers(value):
+    """Преобразует значение PARSE_WORKERS в количество процессов: 'auto' - по числу ядер, 0 - без пула."""
+    if str(value).strip().lower() == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logging.warning(f"Некорректное значение PARSE_WORKERS: {value}, разбор выполняется без пула процессов.")
+        return 0
+
+
+PARSE_WORKERS = _parse_workers(os.getenv("PARSE_WORKERS", 0))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def is_enabled():
+    """Проверяет, выполняется ли разбор HTML в пуле процессов."""
+    return PARSE_WORKERS > 0
+
+
+def get_executor():
+    """
+    Возвращает общий пул процессов разбора HTML, создавая его при первом обращении.
+
+    Процессы запускаются методом spawn: пул создается из рабочих потоков конвейера,
+    а fork многопоточного процесса может унаследовать захваченные блокировки.
+
+    Returns:
+        ProcessPoolExecutor: Пул процессов, или None, если пул отключен.
+    """
+    global _executor
+    if not is_enabled():
+        return None
+    with _lock:
+        if _executor is None:
+            logging.info(f"Запуск пула разбора HTML: {PARSE_WORKERS} процессов.")
+            _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _discard_broken_pool(executor, error):
+    """Убирает пул, процесс которого аварийно завершился; следующий вызов создаст новый пул."""
+    global _executor
+    logging.error(f"Пул разбора HTML недоступен, разбор выполняется в текущем процессе: {error}")
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def run(func, *args):
+    """
+    Выполняет функцию разбора в пуле процессов или, если пул отключен, в текущем процессе.
+
+    Функция и ее результат передаются между процессами, поэтому функция должна быть
+    определена на уровне модуля и возвращать простые значения (словари, списки, строки), а не объекты BeautifulSoup.
+
+    Args:
+        func (callable): Функция разбора.
+        *args: Аргументы функции.
+
+    Returns:
+        Результат функции.
+    """
+    executor = get_executor()
+    if executor is None:
+        return func(*args)
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool as e:
+        _discard_broken_pool(executor, e)
+        return func(*args)
+
+
+def map_items(func, items):
+    """
+    Применяет функцию разбора к каждому элементу, распределяя элементы по процессам пула.
+
+    Args:
+        func (callable): Функция разбора одного элемента.
+        items (list): Элементы.
+
+    Returns:
+        list: Результаты в порядке элементов.
+    """
+    items = list(items)
+    executor = get_executor()
+    if executor is None or len(items) < 2:
+        return [func(item) for item in items]
+    try:
+        return list(executor.map(func, items))
+    except BrokenProcessPool as e:
+        _discard_broken_pool(executor, e)
+        return [func(item) for item in items]
+
+
+def shutdown():
+    """Останавливает пул процессов разбора HTML."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from core import metrics
+from core.link_status import RATE_LIMITED, UNCHECKED  # Результат загрузки и статус ссылки при ограничении запросов
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", 5))
+RATE_LIMIT_MIN_RPS = float(os.getenv("RATE_LIMIT_MIN_RPS", 0.5))
+RATE_LIMIT_MAX_RPS = float(os.getenv("RATE_LIMIT_MAX_RPS", 50))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 5))
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", 16))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", 3))
+RATE_LIMIT_MAX_RETRY_AFTER = float(os.getenv("RATE_LIMIT_MAX_RETRY_AFTER", 120))
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", 1))
+
+# Ответы, означающие перегрузку хоста: запрос повторяется, а скорость снижается
+THROTTLE_STATUSES = (429, 503)
+# Множитель снижения скорости и числа одновременных запросов при перегрузке (AIMD)
+DECREASE_FACTOR = 0.5
+# Интервал проверки освобождения места для запроса, в секундах
+POLL_INTERVAL = 0.05
+
+
+def parse_retry_after(value):
+    """
+    Разбирает заголовок Retry-After.
+
+    Args:
+        value (str): Значение заголовка: число секунд или дата HTTP.
+
+    Returns:
+        float: Пауза в секундах (не больше RATE_LIMIT_MAX_RETRY_AFTER) или None, если заголовок не задан или некорректен.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RATE_LIMIT_MAX_RETRY_AFTER)
+
+
+class HostLimiter:
+    """
+    Ограничитель запросов к одному хосту: token bucket и AIMD-управление числом одновременных запросов.
+
+    Пока ответы успешны, скорость (rate, запросов в секунду) и допустимое число одновременных
+    запросов (concurrency) растут аддитивно. Ответы 429/503 уменьшают их вдвое, а новые запросы
+    к хосту приостанавливаются на время из Retry-After. Ограничитель потокобезопасен и может
+    одновременно использоваться из потоков и из циклов событий asyncio.
+    """
+
+    def __init__(self, host, rate=RATE_LIMIT_RPS, concurrency=RATE_LIMIT_MAX_CONCURRENCY):
+        self.host = host
+        self.rate = rate
+        self.concurrency = float(concurrency)
+        self.tokens = min(RATE_LIMIT_BURST, max(1.0, rate))
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """Пополняет корзину токенов за прошедшее время."""
+        self.tokens = min(RATE_LIMIT_BURST, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        Пытается занять место для запроса.
+
+        Returns:
+            float: 0, если запрос можно выполнять, иначе время ожидания в секундах до следующей попытки.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= max(1, int(self.concurrency)):
+                return POLL_INTERVAL
+            self._refill(now)
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        """Ожидает места для запроса в текущем потоке."""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                break
+            time.sleep(delay)
+            waited += delay
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, {'host': self.host})
+
+    async def acquire_async(self):
+        """Ожидает места для запроса, не блокируя цикл событий."""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, {'host': self.host})
+
+    def release(self, status=None, retry_after=None):
+        """
+        Освобождает место запроса и корректирует скорость по результату.
+
+        Args:
+            status (int, optional): HTTP-статус ответа; None - запрос завершился ошибкой соединения.
+            retry_after (float, optional): Пауза из заголовка Retry-After в секундах.
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if status in THROTTLE_STATUSES:
+                self.rate = max(RATE_LIMIT_MIN_RPS, self.rate * DECREASE_FACTOR)
+                self.concurrency = max(1.0, self.concurrency * DECREASE_FACTOR)
+                pause = retry_after if retry_after is not None else RATE_LIMIT_BACKOFF
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+                self.tokens = 0.0
+                throttled = True
+            else:
+                throttled = False
+                if status is not None and status < 500:
+                    # Аддитивное увеличение: примерно +1 запрос в секунду и +1 одновременный запрос за окно
+                    self.rate = min(RATE_LIMIT_MAX_RPS, self.rate + 1 / max(1.0, self.rate))
+                    self.concurrency = min(RATE_LIMIT_MAX_CONCURRENCY, self.concurrency + 1 / max(1.0, self.concurrency))
+
+        if throttled:
+            metrics.inc('rate_limited_total', labels={'host': self.host, 'status': str(status)})
+            logging.warning(
+                f"Хост {self.host} ответил {status}: скорость снижена до {self.rate:.2f} запросов/с, "
+                f"одновременных запросов {int(self.concurrency)}, пауза {pause:.1f} с."
+            )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(url):
+    """
+    Возвращает ограничитель хоста URL, создавая его при первом обращении.
+
+    Args:
+        url (str): URL запроса.
+
+    Returns:
+        HostLimiter: Ограничитель хоста или None, если ограничение запросов отключено.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter(host)
+        return limiter
+
+
+@contextmanager
+def limit(url):
+    """
+    Ожидает места для запроса к хосту URL и освобождает его после выхода из блока.
+
+    Внутри блока результат запроса передается через result(status, retry_after);
+    если он не передан (ошибка соединения), скорость не изменяется.
+
+    Args:
+        url (str): URL запроса.
+
+    Yields:
+        callable: Функция result(status, retry_after=None).
+    """
+    limiter = get_limiter(url)
+    outcome = {}
+
+    def result(status, retry_after=None):
+        outcome.update(status=status, retry_after=retry_after)
+
+    if limiter is None:
+        yield result
+        return
+    limiter.acquire()
+    try:
+        yield result
+    finally:
+        limiter.release(outcome.get('status'), outcome.get('retry_after'))
+
+
+def reset():
+    """Сбрасывает накопленные ограничения всех хостов."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,119 @@
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit
+from core import metrics
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+_instances = weakref.WeakSet()
+
+
+def normalize_url(url):
+    """
+    Приводит URL к виду, по которому одинаковые страницы совпадают.
+
+    Схема и хост приводятся к нижнему регистру, порт по умолчанию и фрагмент отбрасываются.
+
+    Args:
+        url (str): URL.
+
+    Returns:
+        str: Нормализованный URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+class RunMemo:
+    """
+    Потокобезопасная мемоизация результатов в рамках одного запуска.
+
+    Каждый ключ вычисляется не больше одного раза: если ключ уже вычисляется в другом
+    потоке, вызывающий поток дожидается этого результата вместо повторного запроса.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _instances.add(self)
+
+    def get_many(self, keys, compute_many, is_cacheable=None):
+        """
+        Возвращает значения для ключей, вычисляя только отсутствующие.
+
+        Args:
+            keys (iterable): Ключи.
+            compute_many (callable): Функция, получающая список невычисленных ключей
+                и возвращающая словарь {ключ: значение}.
+            is_cacheable (callable, optional): Функция, получающая значение и возвращающая False,
+                если его не нужно запоминать (например, ошибка запроса). Такое значение получат
+                только уже ожидающие его потоки.
+
+        Returns:
+            dict: Словарь {ключ: значение}.
+        """
+        keys = list(dict.fromkeys(keys))
+        futures = {}
+        owned = []
+        with self._lock:
+            for key in keys:
+                future = self._futures.get(key)
+                if future is None:
+                    future = Future()
+                    self._futures[key] = future
+                    owned.append(key)
+                futures[key] = future
+            self.misses += len(owned)
+            self.hits += len(keys) - len(owned)
+        metrics.inc('cache_hits_total', len(keys) - len(owned), {'cache': self.name})
+        metrics.inc('cache_misses_total', len(owned), {'cache': self.name})
+
+        if owned:
+            try:
+                values = compute_many(owned)
+            except BaseException as e:
+                with self._lock:
+                    for key in owned:
+                        self._futures.pop(key, None)
+                for key in owned:
+                    futures[key].set_exception(e)
+                raise
+
+            if is_cacheable is not None:
+                with self._lock:
+                    for key in owned:
+                        if not is_cacheable(values.get(key)):
+                            self._futures.pop(key, None)
+
+            for key in owned:
+                futures[key].set_result(values.get(key))
+
+        return {key: futures[key].result() for key in keys}
+
+    def clear(self):
+        """Удаляет все запомненные значения."""
+        with self._lock:
+            if self._futures:
+                logging.info(f"Кеш запуска '{self.name}': {self.hits} повторных обращений, {self.misses} вычислений.")
+            self._futures = {}
+            self.hits = 0
+            self.misses = 0
+
+
+def reset_all():
+    """Очищает все кеши запуска; вызывается перед началом нового обхода в том же процессе."""
+    for memo in list(_instances):
+        memo.clear()
@@ -0,0 +1,164 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from core import metrics
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+STATUS_CACHE_FILE = os.getenv("STATUS_CACHE_FILE", "status_cache.sqlite3")
+STATUS_CACHE_TTL_ACTIVE = int(os.getenv("STATUS_CACHE_TTL_ACTIVE", 7 * 24 * 3600))
+STATUS_CACHE_TTL_INACTIVE = int(os.getenv("STATUS_CACHE_TTL_INACTIVE", 24 * 3600))
+STATUS_CACHE_MAX_ENTRIES = int(os.getenv("STATUS_CACHE_MAX_ENTRIES", 200000))
+
+# Кеш хранится в локальном файле SQLite и не разделяется между хостами: в распределенном режиме
+# (DISTRIBUTED_SWEEP) обработчик на другом хосте начинает с пустым кешем и заполняет свой файл сам.
+_connection = None
+_lock = threading.RLock()
+
+
+def construct_cache_file_path(filename):
+    """Строит полный путь к файлу кеша, учитывая директорию CACHE_DIR."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.abspath(os.path.join(script_dir, '..'))
+    return os.path.join(project_root, CACHE_DIR, filename)
+
+
+def _get_connection():
+    """
+    Открывает (при первом обращении) SQLite-базу кеша статусов и удаляет устаревшие записи.
+
+    Returns:
+        sqlite3.Connection: Соединение с базой кеша, или None, если кеш недоступен.
+    """
+    global _connection
+    if _connection is not None:
+        return _connection
+
+    try:
+        path = construct_cache_file_path(STATUS_CACHE_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS experience_status (
+                experience_id INTEGER PRIMARY KEY,
+                is_active INTEGER NOT NULL,
+                reason TEXT NULL,
+                title TEXT NULL,
+                checked_at REAL NOT NULL
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_checked_at ON experience_status (checked_at)")
+        connection.commit()
+        _evict(connection)
+        _connection = connection
+    except Exception as e:
+        logging.error(f"Ошибка при открытии кеша статусов: {e}")
+        return None
+    return _connection
+
+
+def _ttl(is_active):
+    """Возвращает срок жизни записи в секундах в зависимости от статуса экскурсии."""
+    return STATUS_CACHE_TTL_ACTIVE if is_active else STATUS_CACHE_TTL_INACTIVE
+
+
+def get_statuses(experience_ids):
+    """
+    Возвращает непросроченные статусы экскурсий из кеша.
+
+    Args:
+        experience_ids (iterable): ID экскурсий.
+
+    Returns:
+        dict: Словарь {experience_id: (is_active, reason, title)} для найденных в кеше ID.
+    """
+    ids = list(experience_ids)
+    with _lock:
+        connection = _get_connection()
+        if connection is None or not ids:
+            return {}
+
+        now = time.time()
+        statuses = {}
+        try:
+            # SQLite ограничивает число параметров запроса, поэтому читаем частями
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT experience_id, is_active, reason, title, checked_at FROM experience_status WHERE experience_id IN ({placeholders})",
+                    [int(experience_id) for experience_id in chunk]
+                )
+                for experience_id, is_active, reason, title, checked_at in rows:
+                    if now - checked_at < _ttl(bool(is_active)):
+                        statuses[experience_id] = (bool(is_active), reason, title)
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при чтении кеша статусов: {e}")
+            return {}
+
+    # Возвращаем результат с ключами в том виде, в котором они были переданы
+    found = {experience_id: statuses[int(experience_id)] for experience_id in ids if int(experience_id) in statuses}
+    metrics.inc('cache_hits_total', len(found), {'cache': 'status_cache'})
+    metrics.inc('cache_misses_total', len(ids) - len(found), {'cache': 'status_cache'})
+    return found
+
+
+def put_statuses(statuses):
+    """
+    Сохраняет статусы экскурсий в кеш.
+
+    Args:
+        statuses (dict): Словарь {experience_id: (is_active, reason, title)}.
+    """
+    if not statuses:
+        return
+    with _lock:
+        connection = _get_connection()
+        if connection is None:
+            return
+
+        now = time.time()
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO experience_status (experience_id, is_active, reason, title, checked_at) VALUES (?, ?, ?, ?, ?)",
+                [(int(experience_id), int(bool(is_active)), reason, title, now)
+                 for experience_id, (is_active, reason, title) in statuses.items()]
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при записи в кеш статусов: {e}")
+
+
+def evict():
+    """
+    Удаляет из кеша просроченные записи и самые старые записи сверх STATUS_CACHE_MAX_ENTRIES.
+    """
+    with _lock:
+        if _connection is not None:
+            _evict(_connection)
+
+
+def _evict(connection):
+    """Выполняет очистку кеша в переданном соединении."""
+    now = time.time()
+    try:
+        connection.execute(
+            "DELETE FROM experience_status WHERE (is_active = 1 AND checked_at < ?) OR (is_active = 0 AND checked_at < ?)",
+            (now - STATUS_CACHE_TTL_ACTIVE, now - STATUS_CACHE_TTL_INACTIVE)
+        )
+        connection.execute(
+            "DELETE FROM experience_status WHERE experience_id IN ("
+            "SELECT experience_id FROM experience_status ORDER BY checked_at DESC LIMIT -1 OFFSET ?)",
+            (STATUS_CACHE_MAX_ENTRIES,)
+        )
+        connection.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Ошибка при очистке кеша статусов: {e}")
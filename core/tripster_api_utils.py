@@ -2,7 +2,10 @@ import requests
 import logging
 import os
 from dotenv import load_dotenv
-from functools import lru_cache
+from core import status_cache
+from core.run_memo import RunMemo
+from core import http_client
+from core import metrics
 
 load_dotenv()
 
@@ -16,7 +19,150 @@ logging.basicConfig(
 TRIPSTER_API_URL = os.getenv("TRIPSTER_API_URL", "https://experience.tripster.ru/api/partners/travelpayouts/search/experiences/")
 
 
-@lru_cache(maxsize=128)
+TRIPSTER_API_CHUNK_SIZE = int(os.getenv("TRIPSTER_API_CHUNK_SIZE", 100))
+RATE_LIMITED_REASON = "Не проверено: API Tripster ограничивает запросы"
+
+# Результаты проверки статусов в рамках запуска: {deeplink_id: (is_active, reason, title)}
+_status_memo = RunMemo('tripster_statuses')
+
+
+def chunked(items, size):
+    """Разбивает список на части длиной не более size."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def fetch_experiences_by_ids(api_url, ids, paused=False):
+    """
+    Запрашивает экскурсии по списку ID одним запросом к API Tripster с учетом пагинации ответа.
+
+    Args:
+        api_url (str): URL API Tripster.
+        ids (list): Список ID экскурсий.
+        paused (bool): Искать среди неактивных экскурсий (параметр paused=true).
+
+    Returns:
+        dict: Словарь {id (int): данные экскурсии}.
+
+    Raises:
+        requests.exceptions.RequestException: При ошибке запроса.
+    """
+    params = {"ids": ",".join(str(i) for i in ids)}
+    if paused:
+        params["paused"] = True
+
+    experiences = {}
+    url = api_url
+    while url:
+        with metrics.timer('tripster_api_request_seconds', {'paused': str(paused).lower()}):
+            response = http_client.get(url, params=params)
+        metrics.inc('tripster_api_requests_total', labels={'paused': str(paused).lower()})
+        response.raise_for_status()
+        data = response.json()
+
+        for experience in data.get("results") or []:
+            experiences[int(experience["id"])] = experience
+
+        # Ссылка на следующую страницу уже содержит параметры запроса
+        url = data.get("next")
+        params = None
+    return experiences
+
+
+def check_deeplink_statuses_api(deeplink_ids, chunk_size=TRIPSTER_API_CHUNK_SIZE):
+    """
+    Проверяет статусы набора диплинков через API Tripster пакетными запросами.
+
+    ID разбиваются на части по chunk_size. Для каждой части выполняется один запрос
+    активных экскурсий и, если в части есть неактивные или ненайденные экскурсии,
+    один запрос с параметром paused=true, из которого берутся их названия.
+
+    Каждый ID проверяется не больше одного раза за запуск: повторные и одновременные
+    запросы того же ID из других постов получают уже найденный результат.
+
+    Args:
+        deeplink_ids (iterable): ID диплинков.
+        chunk_size (int): Максимальное количество ID в одном запросе.
+
+    Returns:
+        dict: Словарь {deeplink_id: (is_active, reason, title)} в формате check_deeplink_status_api.
+              is_active равен None, если API ограничивает запросы (429/503) и статус не проверен.
+    """
+    return _status_memo.get_many(
+        deeplink_ids,
+        lambda pending: _resolve_statuses(pending, chunk_size),
+        is_cacheable=lambda status: status is not None and status[0] is not None and not is_api_error(status)
+    )
+
+
+def is_api_error(status):
+    """Проверяет, является ли результат проверки статуса ошибкой запроса к API."""
+    is_active, reason, title = status
+    return not is_active and title is None and bool(reason) and reason.startswith(("Ошибка API", "Ошибка обработки API"))
+
+
+def _resolve_statuses(deeplink_ids, chunk_size):
+    """
+    Получает статусы диплинков из persistent-кеша, а отсутствующие в нем - из API Tripster.
+
+    Args:
+        deeplink_ids (list): ID диплинков.
+        chunk_size (int): Максимальное количество ID в одном запросе.
+
+    Returns:
+        dict: Словарь {deeplink_id: (is_active, reason, title)}.
+    """
+    api_url = TRIPSTER_API_URL
+
+    # Статусы, проверенные в предыдущих запусках и еще не устаревшие
+    results = status_cache.get_statuses(deeplink_ids)
+    pending = [deeplink_id for deeplink_id in deeplink_ids if deeplink_id not in results]
+
+    for chunk in chunked(pending, chunk_size):
+        try:
+            # 1. Проверяем, какие экскурсии существуют как активные (без параметра paused)
+            found = fetch_experiences_by_ids(api_url, chunk)
+
+            chunk_results = {}
+            for deeplink_id in chunk:
+                experience = found.get(int(deeplink_id))
+                if experience:
+                    # Экскурсия существует, reason пока нет
+                    chunk_results[deeplink_id] = (experience["status"] == "active", None, experience["title"])
+                else:
+                    # Экскурсия не найдена как активная
+                    chunk_results[deeplink_id] = (False, "Экскурсия не найдена в API", "Экскурсия не найдена")
+
+            # 2. Для неактивных и ненайденных экскурсий берем названия из запроса с paused=true
+            not_active = [deeplink_id for deeplink_id, (is_active, _, _) in chunk_results.items() if not is_active]
+            if not_active:
+                paused = fetch_experiences_by_ids(api_url, not_active, paused=True)
+                for deeplink_id in not_active:
+                    experience = paused.get(int(deeplink_id))
+                    if experience:
+                        is_active, reason, _ = chunk_results[deeplink_id]
+                        chunk_results[deeplink_id] = (is_active, reason, experience["title"])
+
+            status_cache.put_statuses(chunk_results)
+            results.update(chunk_results)
+
+        except requests.exceptions.RequestException as e:
+            metrics.inc('tripster_api_errors_total')
+            if http_client.is_rate_limited(e):
+                # Перегрузка API не означает, что экскурсии неактивны: статус остается непроверенным
+                logging.warning(f"API Tripster ограничивает запросы, статусы {len(chunk)} экскурсий не проверены: {e}")
+                results.update({deeplink_id: (None, RATE_LIMITED_REASON, None) for deeplink_id in chunk})
+                continue
+            logging.error(f"Ошибка при запросе к API: {e}")
+            results.update({deeplink_id: (False, f"Ошибка API: {e}", None) for deeplink_id in chunk})
+        except Exception as e:
+            metrics.inc('tripster_api_errors_total')
+            logging.error(f"Ошибка при обработке ответа API: {e}")
+            results.update({deeplink_id: (False, f"Ошибка обработки API: {e}", None) for deeplink_id in chunk})
+
+    return results
+
+
 def check_deeplink_status_api(deeplink_id):
     """
     Проверяет статус диплинка через API Tripster, делая один или два запроса:
@@ -28,66 +174,8 @@ def check_deeplink_status_api(deeplink_id):
 
     Returns:
         tuple: (is_active, reason, title)
-               is_active (bool): True, если экскурсия активна, False - если неактивна.
+               is_active (bool): True, если экскурсия активна, False - если неактивна, None - если статус не проверен.
                reason (str): Причина неактивности (если известна), иначе None.
                title (str): Название экскурсии.
     """
-    api_url = TRIPSTER_API_URL
-
-    try:
-        # 1. Проверяем, существует ли экскурсия как активная (без параметра paused)
-        params_exists = {
-            "ids": deeplink_id,
-        }
-        url_exists = f"{api_url}?ids={deeplink_id}"
-
-        response_exists = requests.get(api_url, params=params_exists)
-        response_exists.raise_for_status()
-        data_exists = response_exists.json()
-
-        if data_exists["count"] > 0 and data_exists["results"]:
-            # Экскурсия существует!
-            experience = data_exists["results"][0]
-            title = experience["title"]  # Получаем название
-            is_active = experience["status"] == "active"  # Определяем, активна ли экскурсия
-
-            if is_active:
-                # Экскурсия активна, нет смысла проверять дальше
-                reason = None
-                return is_active, reason, title
-            else:
-                # Экскурсия существует, но не активна, reason тоже пока нет
-                reason = None
-
-        else:
-            # Экскурсия не найдена как активная
-            title = "Экскурсия не найдена"
-            is_active = False
-            reason = "Экскурсия не найдена в API"
-
-        # Если дошли до этого места, значит, экскурсия либо не найдена, либо она неактивна
-        # Проверяем, существует ли экскурсия как неактивная (с параметром paused=true)
-        params_paused = {
-            "ids": deeplink_id,
-            "paused": True
-        }
-
-        url_paused = f"{api_url}?ids={deeplink_id}&paused=true"
-
-        response_paused = requests.get(api_url, params=params_paused)
-        response_paused.raise_for_status()
-        data_paused = response_paused.json()
-
-        if data_paused["count"] > 0 and data_paused["results"]:
-            # Экскурсия найдена как неактивная, значит берем title отсюда
-            experience = data_paused["results"][0]
-            title = experience["title"]
-
-        return is_active, reason, title  # Возвращаем результат
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Ошибка при запросе к API: {e}")
-        return False, f"Ошибка API: {e}", None
-    except Exception as e:
-        logging.error(f"Ошибка при обработке ответа API: {e}")
-        return False, f"Ошибка обработки API: {e}", None
\ No newline at end of file
+    return check_deeplink_statuses_api([deeplink_id])[deeplink_id]
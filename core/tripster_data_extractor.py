@@ -1,14 +1,18 @@
-import requests
-from bs4 import BeautifulSoup
-import socket
-import random
-import time
+from bs4 import BeautifulSoup, FeatureNotFound, Tag
+import hashlib
+import html
 import re
 from urllib.parse import urlparse, parse_qs
 import logging
 import os
 from dotenv import load_dotenv
-from core.tripster_api_utils import check_deeplink_status_api  # Добавлен импорт
+from core.tripster_api_utils import check_deeplink_statuses_api
+from core.page_fetcher import fetch_pages
+from core.run_memo import RunMemo, normalize_url
+from core import metrics
+from core import parse_pool
+from core import rate_limiter
+from core import http_cache
 
 load_dotenv()
 
@@ -17,7 +21,6 @@ DEFAULT_LOG_LEVEL = logging.INFO
 logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Константы
-USER_AGENT = os.getenv("USER_AGENT", 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
 PAGE_EXPERIENCE_CLASS = 'page-experience'
 PAGE_SPUTNIK_CLASS = 'sputnik-hr'
 PAGE_EXPERIENCE_WRAP_CLASS = 'page-experience__wrap'
@@ -28,6 +31,121 @@ DESTINATION_CLASS = 'destination'
 AUTHOR_PAGE_CLASS = 'author_page'
 WELCOME_TOP_CLASS = 'welcome-top'
 TRIPSTER_WIDGET_CLASS = 'tripster-widget'
+EXPCARD_TITLE_CLASS = 'expcard__title expcard__title__link'
+# Парсеры BeautifulSoup для страниц Tripster и для контента постов. Если парсер не установлен,
+# используется встроенный html.parser. Контент постов по умолчанию разбирается html.parser:
+# lxml иначе восстанавливает вложенность некорректной разметки (например, <p><div>...</p>),
+# из-за чего ссылка может оказаться внутри или вне виджета.
+PAGE_HTML_PARSER = os.getenv("PAGE_HTML_PARSER", "lxml")
+POST_HTML_PARSER = os.getenv("POST_HTML_PARSER", "html.parser")
+FALLBACK_HTML_PARSER = 'html.parser'
+# Максимальный размер загружаемой части страницы Tripster
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", 2 * 1024 * 1024))
+# Результаты разбора страниц Tripster в рамках запуска: {ключ страницы: результат summarize_page}
+_page_memo = RunMemo('tripster_pages')
+
+# Результат summarize_page для страницы, не полученной из-за ограничения запросов
+RATE_LIMITED_SUMMARY = {'rate_limited': True}
+
+# Версия формата результатов summarize_page; при ее изменении результаты разбора страниц в HTTP-кеше не используются
+SUMMARY_VERSION = 1
+PAGE_CACHE_KIND = f"tripster_page:{SUMMARY_VERSION}"
+
+# Версия формата результатов parse_*_candidates; при ее изменении сохраненные отпечатки постов устаревают
+EXTRACTION_VERSION = 1
+
+
+_unavailable_parsers = set()
+
+
+def make_soup(markup, parser=POST_HTML_PARSER):
+    """
+    Строит дерево BeautifulSoup указанным парсером, а если он недоступен - парсером html.parser.
+
+    Args:
+        markup (str | bytes): HTML-разметка.
+        parser (str, optional): Имя парсера BeautifulSoup. Defaults to POST_HTML_PARSER.
+
+    Returns:
+        BeautifulSoup object: Объект BeautifulSoup с распарсенным HTML.
+    """
+    if parser not in _unavailable_parsers:
+        try:
+            return BeautifulSoup(markup, parser)
+        except FeatureNotFound:
+            logging.warning(f"Парсер {parser} не установлен, используется {FALLBACK_HTML_PARSER}.")
+            _unavailable_parsers.add(parser)
+    return BeautifulSoup(markup, FALLBACK_HTML_PARSER)
+
+
+def parse_page(content):
+    """
+    Парсит загруженную HTML-страницу.
+
+    Args:
+        content (bytes): Тело HTTP-ответа.
+
+    Returns:
+        BeautifulSoup object: Объект BeautifulSoup с распарсенным HTML, или None, если контент пуст или не разобран.
+    """
+    if not content:
+        return None
+    try:
+        return make_soup(content, PAGE_HTML_PARSER)
+    except Exception as e:
+        logging.error(f"    Ошибка при разборе HTML: {e}")
+        return None
+
+
+def _div_start_tag_pattern(class_name):
+    """Возвращает регулярное выражение для открывающего тега div с указанным классом."""
+    return re.compile(
+        rb'<(?i:div)\b[^>]*?(?<![\w-])class\s*=\s*(["\'])(?:(?!\1).)*?(?<![\w-])'
+        + re.escape(class_name.encode()) + rb'(?![\w-])[^>]*>',
+        re.DOTALL
+    )
+
+
+PAGE_EXPERIENCE_RE = _div_start_tag_pattern(PAGE_EXPERIENCE_CLASS)
+PAGE_EXPERIENCE_WRAP_RE = _div_start_tag_pattern(PAGE_EXPERIENCE_WRAP_CLASS)
+EXP_PAUSED_RE = _div_start_tag_pattern(EXP_PAUSED_CLASS)
+DISPLAY_NONE_RE = re.compile(rb'\bstyle\s*=\s*(["\'])display:none;\1')
+H3_END_RE = re.compile(rb'</h3\s*>', re.IGNORECASE)
+P_END_RE = re.compile(rb'</p\s*>', re.IGNORECASE)
+
+
+def is_page_classifiable(prefix):
+    """
+    Проверяет, достаточно ли загруженного начала страницы Tripster для определения ее типа.
+
+    Используется для досрочной остановки чтения страницы (fetch_pages(stop_when=...)).
+    Начало страницы считается достаточным, только если в нем найдены блоки page-experience
+    и page-experience__wrap, а если он скрыт - блок exp-paused с закрытыми заголовком и абзацем
+    причины. Признак страницы экскурсии проверяется первым, поэтому остальная часть такой
+    страницы не может изменить результат разбора.
+
+    Остальные страницы (Спутник, списки экскурсий, авторские, главная и неизвестные) по-прежнему
+    читаются до конца, но не больше PAGE_MAX_BYTES байт: блок page-experience может встретиться
+    дальше на странице, поэтому их маркеры чтение не останавливают.
+
+    Args:
+        prefix (bytes): Загруженное начало страницы.
+
+    Returns:
+        bool: True, если чтение страницы можно остановить.
+    """
+    if PAGE_EXPERIENCE_RE.search(prefix):
+        wrap = PAGE_EXPERIENCE_WRAP_RE.search(prefix)
+        if not wrap:
+            return False
+        if not DISPLAY_NONE_RE.search(wrap.group(0)):
+            return True
+        paused = EXP_PAUSED_RE.search(prefix)
+        if not paused:
+            return False
+        return bool(H3_END_RE.search(prefix, paused.end()) and P_END_RE.search(prefix, paused.end()))
+
+    return False
 
 
 def fetch_and_parse_page(url, max_retries=3, retry_delay=2):
@@ -42,36 +160,28 @@ def fetch_and_parse_page(url, max_retries=3, retry_delay=2):
     Returns:
         BeautifulSoup object: Объект BeautifulSoup с распарсенным HTML, или None в случае ошибки.
     """
-    for attempt in range(max_retries):
-        try:
-            pause_time = random.uniform(1, 3)  # Пауза от 1 до 3 секунд
-            logging.info(f"    Пауза перед запросом: {pause_time:.2f} секунд")
-            time.sleep(pause_time)
-
-            headers = {'User-Agent': USER_AGENT}
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-            return BeautifulSoup(response.content, 'html.parser')
-
-        except requests.exceptions.RequestException as e:
-            # Обработка ошибок, связанных с DNS
-            if isinstance(e.args[0], requests.exceptions.ConnectionError) and isinstance(e.args[0].args[1], socket.gaierror):
-                error_message = f"Ошибка при запросе URL: Не удалось разрешить доменное имя (попытка {attempt + 1}/{max_retries})"
-                logging.error(f"    {error_message}")
-                time.sleep(retry_delay)  # Ждем перед следующей попыткой
-                continue  # Переходим к следующей итерации цикла
-
-            # Другие ошибки RequestException
-            error_message = f"Ошибка при запросе URL: {e}"
-            logging.error(f"    {error_message}")
-            return None  # Возвращаем None в случае ошибки
+    pages = fetch_tripster_pages([url], max_retries=max_retries, retry_delay=retry_delay)
+    return parse_page(pages.get(url))
 
-        except Exception as e:
-            error_message = f"Ошибка при обработке URL: {e}"
-            logging.error(f"    {error_message}")
-            return None  # Возвращаем None в случае ошибки
 
-    return None  # Если все попытки неудачны
+def fetch_tripster_pages(urls, max_retries=3, retry_delay=2, request_headers=None, validators=None):
+    """
+    Конкурентно загружает страницы Tripster, читая каждую только до момента, когда ее тип
+    можно определить (is_page_classifiable), и не больше PAGE_MAX_BYTES байт.
+
+    Args:
+        urls (iterable): URL страниц.
+        max_retries (int): Максимальное количество повторных попыток.
+        retry_delay (int): Задержка между попытками в секундах.
+        request_headers (dict, optional): Заголовки условных запросов {url: dict} (см. fetch_pages).
+        validators (dict, optional): Словарь для валидаторов полученных страниц (см. fetch_pages).
+
+    Returns:
+        dict: Словарь {url: bytes или None} с загруженным началом страниц.
+    """
+    return fetch_pages(urls, max_retries=max_retries, retry_delay=retry_delay,
+                       stop_when=is_page_classifiable, max_bytes=PAGE_MAX_BYTES,
+                       request_headers=request_headers, validators=validators)
 
 
 def is_experience_page(soup):
@@ -170,7 +280,156 @@ def extract_experience_info(soup):
         return None, None
 
 
-def extract_widget_info(url, max_retries=3, retry_delay=2):
+def summarize_page(content):
+    """
+    Разбирает загруженную страницу Tripster и сохраняет все признаки, нужные для проверки виджетов и диплинков.
+
+    Результат содержит только простые значения, поэтому его можно хранить вместо дерева BeautifulSoup.
+
+    Args:
+        content (bytes): Загруженная страница (или ее начало).
+
+    Returns:
+        dict: {'is_experience', 'is_sputnik', 'experience_info', 'listing'} или {'error': str},
+              None - если страницу не удалось получить или разобрать.
+    """
+    try:
+        soup = parse_page(content)
+        if not soup:
+            return None
+
+        return {
+            'is_experience': is_experience_page(soup),
+            'is_sputnik': is_sputnik_page(soup),
+            'experience_info': extract_experience_info(soup),
+            'listing': is_listing_page(soup),
+        }
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def summary_from_cache(summary):
+    """Восстанавливает результат summarize_page, сохраненный в HTTP-кеше: JSON хранит кортежи как списки."""
+    return dict(summary, experience_info=tuple(summary['experience_info']), listing=tuple(summary['listing']))
+
+
+def page_memo_key(url):
+    """
+    Возвращает ключ кеша запуска для страницы Tripster.
+
+    Ссылки на одну экскурсию (в том числе партнерские с параметром u=) получают общий ключ по ID экскурсии,
+    остальные страницы - по нормализованному URL.
+    """
+    experience_id = extract_deeplink_id(url)
+    if experience_id is not None:
+        return f"experience:{experience_id}"
+    return normalize_url(url)
+
+
+def fetch_page_summaries(urls, max_retries=3, retry_delay=2):
+    """
+    Загружает и разбирает страницы Tripster, каждую не больше одного раза за запуск.
+
+    Страницы, уже загруженные для других постов или загружаемые в этот момент другим потоком,
+    повторно не запрашиваются. Результаты разбора сохраняются в HTTP-кеше (core/http_cache.py)
+    вместе с ETag и Last-Modified страницы; в следующих запусках страница запрашивается условно,
+    и при ответе 304 Not Modified используется сохраненный результат без загрузки и разбора.
+
+    Args:
+        urls (iterable): URL страниц.
+        max_retries (int): Максимальное количество повторных попыток.
+        retry_delay (int): Задержка между попытками в секундах.
+
+    Returns:
+        dict: Словарь {url: результат summarize_page}.
+    """
+    keys = {url: page_memo_key(url) for url in urls if url}
+    key_urls = {}
+    for url, key in keys.items():
+        key_urls.setdefault(key, url)
+
+    def compute(pending_keys):
+        pending_urls = [key_urls[key] for key in pending_keys]
+        cached = http_cache.get_entries(PAGE_CACHE_KIND, pending_urls)
+        request_headers = {url: http_cache.conditional_headers(entry) for url, entry in cached.items()}
+        validators = {}
+        pages = fetch_tripster_pages(pending_urls, max_retries, retry_delay, request_headers, validators)
+
+        # Страницы, не изменившиеся с прошлого запуска, и страницы, не полученные из-за
+        # ограничения запросов (429/503), не разбираются
+        not_modified = {key: summary_from_cache(cached[key_urls[key]]['result']) for key in pending_keys
+                        if pages.get(key_urls[key]) == http_cache.NOT_MODIFIED}
+        limited = {key: RATE_LIMITED_SUMMARY for key in pending_keys if pages.get(key_urls[key]) == rate_limiter.RATE_LIMITED}
+        parse_keys = [key for key in pending_keys if key not in limited and key not in not_modified]
+        # Разбор страниц выполняется в пуле процессов, если он включен (PARSE_WORKERS)
+        with metrics.timer('tripster_page_parse_seconds'):
+            summaries = dict(zip(parse_keys, parse_pool.map_items(summarize_page, [pages.get(key_urls[key]) for key in parse_keys])))
+        metrics.inc('tripster_pages_parsed_total', len(parse_keys))
+
+        http_cache.mark_not_modified(PAGE_CACHE_KIND, [key_urls[key] for key in not_modified])
+        http_cache.mark_modified(sum(1 for key in parse_keys if pages.get(key_urls[key])))
+        # Сохраняются только успешно разобранные страницы с валидаторами
+        http_cache.put_entries(PAGE_CACHE_KIND, {
+            key_urls[key]: (validators[key_urls[key]], summary) for key, summary in summaries.items()
+            if key_urls[key] in validators and summary and 'error' not in summary
+        })
+        return dict(summaries, **not_modified, **limited)
+
+    # Неудачные загрузки не сохраняются в кеше запуска: страница будет запрошена повторно
+    summaries = _page_memo.get_many(key_urls, compute, is_cacheable=is_summary_cacheable)
+    return {url: summaries[key] for url, key in keys.items()}
+
+
+def is_summary_cacheable(summary):
+    """
+    Проверяет, можно ли использовать результат summarize_page для остальных постов запуска.
+
+    Не сохраняются страницы, которые не удалось загрузить (таймаут, ошибка соединения),
+    разобрать или получить из-за ограничения запросов: иначе одна временная ошибка
+    сделала бы неактивными ссылки на страницу во всех постах запуска.
+    """
+    return bool(summary) and 'error' not in summary and not is_rate_limited(summary)
+
+
+def is_rate_limited(summary):
+    """Проверяет, не получена ли страница из-за ограничения запросов (429/503)."""
+    return bool(summary) and summary.get('rate_limited', False)
+
+
+def widget_info_from_summary(summary):
+    """
+    Определяет заголовок и причину неактивности виджета по результату summarize_page.
+
+    Args:
+        summary (dict): Результат summarize_page.
+
+    Returns:
+        tuple: (str, str, bool) - заголовок, причина неактивности, признак неизвестного типа страницы.
+    """
+    if not summary:
+        return None, "Не удалось получить данные страницы", False
+
+    if 'error' in summary:
+        raise RuntimeError(summary['error'])
+
+    if summary['is_experience']:
+        title, reason = summary['experience_info']
+        if title and reason:
+            return title, reason, False
+        else:
+            return None, None, False
+    elif summary['is_sputnik']:
+        logging.info("    Страница Спутник")
+        return "Спутник", None, False
+    elif summary['listing']:
+        logging.info("    Страница со списком экскурсий, авторская страница или главная страница: Активна")
+        return None, None, False
+    else:
+        logging.warning("    Неизвестный тип страницы: Требуется ручная проверка.")
+        return None, "Требуется ручная проверка (неизвестный тип страницы)", True
+
+
+def extract_widget_info(url, max_retries=3, retry_delay=2, summaries=None):
     """
     Извлекает информацию о неактивном виджете: заголовок и причину неактивности.
 
@@ -178,31 +437,16 @@ def extract_widget_info(url, max_retries=3, retry_delay=2):
         url (str): URL страницы виджета.
         max_retries (int): Максимальное количество повторных попыток.
         retry_delay (int): Задержка между попытками в секундах.
+        summaries (dict, optional): Заранее полученные результаты fetch_page_summaries {url: dict}.
+            Если не переданы, страница запрашивается через fetch_page_summaries.
 
     Returns:
         tuple: (str, str, bool) - заголовок, причина неактивности, признак неизвестного типа страницы.  None, None, False - если не удалось извлечь информацию.
     """
     try:
-        soup = fetch_and_parse_page(url, max_retries=3, retry_delay=2)
-
-        if not soup:
-            return None, "Не удалось получить данные страницы", False
-
-        if is_experience_page(soup):
-            title, reason = extract_experience_info(soup)
-            if title and reason:
-                return title, reason, False
-            else:
-                return None, None, False
-        elif is_sputnik_page(soup):
-            logging.info("    Страница Спутник")
-            return "Спутник", None, False
-        elif is_listing_page(soup):
-            logging.info("    Страница со списком экскурсий, авторская страница или главная страница: Активна")
-            return None, None, False
-        else:
-            logging.warning("    Неизвестный тип страницы: Требуется ручная проверка.")
-            return None, "Требуется ручная проверка (неизвестный тип страницы)", True
+        if summaries is None:
+            summaries = fetch_page_summaries([url], max_retries=max_retries, retry_delay=retry_delay)
+        return widget_info_from_summary(summaries.get(url))
     except Exception as e:
         logging.error(f"Ошибка при обработке URL: {url}. Ошибка: {e}")
         return None, f"Ошибка при обработке: {e}", True
@@ -236,13 +480,133 @@ def extract_deeplink_id(url):
         return None
 
 
-def extract_tripster_widgets(html_content, tripster_domain="tripster.ru", max_retries=3, retry_delay=2):
+def content_fingerprint(html_content, tripster_domain="tripster.ru"):
     """
-    Извлекает виджеты Tripster из HTML-контента.
+    Вычисляет отпечаток контента поста для определения, изменились ли найденные в нем ссылки.
+
+    Args:
+        html_content (str): HTML-контент поста.
+        tripster_domain (str, optional): Домен Tripster. Defaults to "tripster.ru".
+
+    Returns:
+        str: SHA-256 в шестнадцатеричном виде.
+    """
+    data = f"{EXTRACTION_VERSION}:{tripster_domain}:{html_content}"
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def has_link_candidates(html_content, tripster_domain="tripster.ru"):
+    """
+    Быстро проверяет без разбора HTML, могут ли в контенте быть виджеты или диплинки Tripster.
+
+    Виджет - это div с классом tripster-widget, диплинк - ссылка, href которой содержит домен
+    Tripster (в том числе партнерская ссылка с параметром u=). Если ни класса, ни домена нет
+    ни в исходном тексте, ни в тексте с декодированными ссылками на символы (парсер декодирует
+    их в значениях атрибутов), parse_link_candidates заведомо ничего не найдет.
+
+    Args:
+        html_content (str): HTML-контент поста.
+        tripster_domain (str, optional): Домен Tripster. Defaults to "tripster.ru".
+
+    Returns:
+        bool: False, если разбор HTML можно пропустить.
+    """
+    if TRIPSTER_WIDGET_CLASS in html_content or tripster_domain in html_content:
+        return True
+    if '&' not in html_content:
+        return False
+    text = html.unescape(html_content)
+    return TRIPSTER_WIDGET_CLASS in text or tripster_domain in text
+
+
+def parse_link_candidates(html_content, tripster_domain="tripster.ru"):
+    """
+    Находит виджеты и диплинки Tripster за один обход дерева HTML без проверки их статуса.
+
+    Обход идет в порядке документа; для каждого элемента известны виджеты, внутри которых
+    он находится, поэтому ссылки внутри виджетов отбрасываются без поиска родителей.
+    Повторяющиеся пары (URL, анкор) диплинков отбрасываются. Контент без упоминаний Tripster
+    (has_link_candidates) не разбирается.
 
     Args:
         html_content (str): HTML-контент страницы.
         tripster_domain (str, optional): Домен Tripster. Defaults to "tripster.ru".
+
+    Returns:
+        dict: {'widgets': [{'id', 'url', 'card_title'}, ...], 'deeplinks': [{'id', 'url', 'anchor'}, ...]},
+              пригодный для сериализации в JSON.
+    """
+    widgets = []
+    deeplinks = []
+    if not has_link_candidates(html_content, tripster_domain):
+        return {'widgets': widgets, 'deeplinks': deeplinks}
+
+    seen_links = set()
+    titled_widgets = set()  # Индексы виджетов, для которых уже найден заголовок карточки
+
+    soup = make_soup(html_content)
+    stack = [(child, ()) for child in reversed(soup.contents)]
+
+    while stack:
+        element, enclosing_widgets = stack.pop()
+        if not isinstance(element, Tag):
+            continue
+
+        classes = element.get('class') or []
+
+        if element.name == 'div' and TRIPSTER_WIDGET_CLASS in classes:
+            # Извлекаем ID из data-experience-id
+            widget_id = element.get('data-experience-id')
+            widget_href = element.get('data-experience-href')
+            widgets.append({
+                'id': widget_id if widget_id else None,
+                'url': widget_href if widget_id else None,
+                'card_title': None,
+            })
+            enclosing_widgets = enclosing_widgets + (len(widgets) - 1,)
+
+        elif element.name == 'a':
+            if enclosing_widgets and ' '.join(classes) == EXPCARD_TITLE_CLASS:
+                for index in enclosing_widgets:
+                    if index not in titled_widgets:
+                        widgets[index]['card_title'] = element.text.strip()
+                        titled_widgets.add(index)
+
+            href = element.get('href')
+            if href is not None and tripster_domain in href and not enclosing_widgets:
+                anchor = element.text.strip()
+                if not anchor:
+                    anchor = element.get_text(strip=True) or "Без названия"  # Упрощенная логика
+
+                link_tuple = (href, anchor)
+                if link_tuple not in seen_links:
+                    deeplinks.append({'id': extract_deeplink_id(href), 'url': href, 'anchor': anchor})
+                    seen_links.add(link_tuple)
+
+        stack.extend((child, enclosing_widgets) for child in reversed(element.contents))
+
+    return {'widgets': widgets, 'deeplinks': deeplinks}
+
+
+def parse_widget_candidates(html_content):
+    """
+    Находит виджеты Tripster в HTML-контенте без проверки их статуса.
+
+    Args:
+        html_content (str): HTML-контент страницы.
+
+    Returns:
+        list: Список словарей {'id', 'url', 'card_title'}, пригодных для сериализации в JSON.
+    """
+    return parse_link_candidates(html_content)['widgets']
+
+
+def resolve_widgets(candidates, max_retries=3, retry_delay=2):
+    """
+    Проверяет статус найденных виджетов по страницам экскурсий.
+
+    Args:
+        candidates (list): Результат parse_widget_candidates.
         max_retries (int, optional): Максимальное количество попыток при запросе URL. Defaults to 3.
         retry_delay (int, optional): Задержка между попытками в секундах. Defaults to 2.
 
@@ -250,15 +614,13 @@ def extract_tripster_widgets(html_content, tripster_domain="tripster.ru", max_re
         list: Список словарей с информацией о виджетах.
     """
     widgets = []
-    soup = BeautifulSoup(html_content, 'html.parser')
-    widget_divs = soup.find_all('div', class_=TRIPSTER_WIDGET_CLASS)
 
-    for widget_div in widget_divs:
-        try:
-            # Извлекаем ID из data-experience-id
-            widget_id = widget_div.get('data-experience-id')
-            widget_href = widget_div.get('data-experience-href')
+    # Загружаем страницы всех виджетов поста конкурентно
+    summaries = fetch_page_summaries([candidate['url'] for candidate in candidates if candidate['url']],
+                                     max_retries=max_retries, retry_delay=retry_delay)
 
+    for candidate in candidates:
+        try:
             # Инициализируем url значением None
             url = None
             title = None
@@ -266,16 +628,21 @@ def extract_tripster_widgets(html_content, tripster_domain="tripster.ru", max_re
             is_unknown_type = False
             status = "active" #  По умолчанию считаем активным, пока не узнаем обратное
 
-            # Формируем URL и получаем информацию о виджете
-            widget_url = widget_href if widget_id else None
-            if widget_url:
-                # print(f"  URL виджета: {widget_url}")  # Выводим URL в консоль
-                title, inactivity_reason, is_unknown_type = extract_widget_info(widget_url, max_retries, retry_delay)
+            # Получаем информацию о виджете
+            widget_url = candidate['url']
+            if widget_url and is_rate_limited(summaries.get(widget_url)):
+                # Страница не получена из-за ограничения запросов: виджет не считается неактивным,
+                # в БД сохраняется его прежний статус
+                status = rate_limiter.UNCHECKED
+                title = candidate.get('card_title') or "Заголовок не найден"
+                url = widget_url
+            elif widget_url:
+                title, inactivity_reason, is_unknown_type = extract_widget_info(widget_url, max_retries, retry_delay, summaries)
                 url = widget_url #  Сохраняем widget_url
                 if title is None and inactivity_reason is None:
                     status = "active" #  Активен
-                    title_element = widget_div.find('a', class_='expcard__title expcard__title__link')
-                    title = title_element.text.strip() if title_element else "Заголовок не найден"
+                    card_title = candidate.get('card_title')
+                    title = card_title if card_title is not None else "Заголовок не найден"
                 elif title == "Спутник":
                     status = "active"
                 else:
@@ -288,9 +655,10 @@ def extract_tripster_widgets(html_content, tripster_domain="tripster.ru", max_re
                 url = None
 
             if title != "Спутник":
+                metrics.inc('links_checked_total', labels={'type': 'widget', 'status': status})
                 widgets.append({
                     'widget_number': len(widgets) + 1,
-                    'id': widget_id if widget_id else None,
+                    'id': candidate['id'],
                     'status': status,
                     'title': title,
                     'url': url if url else None,
@@ -298,90 +666,148 @@ def extract_tripster_widgets(html_content, tripster_domain="tripster.ru", max_re
                     'is_unknown_type': is_unknown_type
                 })
         except Exception as e:
-            print(f"Ошибка при обработке виджета: {e}")
+            logging.error(f"Ошибка при обработке виджета: {e}")
 
     return widgets
 
 
-def extract_deeplinks(html_content, tripster_domain="tripster.ru"):
+def extract_tripster_widgets(html_content, tripster_domain="tripster.ru", max_retries=3, retry_delay=2):
     """
-    Извлекает диплинки Tripster из HTML-контента, исключая ссылки внутри виджетов.
+    Извлекает виджеты Tripster из HTML-контента.
 
     Args:
         html_content (str): HTML-контент страницы.
         tripster_domain (str, optional): Домен Tripster. Defaults to "tripster.ru".
+        max_retries (int, optional): Максимальное количество попыток при запросе URL. Defaults to 3.
+        retry_delay (int, optional): Задержка между попытками в секундах. Defaults to 2.
+
+    Returns:
+        list: Список словарей с информацией о виджетах.
+    """
+    return resolve_widgets(parse_widget_candidates(html_content), max_retries, retry_delay)
+
+
+def parse_deeplink_candidates(html_content, tripster_domain="tripster.ru"):
+    """
+    Находит диплинки Tripster вне виджетов без проверки их статуса.
+
+    Повторяющиеся пары (URL, анкор) отбрасываются.
+
+    Args:
+        html_content (str): HTML-контент страницы.
+        tripster_domain (str, optional): Домен Tripster. Defaults to "tripster.ru".
+
+    Returns:
+        list: Список словарей {'id', 'url', 'anchor'}, пригодных для сериализации в JSON.
+    """
+    return parse_link_candidates(html_content, tripster_domain)['deeplinks']
+
+
+def page_summary(summaries, url):
+    """Возвращает результат summarize_page для URL, вызывая исключение, если разбор страницы завершился ошибкой."""
+    summary = summaries.get(url)
+    if summary and 'error' in summary:
+        raise RuntimeError(summary['error'])
+    return summary
+
+
+def resolve_deeplinks(candidates):
+    """
+    Проверяет статус найденных диплинков.
+
+    Сначала проверяет статусы экскурсий пакетным запросом к API, затем конкурентно загружает страницы,
+    которые нужны для уточнения результата: страницы неактивных экскурсий и ссылки без ID.
+
+    Args:
+        candidates (list): Результат parse_deeplink_candidates.
 
     Returns:
         list: Список словарей с информацией о диплинках.
     """
     deeplinks = []
-    seen_links = set()
-    soup = BeautifulSoup(html_content, 'html.parser')
-    links = soup.find_all('a', href=True)
 
-    for link in links:
-        href = link['href']
+    # Проверяем статусы всех экскурсий пакетным запросом к API
+    statuses = check_deeplink_statuses_api(candidate['id'] for candidate in candidates if candidate['id'])
 
-        if tripster_domain in href:
-            if link.find_parent('div', class_='tripster-widget'):
-                continue
+    # Загружаем страницы неактивных экскурсий и ссылок без ID конкурентно
+    page_urls = [
+        candidate['url'] for candidate in candidates
+        if not candidate['id'] or statuses[candidate['id']][0] is False
+    ]
+    summaries = fetch_page_summaries(page_urls)
 
-            deeplink_id = extract_deeplink_id(href)
-            is_experience_link = deeplink_id is not None  # Проверяем, ведет ли ссылка на страницу экскурсии
+    for candidate in candidates:
+        href = candidate['url']
+        deeplink_id = candidate['id']
+        is_experience_link = deeplink_id is not None  # Проверяем, ведет ли ссылка на страницу экскурсии
 
-            try:
-                if deeplink_id:
-                    # Если есть ID, сначала получаем данные из API
-                    is_active, reason, title = check_deeplink_status_api(deeplink_id)
+        try:
+            if deeplink_id:
+                # Если есть ID, сначала используем данные из API
+                is_active, reason, title = statuses[deeplink_id]
+                is_unknown = False
+                # is_active равен None, если API ограничивает запросы и статус не проверен
+
+                if is_experience_link and not is_active:
+                    # Если это ссылка на страницу экскурсии и она не активна,
+                    # пытаемся получить причину неактивности со страницы
+                    summary = page_summary(summaries, href)
+                    if summary and not is_rate_limited(summary):
+                        title, page_reason = summary['experience_info']
+                        reason = page_reason  # Заменяем причину из API на причину со страницы
+            else:
+                # Если ID извлечь не удалось
+                summary = page_summary(summaries, href)
+                if is_rate_limited(summary):
+                    is_active = None
+                    title = None
+                    reason = "Не проверено: Tripster ограничивает запросы"
                     is_unknown = False
-
-                    if is_experience_link and not is_active:
-                        # Если это ссылка на страницу экскурсии и она не активна,
-                        # пытаемся получить причину неактивности со страницы
-                        page_soup = fetch_and_parse_page(href)
-                        if page_soup:
-                            title, page_reason = extract_experience_info(page_soup)
-                            reason = page_reason  # Заменяем причину из API на причину со страницы
-                else:
-                    # Если ID извлечь не удалось
-                    page_soup = fetch_and_parse_page(href)
-                    if page_soup:
-                        page_type, page_title = is_listing_page(page_soup)
-                        if page_type:
-                            is_active = True
-                            title = page_title if page_title else page_type  #  Используем конкретный тип страницы или заголовок
-                            reason = None
-                            is_unknown = False
-                        else:
-                            is_active = False
-                            title = "Без названия"
-                            reason = "Не удалось извлечь ID экскурсии"
-                            is_unknown = True
+                elif summary:
+                    page_type, page_title = summary['listing']
+                    if page_type:
+                        is_active = True
+                        title = page_title if page_title else page_type  #  Используем конкретный тип страницы или заголовок
+                        reason = None
+                        is_unknown = False
                     else:
                         is_active = False
-                        title = "Не удалось получить данные страницы"
-                        reason = "Не удалось получить данные страницы"
+                        title = "Без названия"
+                        reason = "Не удалось извлечь ID экскурсии"
                         is_unknown = True
+                else:
+                    is_active = False
+                    title = "Не удалось получить данные страницы"
+                    reason = "Не удалось получить данные страницы"
+                    is_unknown = True
+
+            status = rate_limiter.UNCHECKED if is_active is None else ('active' if is_active else 'inactive')
+            metrics.inc('links_checked_total', labels={'type': 'deeplink', 'status': status})
+            deeplinks.append({
+                'id': deeplink_id,
+                'anchor': candidate['anchor'],
+                'url': href,
+                'status': status,
+                'title': title,
+                'inactivity_reason': reason,
+                'is_unknown_type': is_unknown
+            })
 
-                anchor = link.text.strip()
-                if not anchor:
-                    anchor = link.get_text(strip=True) or "Без названия"  # Упрощенная логика
+        except Exception as e:
+            logging.error(f"Ошибка при обработке диплинка: {e}")
 
-                link_tuple = (href, anchor)
+    return deeplinks
 
-                if link_tuple not in seen_links:
-                    deeplinks.append({
-                        'id': deeplink_id,
-                        'anchor': anchor,
-                        'url': href,
-                        'status': 'active' if is_active else 'inactive',
-                        'title': title,
-                        'inactivity_reason': reason,
-                        'is_unknown_type': is_unknown
-                    })
-                    seen_links.add(link_tuple)
 
-            except Exception as e:
-                print(f"Ошибка при обработке диплинка: {e}")
+def extract_deeplinks(html_content, tripster_domain="tripster.ru"):
+    """
+    Извлекает диплинки Tripster из HTML-контента, исключая ссылки внутри виджетов.
 
-    return deeplinks
\ No newline at end of file
+    Args:
+        html_content (str): HTML-контент страницы.
+        tripster_domain (str, optional): Домен Tripster. Defaults to "tripster.ru".
+
+    Returns:
+        list: Список словарей с информацией о диплинках.
+    """
+    return resolve_deeplinks(parse_deeplink_candidates(html_content, tripster_domain))
@@ -2,8 +2,17 @@ import requests
 import json
 from dotenv import load_dotenv
 import os
+import gzip
+import time
+import zlib
 import logging
+import threading
+import uuid
+from datetime import datetime, timezone
 from urllib.parse import urljoin
+from core import http_client
+from core import http_cache
+from core import metrics
 
 # Настройка базовой конфигурации логирования
 DEFAULT_LOG_LEVEL = logging.INFO
@@ -20,23 +29,137 @@ if DOMAIN_TO_CHECK:
         logging.warning("DOMAIN_TO_CHECK должен указываться без 'https://' или 'http://'")
 
 API_PATH = os.getenv("API_PATH", "/wp-json/wp/v2/posts")
-API_URL = "https://" + DOMAIN_TO_CHECK + API_PATH if DOMAIN_TO_CHECK else None
+API_SCHEME = os.getenv("API_SCHEME", "https")
+API_URL = API_SCHEME + "://" + DOMAIN_TO_CHECK + API_PATH if DOMAIN_TO_CHECK else None
+POSTS_PER_PAGE = min(int(os.getenv("POSTS_PER_PAGE", 100)), 100)  # WordPress ограничивает per_page значением 100
+LISTING_FIELDS = "id,title,content,modified,modified_gmt"
 JSON_DIR = os.getenv("JSON_DIR", "json")
-POST_DATA_FILE = os.getenv("POST_DATA_FILE", "post_data.json")
+POST_DATA_FILE = os.getenv("POST_DATA_FILE", "post_data.jsonl")
+POST_INDEX_POLL_INTERVAL = float(os.getenv("POST_INDEX_POLL_INTERVAL", 1))
+CRAWL_STATE_FILE = os.getenv("CRAWL_STATE_FILE", "crawl_state.json")
+RUN_ID = os.getenv("RUN_ID", "")
+SITES_FILE = os.getenv("SITES_FILE", "")
+WP_USERNAME = os.getenv("WP_USERNAME", "")
+WP_APP_PASSWORD = os.getenv("WP_APP_PASSWORD", "")
+# Вид записей HTTP-кеша (core/http_cache.py) с данными постов, полученных по ID
+WP_POST_CACHE_KIND = "wp_post"
 
-def fetch_wordpress_posts(api_url, page=1):
+_sites = None
+# Состояния всех сайтов хранятся в одном файле, а сайты могут обрабатываться одновременно
+_crawl_state_lock = threading.Lock()
+
+
+def site_config(entry):
+    """
+    Формирует настройки сайта из записи файла сайтов.
+
+    Args:
+        entry (dict): {'domain', 'api_path', 'api_scheme', 'username', 'password' или 'password_env'};
+            обязателен только domain, остальные поля по умолчанию берутся из API_PATH, API_SCHEME,
+            WP_USERNAME и WP_APP_PASSWORD.
+
+    Returns:
+        dict: {'domain', 'api_url', 'auth'}, где auth - (имя пользователя, пароль приложения) или None.
+    """
+    domain = entry['domain']
+    api_url = entry.get('api_scheme', API_SCHEME) + "://" + domain + entry.get('api_path', API_PATH)
+    username = entry.get('username', WP_USERNAME)
+    if entry.get('password_env'):
+        password = os.getenv(entry['password_env'], "")
+    else:
+        password = entry.get('password', WP_APP_PASSWORD)
+    return {'domain': domain, 'api_url': api_url, 'auth': (username, password) if username and password else None}
+
+
+def load_sites():
+    """
+    Возвращает список проверяемых сайтов.
+
+    Сайты задаются JSON-списком в файле SITES_FILE в директории JSON_DIR (см. json/sites example.json).
+    Если файл не задан, проверяется один сайт DOMAIN_TO_CHECK с настройками API_PATH, API_SCHEME,
+    WP_USERNAME и WP_APP_PASSWORD. Список читается один раз за процесс.
+
+    Returns:
+        list: Настройки сайтов (site_config) или пустой список, если сайты не заданы или файл некорректен.
+    """
+    global _sites
+    if _sites is not None:
+        return _sites
+
+    if not SITES_FILE:
+        _sites = [site_config({'domain': DOMAIN_TO_CHECK})] if DOMAIN_TO_CHECK else []
+        return _sites
+
+    filename = construct_json_file_path(SITES_FILE)
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            _sites = [site_config(entry) for entry in json.load(f)]
+    except Exception as e:
+        logging.error(f"Ошибка при чтении списка сайтов из файла {filename}: {e}")
+        return []
+    for site in _sites:
+        if site['domain'].startswith(("https://", "http://")):
+            logging.warning(f"Домен сайта {site['domain']} должен указываться без 'https://' или 'http://'")
+    return _sites
+
+
+def default_site():
+    """Возвращает домен сайта по умолчанию: DOMAIN_TO_CHECK или первый сайт из SITES_FILE."""
+    if DOMAIN_TO_CHECK:
+        return DOMAIN_TO_CHECK
+    sites = load_sites()
+    return sites[0]['domain'] if sites else None
+
+
+def get_site(site=None):
+    """
+    Возвращает настройки сайта по его домену.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Returns:
+        dict: Настройки сайта {'domain', 'api_url', 'auth'}. Для домена, которого нет в списке
+              сайтов, используются настройки API по умолчанию.
+    """
+    site = site or default_site()
+    for config in load_sites():
+        if config['domain'] == site:
+            return config
+    return site_config({'domain': site})
+
+
+def listing_params(page=1, **extra):
+    """
+    Формирует параметры запроса списка постов.
+
+    Запрашиваются только поля, нужные для обработки, включая отрендеренный контент,
+    чтобы не загружать каждый пост повторно по его ID.
+
+    Args:
+        page (int): Номер страницы.
+        **extra: Дополнительные параметры запроса (например, modified_after).
+
+    Returns:
+        dict: Параметры запроса.
+    """
+    return {'page': page, 'per_page': POSTS_PER_PAGE, '_fields': LISTING_FIELDS, **extra}
+
+
+def fetch_wordpress_posts(api_url, page=1, auth=None):
     """
     Получает список постов из WordPress API с учетом пагинации.
 
     Args:
         api_url (str): URL API WordPress.
         page (int): Номер страницы.
+        auth (tuple, optional): Имя пользователя и пароль приложения WordPress.
 
     Returns:
         tuple: (list, int) - список постов и общее количество страниц.
     """
     try:
-        response = requests.get(f"{api_url}?page={page}")
+        response = http_client.get(api_url, params=listing_params(page), auth=auth)
         response.raise_for_status()
         total_pages = int(response.headers.get('X-WP-TotalPages', 1))
         return response.json(), total_pages
@@ -45,21 +168,56 @@ def fetch_wordpress_posts(api_url, page=1):
         return [], 1
 
 
-def fetch_wordpress_post_by_id(api_url, post_id):
+def fetch_wordpress_post_json(api_url, post_id, auth=None):
+    """
+    Получает пост по его ID условным запросом через HTTP-кеш.
+
+    Если пост уже был получен и сервер передал ETag или Last-Modified, запрос отправляется
+    с заголовками If-None-Match / If-Modified-Since, и при ответе 304 Not Modified
+    пост берется из кеша.
+
+    Args:
+        api_url (str): URL API WordPress.
+        post_id (int): ID поста.
+        auth (tuple, optional): Имя пользователя и пароль приложения WordPress.
+
+    Returns:
+        dict: Данные поста в формате JSON.
+
+    Raises:
+        requests.exceptions.RequestException: При ошибке запроса.
+        ValueError: Если ответ не является корректным JSON.
+    """
+    url = f"{api_url}/{post_id}"
+    entry = http_cache.get_entry(WP_POST_CACHE_KIND, url)
+    response = http_client.get(url, headers=http_cache.conditional_headers(entry), auth=auth)
+    if response.status_code == 304 and entry is not None:
+        http_cache.mark_not_modified(WP_POST_CACHE_KIND, [url])
+        return entry['result']
+
+    response.raise_for_status()
+    post = response.json()
+    http_cache.mark_modified()
+    validators = http_cache.response_validators(response.headers)
+    if validators and isinstance(post, dict):
+        http_cache.put_entries(WP_POST_CACHE_KIND, {url: (validators, post)})
+    return post
+
+
+def fetch_wordpress_post_by_id(api_url, post_id, auth=None):
     """
     Получает данные поста по его ID из API WordPress.
 
     Args:
         api_url (str): URL API WordPress.
         post_id (int): ID поста.
+        auth (tuple, optional): Имя пользователя и пароль приложения WordPress.
 
     Returns:
         str: HTML-контент поста.
     """
     try:
-        response = requests.get(f"{api_url}/{post_id}")
-        response.raise_for_status()
-        post = response.json()
+        post = fetch_wordpress_post_json(api_url, post_id, auth)
 
         if post and 'content' in post and 'rendered' in post['content']:
             content = post['content']['rendered']
@@ -99,4 +257,253 @@ def save_data_to_json_file(data, filename=None):
             json.dump(data, f, ensure_ascii=False, indent=4)
         logging.info(f"Данные успешно сохранены в файл: {filename}")
     except Exception as e:
-        logging.error(f"Ошибка при сохранении данных в файл: {e}")
\ No newline at end of file
+        logging.error(f"Ошибка при сохранении данных в файл: {e}")
+
+
+def post_index_path(site=None):
+    """
+    Строит путь к индексу постов сайта.
+
+    Индекс сайта по умолчанию хранится в POST_DATA_FILE, индексы остальных сайтов - в файлах
+    с доменом сайта в имени (например, post_data-blog.example.com.jsonl).
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Returns:
+        str: Полный путь к файлу индекса.
+    """
+    site = site or default_site()
+    if site == default_site():
+        return construct_json_file_path(POST_DATA_FILE)
+    stem, _, extension = POST_DATA_FILE.partition('.')
+    return construct_json_file_path(f"{stem}-{site}.{extension}" if extension else f"{stem}-{site}")
+
+
+def is_compressed_index(filename):
+    """Проверяет, сжимается ли индекс постов gzip (по расширению .gz)."""
+    return filename.endswith('.gz')
+
+
+class PostIndexWriter:
+    """
+    Записывает индекс постов в файл JSON Lines: одна запись о посте на строку.
+
+    Записи дописываются по мере получения страниц списка постов, поэтому в памяти хранится
+    только текущая страница, а tripster_link_processor может читать индекс, пока индексатор
+    его дописывает (iter_post_index(follow=True)). Если имя файла оканчивается на .gz,
+    индекс сжимается gzip; после каждой страницы сжатый поток сбрасывается на диск,
+    и записанные строки сразу доступны для чтения. При закрытии в конец индекса
+    записывается строка-маркер {"end": true, "count": N, "full_sweep": bool}: при инкрементальном
+    обходе обработчик ссылок дополнительно перепроверяет ссылки постов, не попавших в индекс.
+    """
+
+    def __init__(self, filename=None, full_sweep=False):
+        self.filename = filename or post_index_path()
+        self.full_sweep = full_sweep
+        self.count = 0
+        if is_compressed_index(self.filename):
+            self.file = gzip.open(self.filename, 'wt', encoding='utf-8')
+        else:
+            self.file = open(self.filename, 'w', encoding='utf-8')
+
+    def add_posts(self, records):
+        """
+        Дописывает записи о постах и сбрасывает их на диск.
+
+        Args:
+            records (iterable): Записи о постах {'order', 'id', 'title', 'content'}.
+        """
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.count += 1
+        self.file.flush()
+
+    def close(self):
+        """Записывает маркер конца индекса и закрывает файл."""
+        self.file.write(json.dumps({'end': True, 'count': self.count, 'full_sweep': self.full_sweep}) + '\n')
+        self.file.close()
+        logging.info(f"Индекс постов сохранен в файл {self.filename}: {self.count} постов.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+def _iter_index_lines(f, compressed, follow):
+    """
+    Читает строки индекса из двоичного файла, распаковывая gzip по мере чтения.
+
+    Незавершенная последняя строка (индекс еще дописывается) в режиме follow дочитывается
+    после паузы, иначе отбрасывается.
+
+    Yields:
+        bytes: Строки индекса без перевода строки.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+    buffer = b''
+    while True:
+        chunk = f.read(64 * 1024)
+        if not chunk:
+            if not follow:
+                if buffer.strip():
+                    logging.warning("Последняя строка индекса постов не завершена и пропущена.")
+                return
+            time.sleep(POST_INDEX_POLL_INTERVAL)
+            continue
+        buffer += decompressor.decompress(chunk) if decompressor else chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield line
+
+
+def iter_post_index(filename=None, follow=False, end=None):
+    """
+    Читает индекс постов, записанный PostIndexWriter, по одной записи.
+
+    Args:
+        filename (str, optional): Путь к файлу индекса. По умолчанию индекс сайта по умолчанию (post_index_path).
+        follow (bool): Ожидать новых записей, пока в индексе нет маркера конца: позволяет
+            обрабатывать посты одновременно с индексацией.
+        end (dict, optional): Словарь, в который записывается маркер конца индекса
+            ({'end', 'count', 'full_sweep'}), когда он прочитан.
+
+    Yields:
+        dict: Записи о постах {'order', 'id', 'title', 'content'}.
+
+    Raises:
+        FileNotFoundError: Если файл индекса не найден.
+        json.JSONDecodeError: Если строка индекса не является корректным JSON.
+    """
+    filename = filename or post_index_path()
+    with open(filename, 'rb') as f:
+        for line in _iter_index_lines(f, is_compressed_index(filename), follow):
+            record = json.loads(line)
+            if record.get('end'):
+                if end is not None:
+                    end.update(record)
+                return
+            yield record
+    logging.warning(f"В индексе постов {filename} нет маркера конца: индексация не была завершена.")
+
+
+def load_crawl_state(site=None):
+    """
+    Загружает состояние обхода сайта: отметку последнего изменения и дату полного обхода.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Returns:
+        dict: Состояние обхода сайта (пустой словарь, если обход еще не выполнялся).
+    """
+    site = site or default_site()
+    filename = construct_json_file_path(CRAWL_STATE_FILE)
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f).get(site, {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Ошибка при чтении состояния обхода из файла {filename}: {e}")
+        return {}
+
+
+def save_crawl_state(state, site=None):
+    """
+    Сохраняет состояние обхода сайта, не затрагивая состояния других сайтов.
+
+    Args:
+        state (dict): Состояние обхода сайта.
+        site (str, optional): Домен сайта. По умолчанию default_site().
+    """
+    site = site or default_site()
+    filename = construct_json_file_path(CRAWL_STATE_FILE)
+    with _crawl_state_lock:
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                all_states = json.load(f)
+        except FileNotFoundError:
+            all_states = {}
+        except Exception as e:
+            logging.error(f"Ошибка при чтении состояния обхода из файла {filename}: {e}")
+            all_states = {}
+
+        all_states[site] = state
+        try:
+            tmp_filename = filename + '.tmp'
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                json.dump(all_states, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_filename, filename)
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении состояния обхода в файл {filename}: {e}")
+
+
+def commit_pending_watermark(site=None):
+    """
+    Делает отметку последнего изменения, найденную индексатором, рабочей.
+
+    Вызывается после успешной обработки постов, чтобы посты, изменения которых
+    не удалось обработать, попали в следующий инкрементальный обход.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+    """
+    state = load_crawl_state(site)
+    pending = state.pop('pending_watermark', None)
+    if pending:
+        state['watermark'] = pending
+        save_crawl_state(state, site)
+        logging.info(f"Отметка последнего изменения обновлена: {pending['modified_gmt']}")
+
+
+def start_run(site=None):
+    """
+    Определяет ID запуска обработки постов.
+
+    ID берется из переменной RUN_ID (только для сайта по умолчанию: у каждого сайта свой запуск),
+    иначе продолжается незавершенный запуск, сохраненный в состоянии обхода, иначе создается новый. ID сохраняется в состоянии обхода до вызова
+    finish_run, поэтому прерванный запуск продолжается со следующим стартом.
+    Начало запуска также отмечается в метриках (metrics.start).
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Returns:
+        str: ID запуска.
+    """
+    metrics.start()
+    site = site or default_site()
+    state = load_crawl_state(site)
+    run_id = (RUN_ID if site == default_site() else None) or state.get('run_id')
+    if run_id and run_id == state.get('run_id'):
+        logging.info(f"Продолжение запуска {run_id} сайта {site}.")
+    elif run_id:
+        logging.info(f"Запуск {run_id} сайта {site}.")
+    else:
+        run_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:8]
+        logging.info(f"Новый запуск {run_id} сайта {site}.")
+
+    if state.get('run_id') != run_id:
+        state['run_id'] = run_id
+        save_crawl_state(state, site)
+    return run_id
+
+
+def finish_run(run_id, site=None):
+    """
+    Отмечает запуск завершенным: следующий старт создаст новый запуск.
+
+    Args:
+        run_id (str): ID запуска.
+        site (str, optional): Домен сайта. По умолчанию default_site().
+    """
+    state = load_crawl_state(site)
+    if state.get('run_id') == run_id:
+        state.pop('run_id')
+        save_crawl_state(state, site)
+    logging.info(f"Запуск {run_id} завершен.")
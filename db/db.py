@@ -2,7 +2,14 @@ import pymysql
 import logging
 import traceback
 import os
+import json
+import threading
+import uuid
+import time
 from dotenv import load_dotenv
+from core import metrics
+from core.link_status import UNCHECKED
+from core.wp_api_utils import default_site
 
 load_dotenv()
 
@@ -142,90 +149,1036 @@ def drop():
         logging.info("Соединение с БД закрыто.")
 
 
-def insert_or_update_data(data):
-    """Insert or update data in db."""
-    connection = None
-    try:
-        connection = connect()
-        if connection is None:
-            logging.error("Не удалось установить соединение с БД, выход.")
-            return
-
-        with connection.cursor() as cursor:
-            sql = """
-                    INSERT INTO `wptq_tripster_links` (
-                    `post_id`,
-                    `post_title`,
-                    `link_type`,
-                    `exp_id`,
-                    `exp_title`,
-                    `exp_url`,
-                    `link_status`,
-                    `inactivity_reason`,
-                    `is_unknown_type`
-                    ) VALUES (%(post_id)s, %(post_title)s, %(link_type)s, %(exp_id)s, %(exp_title)s, %(exp_url)s, %(status)s, %(inactivity_reason)s, %(is_unknown_type)s)
-                    ON DUPLICATE KEY UPDATE
-                    `post_title` = VALUES(`post_title`),
-                    `exp_title` = VALUES(`exp_title`),
-                    `link_status` = VALUES(`link_status`),
-                    `inactivity_reason` = VALUES(`inactivity_reason`),
-                    `is_unknown_type` = VALUES(`is_unknown_type`);
-            """
-            cursor.execute(sql, data)
-            connection.commit()
+UPSERT_LINK_SQL = """
+    INSERT INTO `wptq_tripster_links` (
+    `site_id`,
+    `post_id`,
+    `post_title`,
+    `link_type`,
+    `exp_id`,
+    `exp_title`,
+    `exp_url`,
+    `link_status`,
+    `inactivity_reason`,
+    `is_unknown_type`,
+    `previous_status`,
+    `status_changed_at`
+    ) VALUES (%(site_id)s, %(post_id)s, %(post_title)s, %(link_type)s, %(exp_id)s, %(exp_title)s, %(exp_url)s, %(link_status)s, %(inactivity_reason)s, %(is_unknown_type)s,
+    %(previous_status)s, COALESCE(%(status_changed_at)s, NOW()))
+    ON DUPLICATE KEY UPDATE
+    `post_title` = VALUES(`post_title`),
+    `exp_title` = VALUES(`exp_title`),
+    `previous_status` = IF(`link_status` <> VALUES(`link_status`), `link_status`, `previous_status`),
+    `status_changed_at` = IF(`link_status` <> VALUES(`link_status`), NOW(), `status_changed_at`),
+    `link_status` = VALUES(`link_status`),
+    `inactivity_reason` = VALUES(`inactivity_reason`),
+    `is_unknown_type` = VALUES(`is_unknown_type`)
+"""
+
+UPSERT_FINGERPRINT_SQL = """
+    INSERT INTO `wptq_tripster_post_fingerprints` (`site_id`, `post_id`, `content_hash`, `links`)
+    VALUES (%(site_id)s, %(post_id)s, %(content_hash)s, %(links)s)
+    ON DUPLICATE KEY UPDATE
+    `content_hash` = VALUES(`content_hash`),
+    `links` = VALUES(`links`)
+"""
+
+SELECT_LINK_STATUSES_SQL = """
+    SELECT `post_id`, `link_type`, `exp_id`, `exp_url`, `exp_title`, `link_status`, `inactivity_reason`, `is_unknown_type`,
+    `previous_status`, `status_changed_at`
+    FROM `wptq_tripster_links`
+    WHERE `site_id` = %s AND `post_id` IN %s
+"""
+
+INSERT_JOURNAL_SQL = """
+    INSERT IGNORE INTO `wptq_tripster_run_journal` (`run_id`, `post_id`)
+    VALUES (%s, %s)
+"""
+
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 500))
+
+# Соединение PyMySQL нельзя использовать из нескольких потоков, поэтому у каждого потока свое
+_local = threading.local()
+
+# ID сайтов в таблице wptq_tripster_sites: {домен: site_id}
+_site_ids = {}
+_site_ids_lock = threading.Lock()
+
+
+def get_connection():
+    """
+    Возвращает соединение с БД, общее для всего запуска в текущем потоке.
+
+    Соединение открывается при первом обращении и переиспользуется последующими вызовами
+    из того же потока. Если соединение было разорвано сервером, оно восстанавливается.
+
+    Returns:
+        pymysql.Connection: Объект соединения с базой данных, или None в случае ошибки.
+    """
+    connection = getattr(_local, 'connection', None)
+    if connection is not None:
+        try:
+            connection.ping(reconnect=True)
+            return connection
+        except Exception as e:
+            logging.warning(f"Соединение с БД потеряно, переподключение: {e}")
+            _local.connection = None
+
+    _local.connection = connect()
+    return _local.connection
+
+
+def close_connection():
+    """Закрывает соединение с БД текущего потока, если оно открыто."""
+    connection = getattr(_local, 'connection', None)
+    if connection is not None:
+        try:
+            connection.close()
+            logging.info("Соединение с БД закрыто.")
+        except Exception as e:
+            logging.error(f"Ошибка при закрытии соединения с БД: {e}")
+        _local.connection = None
+
+
+def get_site_id(site=None):
+    """
+    Возвращает ID сайта в таблице wptq_tripster_sites, добавляя сайт при первом обращении.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Returns:
+        int: ID сайта или None в случае ошибки.
+    """
+    site = site or default_site()
+    with _site_ids_lock:
+        if site in _site_ids:
+            return _site_ids[site]
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT IGNORE INTO `wptq_tripster_sites` (`domain`) VALUES (%s)", (site,))
+            cursor.execute("SELECT `site_id` FROM `wptq_tripster_sites` WHERE `domain` = %s", (site,))
+            site_id = cursor.fetchone()['site_id']
+    except Exception as e:
+        logging.error(f"Ошибка при получении ID сайта {site}: {e}")
+        return None
+    with _site_ids_lock:
+        _site_ids[site] = site_id
+    return site_id
+
+
+def link_key(record):
+    """Возвращает ключ ссылки, соответствующий уникальному ключу unique_link таблицы ссылок."""
+    return str(record['post_id']), record['link_type'], record['exp_id'], record['exp_url']
+
+
+def with_status_history(record, stored):
+    """
+    Дополняет запись о ссылке историей статуса из прежней записи той же ссылки.
+
+    Если статус не изменился, сохраняются прежние previous_status и status_changed_at;
+    если изменился, прежний статус становится previous_status, а время изменения - текущим.
+    Для ссылки, которую не удалось проверить из-за ограничения запросов (статус UNCHECKED),
+    сохраняется прежний результат проверки.
+
+    Args:
+        record (dict): Запись о ссылке (формат build_tripster_record).
+        stored (dict): Прежняя запись ссылки из БД или None для новой ссылки.
+
+    Returns:
+        dict: Запись с полями previous_status и status_changed_at (None - текущее время сервера БД),
+              или None для непроверенной ссылки, которой еще нет в БД.
+    """
+    if record['link_status'] == UNCHECKED:
+        if stored is None:
+            return None
+        return dict(record, **{field: stored[field] for field in (
+            'exp_title', 'link_status', 'inactivity_reason', 'is_unknown_type', 'previous_status', 'status_changed_at'
+        )})
+    if stored is None:
+        return dict(record, previous_status=None, status_changed_at=None)
+    if stored['link_status'] == record['link_status']:
+        return dict(record, previous_status=stored['previous_status'], status_changed_at=stored['status_changed_at'])
+    return dict(record, previous_status=stored['link_status'], status_changed_at=None)
+
+
+def upsert_links(records, fingerprints=None, post_ids=None, run_id=None, site=None):
+    """
+    Вставляет или обновляет записи о ссылках одним многострочным запросом в одной транзакции.
 
+    Если переданы post_ids, прежние записи этих постов удаляются в той же транзакции,
+    поэтому пост всегда записывается целиком: без оставшихся от прошлой обработки
+    или наполовину записанных ссылок. История статуса (previous_status, status_changed_at)
+    переносится из удаляемых записей в новые записи тех же ссылок.
+
+    Args:
+        records (list): Список словарей с данными ссылок (формат build_tripster_record).
+        fingerprints (list, optional): Отпечатки контента постов {'post_id', 'content_hash', 'links'},
+            сохраняемые в той же транзакции.
+        post_ids (list, optional): ID постов, записи которых заменяются records.
+        run_id (str, optional): ID запуска; посты post_ids отмечаются в журнале запуска как обработанные.
+        site (str, optional): Домен сайта, к которому относятся посты. По умолчанию default_site().
+
+    Returns:
+        bool: True, если записи сохранены, False в случае ошибки.
+    """
+    if not records and not fingerprints and not post_ids:
+        return True
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД, выход.")
+        return False
+    site_id = get_site_id(site)
+    if site_id is None:
+        return False
+
+    started = time.perf_counter()
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            stored = {}
+            for i in range(0, len(post_ids or []), DB_BATCH_SIZE):
+                chunk = post_ids[i:i + DB_BATCH_SIZE]
+                cursor.execute(SELECT_LINK_STATUSES_SQL, (site_id, chunk))
+                stored.update((link_key(row), row) for row in cursor.fetchall())
+                cursor.execute("DELETE FROM `wptq_tripster_links` WHERE `site_id` = %s AND `post_id` IN %s", (site_id, chunk))
+            records = [with_status_history(record, stored.get(link_key(record))) for record in records]
+            records = [dict(record, site_id=site_id) for record in records if record is not None]
+            if records:
+                cursor.executemany(UPSERT_LINK_SQL, records)
+            if fingerprints:
+                cursor.executemany(UPSERT_FINGERPRINT_SQL, [dict(fingerprint, site_id=site_id) for fingerprint in fingerprints])
+            if run_id and post_ids:
+                cursor.executemany(INSERT_JOURNAL_SQL, [(run_id, post_id) for post_id in post_ids])
+        connection.commit()
+        metrics.observe('db_upsert_seconds', time.perf_counter() - started)
+        metrics.inc('db_rows_written_total', len(records))
+        logging.info(f"Сохранено записей в БД: {len(records)}")
+        return True
     except pymysql.err.IntegrityError as e:
+        metrics.inc('db_errors_total')
         logging.error(f"Ошибка IntegrityError: {e}")
-        if connection:
-            connection.rollback() # Откатываем транзакцию при ошибке
+        connection.rollback()  # Откатываем транзакцию при ошибке
+        return False
     except Exception as e:
+        metrics.inc('db_errors_total')
         logging.error(f"Ошибка при вставке/обновлении данных: {e}")
         logging.error(traceback.format_exc())
-        if connection:
+        try:
             connection.rollback()
-    finally:
-        if connection:
-            connection.close()
-            logging.info("Соединение с БД закрыто.")
+        except Exception:
+            pass
+        return False
+
+
+class LinkWriter:
+    """
+    Буферизует записи о ссылках и сохраняет их пакетами через upsert_links.
+
+    Записи добавляются целыми постами, поэтому пакет никогда не содержит часть поста:
+    прежние записи постов пакета заменяются новыми в одной транзакции, и в той же транзакции
+    посты отмечаются в журнале запуска run_id. Пакет записывается, когда в буфере набирается
+    не меньше batch_size записей, а также при выходе из контекстного менеджера.
+    Все записи относятся к одному сайту site (по умолчанию default_site()).
+
+    Если пакет записать не удалось, его посты не отмечаются в журнале запуска и учитываются
+    в failed_posts: вызывающий код не должен завершать запуск, пока failed_posts не равно 0.
+    """
+
+    def __init__(self, batch_size=DB_BATCH_SIZE, run_id=None, site=None):
+        self.batch_size = batch_size
+        self.run_id = run_id
+        self.site = site
+        self.buffer = []
+        self.fingerprints = []
+        self.post_ids = []
+        self.failed_posts = 0
+
+    def add_post(self, records, fingerprint=None, post_id=None):
+        """
+        Добавляет записи одного поста и записывает буфер, если он заполнен.
+
+        Args:
+            records (list): Записи о ссылках поста.
+            fingerprint (dict, optional): Отпечаток контента поста {'post_id', 'content_hash', 'links'}.
+            post_id (str, optional): ID поста. По умолчанию берется из отпечатка.
+        """
+        self.buffer.extend(records)
+        if fingerprint:
+            self.fingerprints.append(fingerprint)
+        post_id = post_id if post_id is not None else (fingerprint or {}).get('post_id')
+        if post_id is not None:
+            self.post_ids.append(str(post_id))
+        if len(self.buffer) + len(self.fingerprints) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные записи в БД."""
+        if self.buffer or self.fingerprints or self.post_ids:
+            if not upsert_links(self.buffer, self.fingerprints, self.post_ids, self.run_id, self.site):
+                self.failed_posts += len(self.post_ids)
+                metrics.inc('db_write_failed_posts_total', len(self.post_ids))
+                logging.error(f"Не удалось записать пакет ссылок, постов в пакете: {len(self.post_ids)}.")
+            self.buffer = []
+            self.fingerprints = []
+            self.post_ids = []
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_value, tb):
+        self.flush()
+        close_connection()
+        return False
 
-def analyze_database():
+
+def get_post_fingerprints(post_ids, site=None):
     """
-    Analyzes the database to identify inactive Tripster widgets and deeplinks.
+    Возвращает сохраненные отпечатки контента постов.
+
+    Args:
+        post_ids (iterable): ID постов.
+        site (str, optional): Домен сайта. По умолчанию default_site().
 
     Returns:
-        list: A list of dictionaries, where each dictionary represents an inactive
-              widget or deeplink with its details.
+        dict: Словарь {post_id (str): (content_hash, links)}, где links - словарь
+              {'widgets': [...], 'deeplinks': [...]} со ссылками, найденными в контенте.
     """
-    connection = None
+    ids = [str(post_id) for post_id in post_ids]
+    if not ids:
+        return {}
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return {}
+    site_id = get_site_id(site)
+    if site_id is None:
+        return {}
+
+    fingerprints = {}
     try:
-        connection = connect()
-        if connection is None:
-            logging.error("Не удалось установить соединение с БД.")
-            return []
+        with metrics.timer('db_query_seconds', {'query': 'post_fingerprints'}), connection.cursor() as cursor:
+            for i in range(0, len(ids), DB_BATCH_SIZE):
+                cursor.execute(
+                    "SELECT `post_id`, `content_hash`, `links` FROM `wptq_tripster_post_fingerprints` "
+                    "WHERE `site_id` = %s AND `post_id` IN %s",
+                    (site_id, ids[i:i + DB_BATCH_SIZE])
+                )
+                for row in cursor.fetchall():
+                    fingerprints[row['post_id']] = (row['content_hash'], json.loads(row['links']))
+    except Exception as e:
+        logging.error(f"Ошибка при чтении отпечатков постов: {e}")
+        return {}
+    return fingerprints
+
+
+def iter_stored_posts(site=None):
+    """
+    Построчно возвращает сохраненные посты сайта со ссылками Tripster, найденными при их последней обработке.
+
+    Используется при инкрементальном обходе, чтобы перепроверить статусы ссылок постов,
+    которые не изменились и поэтому не попали в список постов.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Yields:
+        dict: {'id', 'title', 'fingerprint'}, где fingerprint - отпечаток {'post_id', 'content_hash', 'links'}
+              в формате LinkWriter.add_post; посты без ссылок пропускаются.
+    """
+    site_id = get_site_id(site)
+    if site_id is None:
+        return
+    rows = iter_rows(
+        "SELECT `f`.`post_id`, `f`.`content_hash`, `f`.`links`, ("
+        "SELECT `l`.`post_title` FROM `wptq_tripster_links` AS `l` "
+        "WHERE `l`.`site_id` = `f`.`site_id` AND `l`.`post_id` = `f`.`post_id` LIMIT 1) AS `post_title` "
+        "FROM `wptq_tripster_post_fingerprints` AS `f` WHERE `f`.`site_id` = %s",
+        (site_id,)
+    )
+    for row in rows:
+        links = json.loads(row['links'])
+        if not links.get('widgets') and not links.get('deeplinks'):
+            continue
+        yield {
+            'id': row['post_id'],
+            'title': row['post_title'] or '',
+            'fingerprint': {'post_id': row['post_id'], 'content_hash': row['content_hash'], 'links': row['links']},
+        }
+
 
+def get_finished_posts(run_id):
+    """
+    Возвращает посты, уже обработанные в запуске run_id.
+
+    Args:
+        run_id (str): ID запуска.
+
+    Returns:
+        set: ID обработанных постов (str).
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return set()
+
+    try:
         with connection.cursor() as cursor:
-            sql = """
-                SELECT 
-                    id, post_id, post_title, link_type, exp_id, exp_title, exp_url, link_status, inactivity_reason
-                FROM 
-                    wptq_tripster_links
-                WHERE 
-                    link_status = 'inactive'
-            """
-            cursor.execute(sql)
-            inactive_items = cursor.fetchall()
-            logging.info(f"Найдено {len(inactive_items)} неактивных элементов.")
-            return inactive_items
-    except pymysql.MySQLError as e:
-        logging.error(f"Ошибка при анализе базы данных: {e}")
+            cursor.execute("SELECT `post_id` FROM `wptq_tripster_run_journal` WHERE `run_id` = %s", (run_id,))
+            return {row['post_id'] for row in cursor.fetchall()}
+    except Exception as e:
+        logging.error(f"Ошибка при чтении журнала запуска {run_id}: {e}")
+        return set()
+
+
+def clear_run_journal(run_id):
+    """
+    Удаляет журнал завершенного запуска.
+
+    Args:
+        run_id (str): ID запуска.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM `wptq_tripster_run_journal` WHERE `run_id` = %s", (run_id,))
+    except Exception as e:
+        logging.error(f"Ошибка при удалении журнала запуска {run_id}: {e}")
+
+
+def enqueue_posts(run_id, posts):
+    """
+    Добавляет посты в очередь работ запуска. Посты, уже добавленные в очередь запуска, не изменяются.
+
+    Args:
+        run_id (str): ID запуска.
+        posts (list): Записи о постах {'order', 'id', 'title', 'content'}.
+
+    Returns:
+        bool: True, если посты добавлены, False в случае ошибки.
+    """
+    rows = [(run_id, str(post['id']), post['order'], post['title'], post['content']) for post in posts if post.get('id')]
+    if not rows:
+        return True
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return False
+
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            for i in range(0, len(rows), DB_BATCH_SIZE):
+                cursor.executemany(
+                    "INSERT IGNORE INTO `wptq_tripster_work_queue` (`run_id`, `post_id`, `post_order`, `post_title`, `content`) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    rows[i:i + DB_BATCH_SIZE]
+                )
+        connection.commit()
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка при добавлении постов в очередь запуска {run_id}: {e}")
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        return False
+
+
+def lease_work(run_id, owner, batch_size, lease_seconds, max_attempts):
+    """
+    Берет в работу пакет постов из очереди запуска.
+
+    Пакет составляют ожидающие посты и посты с истекшей арендой, которые еще не исчерпали
+    max_attempts попыток. Аренда выполняется одним запросом UPDATE, поэтому один пост
+    не может одновременно достаться двум обработчикам.
+
+    Args:
+        run_id (str): ID запуска.
+        owner (str): Имя обработчика (хост и PID).
+        batch_size (int): Максимальное количество постов в пакете.
+        lease_seconds (int): Срок аренды в секундах.
+        max_attempts (int): Максимальное количество попыток обработки поста.
+
+    Returns:
+        tuple: (lease_token, posts) - токен аренды и список записей {'order', 'id', 'title', 'content'};
+               (None, []), если свободных постов нет или произошла ошибка.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None, []
+
+    token = uuid.uuid4().hex
+    try:
+        with connection.cursor() as cursor:
+            leased = cursor.execute(
+                "UPDATE `wptq_tripster_work_queue` "
+                "SET `status` = 'leased', `lease_owner` = %s, `lease_token` = %s, "
+                "`lease_expires_at` = NOW() + INTERVAL %s SECOND, `attempts` = `attempts` + 1 "
+                "WHERE `run_id` = %s AND `attempts` < %s "
+                "AND (`status` = 'pending' OR (`status` = 'leased' AND `lease_expires_at` < NOW())) "
+                "ORDER BY `post_order` LIMIT %s",
+                (owner, token, lease_seconds, run_id, max_attempts, batch_size)
+            )
+            if not leased:
+                return None, []
+            cursor.execute(
+                "SELECT `post_id`, `post_order`, `post_title`, `content` FROM `wptq_tripster_work_queue` "
+                "WHERE `lease_token` = %s ORDER BY `post_order`",
+                (token,)
+            )
+            posts = [{'order': row['post_order'], 'id': row['post_id'], 'title': row['post_title'], 'content': row['content']}
+                     for row in cursor.fetchall()]
+        return token, posts
+    except Exception as e:
+        logging.error(f"Ошибка при получении пакета постов из очереди запуска {run_id}: {e}")
+        return None, []
+
+
+def extend_lease(lease_token, lease_seconds):
+    """
+    Продлевает аренду пакета постов.
+
+    Args:
+        lease_token (str): Токен аренды.
+        lease_seconds (int): Новый срок аренды в секундах, начиная с текущего момента.
+
+    Returns:
+        bool: True, если аренда продлена; False, если она уже истекла и передана другому обработчику.
+    """
+    connection = get_connection()
+    if connection is None:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            return bool(cursor.execute(
+                "UPDATE `wptq_tripster_work_queue` SET `lease_expires_at` = NOW() + INTERVAL %s SECOND "
+                "WHERE `lease_token` = %s AND `status` = 'leased'",
+                (lease_seconds, lease_token)
+            ))
+    except Exception as e:
+        logging.error(f"Ошибка при продлении аренды {lease_token}: {e}")
+        return False
+
+
+def complete_work(lease_token):
+    """
+    Отмечает арендованный пакет постов обработанным.
+
+    Args:
+        lease_token (str): Токен аренды.
+
+    Returns:
+        int: Количество отмеченных постов (0, если аренда уже передана другому обработчику).
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return 0
+    try:
+        with connection.cursor() as cursor:
+            return cursor.execute(
+                "UPDATE `wptq_tripster_work_queue` SET `status` = 'done', `content` = NULL "
+                "WHERE `lease_token` = %s AND `status` = 'leased'",
+                (lease_token,)
+            )
+    except Exception as e:
+        logging.error(f"Ошибка при завершении аренды {lease_token}: {e}")
+        return 0
+
+
+def release_work(lease_token, post_ids):
+    """
+    Возвращает в очередь посты арендованного пакета, которые не удалось обработать.
+
+    Посты снова становятся ожидающими и достанутся следующему обработчику, пока не исчерпают
+    попытки (счетчик attempts увеличивается при каждой аренде).
+
+    Args:
+        lease_token (str): Токен аренды.
+        post_ids (iterable): ID постов пакета.
+
+    Returns:
+        int: Количество возвращенных постов (0, если аренда уже передана другому обработчику).
+    """
+    ids = [str(post_id) for post_id in post_ids]
+    if not ids:
+        return 0
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return 0
+    try:
+        with connection.cursor() as cursor:
+            return cursor.execute(
+                "UPDATE `wptq_tripster_work_queue` "
+                "SET `status` = 'pending', `lease_owner` = NULL, `lease_token` = NULL, `lease_expires_at` = NULL "
+                "WHERE `lease_token` = %s AND `status` = 'leased' AND `post_id` IN %s",
+                (lease_token, ids)
+            )
+    except Exception as e:
+        logging.error(f"Ошибка при возврате постов аренды {lease_token} в очередь: {e}")
+        return 0
+
+
+def retry_failed_work(run_id, max_attempts):
+    """
+    Сбрасывает счетчик попыток постов, исчерпавших попытки в прерванном запуске.
+
+    Вызывается при продолжении запуска, чтобы такие посты снова были обработаны. Посты
+    с действующей арендой не изменяются.
+
+    Args:
+        run_id (str): ID запуска.
+        max_attempts (int): Максимальное количество попыток обработки поста.
+
+    Returns:
+        int: Количество постов, возвращенных в очередь.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return 0
+    try:
+        with connection.cursor() as cursor:
+            return cursor.execute(
+                "UPDATE `wptq_tripster_work_queue` "
+                "SET `status` = 'pending', `attempts` = 0, `lease_owner` = NULL, `lease_token` = NULL, "
+                "`lease_expires_at` = NULL "
+                "WHERE `run_id` = %s AND `attempts` >= %s "
+                "AND (`status` = 'pending' OR (`status` = 'leased' AND `lease_expires_at` < NOW()))",
+                (run_id, max_attempts)
+            )
+    except Exception as e:
+        logging.error(f"Ошибка при возврате в очередь постов запуска {run_id}: {e}")
+        return 0
+
+
+def get_work_progress(run_id, max_attempts):
+    """
+    Возвращает состояние очереди работ запуска.
+
+    Args:
+        run_id (str): ID запуска.
+        max_attempts (int): Максимальное количество попыток обработки поста.
+
+    Returns:
+        dict: {'total', 'done', 'pending', 'leased', 'failed'}, где pending - посты, которые еще
+              можно взять в работу, leased - посты с действующей арендой, failed - посты,
+              исчерпавшие попытки. None в случае ошибки.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+
+    progress = {'total': 0, 'done': 0, 'pending': 0, 'leased': 0, 'failed': 0}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT `status`, `attempts` >= %s AS `exhausted`, "
+                "(`lease_expires_at` IS NOT NULL AND `lease_expires_at` < NOW()) AS `expired`, COUNT(*) AS `posts` "
+                "FROM `wptq_tripster_work_queue` WHERE `run_id` = %s GROUP BY 1, 2, 3",
+                (max_attempts, run_id)
+            )
+            for row in cursor.fetchall():
+                posts = row['posts']
+                progress['total'] += posts
+                if row['status'] == 'done':
+                    progress['done'] += posts
+                elif row['status'] == 'leased' and not row['expired']:
+                    progress['leased'] += posts
+                elif row['exhausted']:
+                    progress['failed'] += posts
+                else:
+                    progress['pending'] += posts
+        return progress
+    except Exception as e:
+        logging.error(f"Ошибка при чтении состояния очереди запуска {run_id}: {e}")
+        return None
+
+
+def get_active_work_run():
+    """
+    Возвращает ID последнего запуска, в очереди которого есть необработанные посты.
+
+    Returns:
+        str: ID запуска или None.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT `run_id` FROM `wptq_tripster_work_queue` WHERE `status` <> 'done' "
+                "ORDER BY `created_at` DESC LIMIT 1"
+            )
+            row = cursor.fetchone()
+            return row['run_id'] if row else None
+    except Exception as e:
+        logging.error(f"Ошибка при поиске активного запуска в очереди: {e}")
+        return None
+
+
+def delete_work(run_id):
+    """
+    Удаляет очередь работ завершенного запуска.
+
+    Args:
+        run_id (str): ID запуска.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM `wptq_tripster_work_queue` WHERE `run_id` = %s", (run_id,))
+    except Exception as e:
+        logging.error(f"Ошибка при удалении очереди запуска {run_id}: {e}")
+
+
+def delete_links_of_missing_posts(existing_post_ids, site=None):
+    """
+    Удаляет записи о ссылках постов, которых больше нет на сайте.
+
+    Args:
+        existing_post_ids (iterable): ID всех постов, полученных при полном обходе сайта.
+        site (str, optional): Домен сайта. По умолчанию default_site().
+
+    Returns:
+        int: Количество удаленных записей.
+    """
+    existing = {str(post_id) for post_id in existing_post_ids}
+    if not existing:
+        logging.warning("Список постов пуст, удаление записей пропущено.")
+        return 0
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return 0
+    site_id = get_site_id(site)
+    if site_id is None:
+        return 0
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT `post_id` FROM `wptq_tripster_links` WHERE `site_id` = %s", (site_id,))
+            missing = [row['post_id'] for row in cursor.fetchall() if row['post_id'] not in existing]
+
+            deleted = 0
+            connection.begin()
+            for i in range(0, len(missing), DB_BATCH_SIZE):
+                chunk = missing[i:i + DB_BATCH_SIZE]
+                deleted += cursor.execute(
+                    "DELETE FROM `wptq_tripster_links` WHERE `site_id` = %s AND `post_id` IN %s", (site_id, chunk)
+                )
+                cursor.execute(
+                    "DELETE FROM `wptq_tripster_post_fingerprints` WHERE `site_id` = %s AND `post_id` IN %s", (site_id, chunk)
+                )
+            connection.commit()
+
+        if missing:
+            logging.info(f"Удалено {deleted} записей для {len(missing)} удаленных постов.")
+        return deleted
+    except Exception as e:
+        logging.error(f"Ошибка при удалении записей удаленных постов: {e}")
         logging.error(traceback.format_exc())
-        return []
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        return 0
+
+
+def register_run(run_id, site=None):
+    """
+    Отмечает начало запуска в таблице запусков. Время начала продолжаемого запуска не изменяется.
+
+    Args:
+        run_id (str): ID запуска.
+        site (str, optional): Домен сайта, посты которого обрабатывает запуск. По умолчанию default_site().
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT IGNORE INTO `wptq_tripster_runs` (`run_id`, `site`) VALUES (%s, %s)",
+                           (run_id, site or default_site()))
+    except Exception as e:
+        logging.error(f"Ошибка при регистрации запуска {run_id}: {e}")
+
+
+def get_run_site(run_id):
+    """
+    Возвращает домен сайта, посты которого обрабатывает запуск.
+
+    Args:
+        run_id (str): ID запуска.
+
+    Returns:
+        str: Домен сайта или None, если запуск не найден или зарегистрирован без сайта.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT `site` FROM `wptq_tripster_runs` WHERE `run_id` = %s", (run_id,))
+            row = cursor.fetchone()
+            return row['site'] if row else None
+    except Exception as e:
+        logging.error(f"Ошибка при чтении сайта запуска {run_id}: {e}")
+        return None
+
+
+def complete_run(run_id):
+    """
+    Отмечает запуск завершенным в таблице запусков.
+
+    Args:
+        run_id (str): ID запуска.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE `wptq_tripster_runs` SET `finished_at` = NOW() WHERE `run_id` = %s", (run_id,))
+    except Exception as e:
+        logging.error(f"Ошибка при завершении запуска {run_id}: {e}")
+
+
+def get_run_started_at(run_id=None):
+    """
+    Возвращает время начала запуска.
+
+    Args:
+        run_id (str, optional): ID запуска. По умолчанию - последний начатый запуск; если сайтов
+            несколько, берется самый ранний из последних запусков сайтов, чтобы охватить запуски всех сайтов.
+
+    Returns:
+        datetime: Время начала запуска или None, если запуск не найден.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+    try:
+        with connection.cursor() as cursor:
+            if run_id:
+                cursor.execute("SELECT `started_at` FROM `wptq_tripster_runs` WHERE `run_id` = %s", (run_id,))
+            else:
+                cursor.execute(
+                    "SELECT MIN(`started_at`) AS `started_at` FROM ("
+                    "SELECT MAX(`started_at`) AS `started_at` FROM `wptq_tripster_runs` GROUP BY `site`) AS `latest`"
+                )
+            row = cursor.fetchone()
+            return row['started_at'] if row else None
     except Exception as e:
-        logging.error(f"Непредвиденная ошибка при анализе базы данных: {e}")
+        logging.error(f"Ошибка при чтении времени начала запуска {run_id}: {e}")
+        return None
+
+
+def iter_rows(sql, params=None):
+    """
+    Построчно читает результат запроса курсором на стороне сервера (SSDictCursor).
+
+    Строки не загружаются в память целиком, поэтому запрос выполняется в отдельном соединении:
+    пока результат не прочитан до конца, другие запросы в этом соединении выполнять нельзя.
+
+    Args:
+        sql (str): SQL-запрос.
+        params (tuple, optional): Параметры запроса.
+
+    Yields:
+        dict: Строки результата.
+    """
+    connection = connect()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return
+    try:
+        with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield row
+    except pymysql.MySQLError as e:
+        logging.error(f"Ошибка при чтении данных из БД: {e}")
         logging.error(traceback.format_exc())
-        return []
     finally:
-        if connection:
-            connection.close()
-            logging.info("Соединение с БД закрыто.")
\ No newline at end of file
+        connection.close()
+
+
+LINK_COLUMNS_SQL = """
+    `id`, `domain` AS `site`, `post_id`, `post_title`, `link_type`, `exp_id`, `exp_title`, `exp_url`, `link_status`,
+    `inactivity_reason`, `previous_status`, `status_changed_at`
+"""
+# Таблица ссылок с доменами сайтов (для отчетов)
+LINKS_FROM_SQL = "`wptq_tripster_links` LEFT JOIN `wptq_tripster_sites` USING (`site_id`)"
+
+
+def iter_inactive_links():
+    """
+    Построчно возвращает все неактивные виджеты и диплинки, сгруппированные по сайтам
+    (по индексу idx_links_site_status).
+
+    Yields:
+        dict: Запись о неактивной ссылке.
+    """
+    yield from iter_rows(
+        f"SELECT {LINK_COLUMNS_SQL} FROM {LINKS_FROM_SQL} WHERE `link_status` = 'inactive' "
+        "ORDER BY `site_id`, `status_changed_at`"
+    )
+
+
+def count_inactive_links():
+    """
+    Возвращает количество неактивных виджетов и диплинков (по индексу idx_links_status).
+
+    Returns:
+        int: Количество неактивных ссылок или None в случае ошибки.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS `total` FROM `wptq_tripster_links` WHERE `link_status` = 'inactive'")
+            return cursor.fetchone()['total']
+    except Exception as e:
+        logging.error(f"Ошибка при подсчете неактивных ссылок: {e}")
+        return None
+
+
+def get_server_time():
+    """
+    Возвращает текущее время сервера БД, в котором записывается status_changed_at.
+
+    Returns:
+        datetime: Время сервера БД или None в случае ошибки.
+    """
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT NOW() AS `now`")
+            return cursor.fetchone()['now']
+    except Exception as e:
+        logging.error(f"Ошибка при чтении времени сервера БД: {e}")
+        return None
+
+
+def _iter_status_changes(link_status, previous_status, since_run_id, since=None, include_new=False):
+    """
+    Построчно возвращает ссылки, перешедшие из previous_status в link_status после момента since
+    (по умолчанию - начала запуска since_run_id); при include_new - также ссылки, впервые
+    сохраненные в статусе link_status.
+    """
+    since = since or get_run_started_at(since_run_id)
+    if since is None:
+        logging.warning(f"Запуск {since_run_id or '(последний)'} не найден, изменения статусов не определены.")
+        return
+    new_links = " OR `previous_status` IS NULL" if include_new else ""
+    yield from iter_rows(
+        f"SELECT {LINK_COLUMNS_SQL} FROM {LINKS_FROM_SQL} "
+        f"WHERE `link_status` = %s AND `status_changed_at` >= %s AND (`previous_status` = %s{new_links}) "
+        "ORDER BY `status_changed_at`",
+        (link_status, since, previous_status)
+    )
+
+
+def iter_newly_inactive(since_run_id=None, since=None):
+    """
+    Построчно возвращает ссылки, ставшие неактивными после начала запуска, включая новые неактивные ссылки.
+
+    Args:
+        since_run_id (str, optional): ID запуска. По умолчанию - последний начатый запуск.
+        since (datetime, optional): Момент времени сервера БД, используемый вместо начала запуска.
+
+    Yields:
+        dict: Запись о ссылке.
+    """
+    yield from _iter_status_changes('inactive', 'active', since_run_id, since, include_new=True)
+
+
+def iter_recovered(since_run_id=None, since=None):
+    """
+    Построчно возвращает ссылки, которые были неактивными и снова стали активными после начала запуска.
+
+    Args:
+        since_run_id (str, optional): ID запуска. По умолчанию - последний начатый запуск.
+        since (datetime, optional): Момент времени сервера БД, используемый вместо начала запуска.
+
+    Yields:
+        dict: Запись о ссылке.
+    """
+    yield from _iter_status_changes('active', 'inactive', since_run_id, since)
+
+
+def analyze_database(run_started_at):
+    """
+    Подсчитывает ссылки, ставшие неактивными, и ссылки, снова ставшие активными, после начала запуска.
+
+    Оба количества вычисляются одним агрегирующим запросом по индексу idx_links_status
+    (link_status, status_changed_at): читаются только ссылки, статус которых изменился после
+    run_started_at. Новые неактивные ссылки считаются ставшими неактивными.
+
+    Args:
+        run_started_at (datetime): Время начала запуска (get_run_started_at).
+
+    Returns:
+        tuple: (newly_inactive, recovered) - количество ставших неактивными и восстановившихся ссылок,
+               или None, если время начала запуска не задано или произошла ошибка.
+    """
+    if run_started_at is None:
+        logging.warning("Время начала запуска не найдено, изменения статусов не определены.")
+        return None
+
+    connection = get_connection()
+    if connection is None:
+        logging.error("Не удалось установить соединение с БД.")
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT "
+                "COALESCE(SUM(`link_status` = 'inactive' AND (`previous_status` = 'active' OR `previous_status` IS NULL)), 0) "
+                "AS `newly_inactive`, "
+                "COALESCE(SUM(`link_status` = 'active' AND `previous_status` = 'inactive'), 0) AS `recovered` "
+                "FROM `wptq_tripster_links` "
+                "WHERE `link_status` IN ('active', 'inactive') AND `status_changed_at` >= %s",
+                (run_started_at,)
+            )
+            row = cursor.fetchone()
+        newly_inactive, recovered = int(row['newly_inactive']), int(row['recovered'])
+        logging.info(f"С начала запуска стали неактивными: {newly_inactive}, восстановились: {recovered}.")
+        return newly_inactive, recovered
+    except Exception as e:
+        logging.error(f"Ошибка при подсчете изменений статусов ссылок: {e}")
+        return None
@@ -1,5 +1,12 @@
-CREATE TABLE `wptq_tripster_links` (
+CREATE TABLE IF NOT EXISTS `wptq_tripster_sites` (
+  `site_id` SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+  `domain` VARCHAR(255) NOT NULL,
+  UNIQUE KEY `unique_site_domain` (`domain`)
+);
+
+CREATE TABLE IF NOT EXISTS `wptq_tripster_links` (
   `id` INT AUTO_INCREMENT PRIMARY KEY,
+  `site_id` SMALLINT UNSIGNED NOT NULL DEFAULT 0,
   `post_id` VARCHAR(255) NOT NULL,
   `post_title` VARCHAR(255) NOT NULL,
   `link_type` ENUM('widget', 'deeplink') NOT NULL,
@@ -9,5 +16,50 @@ CREATE TABLE `wptq_tripster_links` (
   `link_status` ENUM('active', 'inactive') NOT NULL,
   `inactivity_reason` VARCHAR(255) NULL,
   `is_unknown_type` BOOLEAN NOT NULL DEFAULT FALSE,
-  UNIQUE KEY `unique_link` (`post_id`, `link_type`, `exp_id`, `exp_url`)
-);
\ No newline at end of file
+  `previous_status` ENUM('active', 'inactive') NULL,
+  `status_changed_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY `unique_link` (`site_id`, `post_id`, `link_type`, `exp_id`, `exp_url`),
+  KEY `idx_links_status` (`link_status`, `status_changed_at`),
+  KEY `idx_links_site_status` (`link_status`, `site_id`, `status_changed_at`)
+);
+
+CREATE TABLE IF NOT EXISTS `wptq_tripster_post_fingerprints` (
+  `site_id` SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+  `post_id` VARCHAR(255) NOT NULL,
+  `content_hash` CHAR(64) NOT NULL,
+  `links` MEDIUMTEXT NOT NULL,
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`site_id`, `post_id`)
+);
+
+CREATE TABLE IF NOT EXISTS `wptq_tripster_run_journal` (
+  `run_id` VARCHAR(64) NOT NULL,
+  `post_id` VARCHAR(255) NOT NULL,
+  `finished_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`run_id`, `post_id`)
+);
+
+CREATE TABLE IF NOT EXISTS `wptq_tripster_work_queue` (
+  `run_id` VARCHAR(64) NOT NULL,
+  `post_id` VARCHAR(255) NOT NULL,
+  `post_order` INT NOT NULL,
+  `post_title` VARCHAR(255) NULL,
+  `content` MEDIUMTEXT NULL,
+  `status` ENUM('pending', 'leased', 'done') NOT NULL DEFAULT 'pending',
+  `lease_owner` VARCHAR(255) NULL,
+  `lease_token` CHAR(32) NULL,
+  `lease_expires_at` TIMESTAMP NULL,
+  `attempts` INT NOT NULL DEFAULT 0,
+  `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`run_id`, `post_id`),
+  KEY `idx_work_queue_status` (`run_id`, `status`, `post_order`),
+  KEY `idx_work_queue_lease_token` (`lease_token`)
+);
+
+CREATE TABLE IF NOT EXISTS `wptq_tripster_runs` (
+  `run_id` VARCHAR(64) NOT NULL PRIMARY KEY,
+  `site` VARCHAR(255) NULL,
+  `started_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `finished_at` TIMESTAMP NULL,
+  KEY `idx_runs_started_at` (`started_at`)
+);
@@ -0,0 +1,16 @@
+-- Добавляет сайт в таблицы ссылок, отпечатков и запусков, созданные до поддержки нескольких сайтов.
+-- Выполняется один раз после db_migrate_status_tracking.sql; таблица wptq_tripster_sites создается db_create_tables.sql.
+-- Существующие записи привязываются к сайту по умолчанию. Перед выполнением задайте его домен
+-- (DOMAIN_TO_CHECK или первый сайт из SITES_FILE) в переменной @default_site, например:
+--   mysql -u user -p database -e "SET @default_site = 'your-site.com'; SOURCE db/sql/db_migrate_multi_site.sql;"
+-- Если переменная не задана, первый запрос завершается ошибкой и таблицы не изменяются.
+INSERT INTO `wptq_tripster_sites` (`domain`) VALUES (@default_site) ON DUPLICATE KEY UPDATE `domain` = `domain`;
+ALTER TABLE `wptq_tripster_links` ADD COLUMN `site_id` SMALLINT UNSIGNED NOT NULL DEFAULT 0 AFTER `id`;
+ALTER TABLE `wptq_tripster_links` DROP INDEX `unique_link`, ADD UNIQUE KEY `unique_link` (`site_id`, `post_id`, `link_type`, `exp_id`, `exp_url`);
+ALTER TABLE `wptq_tripster_links` ADD KEY `idx_links_site_status` (`link_status`, `site_id`, `status_changed_at`);
+ALTER TABLE `wptq_tripster_post_fingerprints` ADD COLUMN `site_id` SMALLINT UNSIGNED NOT NULL DEFAULT 0 FIRST;
+ALTER TABLE `wptq_tripster_post_fingerprints` DROP PRIMARY KEY, ADD PRIMARY KEY (`site_id`, `post_id`);
+ALTER TABLE `wptq_tripster_runs` ADD COLUMN `site` VARCHAR(255) NULL AFTER `run_id`;
+UPDATE `wptq_tripster_links` SET `site_id` = (SELECT `site_id` FROM `wptq_tripster_sites` WHERE `domain` = @default_site) WHERE `site_id` = 0;
+UPDATE `wptq_tripster_post_fingerprints` SET `site_id` = (SELECT `site_id` FROM `wptq_tripster_sites` WHERE `domain` = @default_site) WHERE `site_id` = 0;
+UPDATE `wptq_tripster_runs` SET `site` = @default_site WHERE `site` IS NULL;
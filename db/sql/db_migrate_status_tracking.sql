@@ -0,0 +1,5 @@
+-- Добавляет отслеживание изменений статуса в таблицу ссылок, созданную до появления этих столбцов.
+-- Выполняется один раз; таблица wptq_tripster_runs создается db_create_tables.sql.
+ALTER TABLE `wptq_tripster_links` ADD COLUMN `previous_status` ENUM('active', 'inactive') NULL AFTER `is_unknown_type`;
+ALTER TABLE `wptq_tripster_links` ADD COLUMN `status_changed_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP AFTER `previous_status`;
+ALTER TABLE `wptq_tripster_links` ADD KEY `idx_links_status` (`link_status`, `status_changed_at`);
@@ -1,8 +1,8 @@
-import subprocess
 import logging
 import os
 import sys
 import asyncio
+import itertools
 
 # Добавляем путь к корневой директории проекта
 PROJECT_ROOT = os.getenv("PROJECT_ROOT")
@@ -10,46 +10,117 @@ if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
 from db import db  # Импортируем модуль db
+from scripts import link_pipeline  # Конвейер обработки постов
+from scripts import work_queue  # Распределенная обработка постов через очередь работ
 from report import report_generator # Импортируем модуль report_generator
+from report import report_state  # Отпечаток последнего отправленного отчета
 from notifications import telegram_notifier # Import the telegram_notifier
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+DISTRIBUTED_SWEEP = os.getenv("DISTRIBUTED_SWEEP", "false").lower() == "true"
+REPORT_DELTA_FILENAME = "tripster_report_delta.pdf"
+
+
+def collect_changes(since, limit):
+    """
+    Возвращает ссылки, ставшие неактивными или снова активными после since, но не больше limit + 1.
+
+    Args:
+        since (datetime): Время сервера БД, на которое составлен предыдущий отчет.
+        limit (int): Максимальное количество изменений для отчета об изменениях.
+
+    Returns:
+        tuple: (changes, recovered) - строки отчета об изменениях и количество восстановившихся ссылок среди них.
+    """
+    changes = list(itertools.islice(db.iter_newly_inactive(since=since), limit + 1))
+    recovered = 0
+    if len(changes) <= limit:
+        for item in itertools.islice(db.iter_recovered(since=since), limit + 1 - len(changes)):
+            changes.append(dict(item, inactivity_reason="Снова активна"))
+            recovered += 1
+    return changes, recovered
+
+
+async def report_inactive_items(reported_at):
+    """
+    Генерирует и отправляет отчет, если набор неактивных ссылок изменился с последнего отчета.
+
+    Если отпечаток набора совпадает с сохраненным, отчет не генерируется, а в Telegram
+    отправляется короткое сообщение. Если изменилось не больше REPORT_DELTA_MAX_CHANGES
+    ссылок, отправляется отчет только об изменениях.
+
+    Args:
+        reported_at (datetime): Время сервера БД перед анализом; сохраняется как время отчета.
+    """
+    fingerprint, inactive_count = report_state.inactive_fingerprint(db.iter_inactive_links())
+    state = report_state.load_report_state()
+
+    if state.get('fingerprint') == fingerprint:
+        logging.info("Набор неактивных элементов не изменился, генерация и отправка отчета пропущены.")
+        if inactive_count:
+            await telegram_notifier.send_telegram_notification(
+                summary=f"Изменений нет: неактивных элементов по-прежнему {inactive_count}."
+            )
+        return
+
+    if not inactive_count:
+        logging.info("Неактивные элементы не найдены.")
+        report_state.save_report_state(fingerprint, inactive_count, reported_at)
+        return
+
+    logging.info(f"Найдено {inactive_count} неактивных элементов.")
+    changes, recovered = [], 0
+    previous = report_state.reported_at(state)
+    if previous and report_state.REPORT_DELTA_MAX_CHANGES:
+        changes, recovered = collect_changes(previous, report_state.REPORT_DELTA_MAX_CHANGES)
+
+    # Генерируем отчет
+    if changes and len(changes) <= report_state.REPORT_DELTA_MAX_CHANGES:
+        logging.info(f"Генерация отчета об изменениях: {len(changes)} элементов...")
+        report_paths = report_generator.generate_report(changes, REPORT_DELTA_FILENAME, total=len(changes))
+        summary = (f"Стали неактивными: {len(changes) - recovered}, снова активны: {recovered}. "
+                   f"Всего неактивных элементов: {inactive_count}. Отчет об изменениях прилагается.")
+    else:
+        logging.info("Генерация отчета...")
+        report_paths = report_generator.generate_report(db.iter_inactive_links, total=inactive_count)
+        summary = "Полный отчет прилагается."
+
+     # Send Telegram notification
+    if report_paths:
+        logging.info("Отчет успешно сгенерирован.")
+        logging.info("Отправка уведомления в Telegram...")
+        if await telegram_notifier.send_telegram_notification(report_paths, summary):
+            report_state.save_report_state(fingerprint, inactive_count, reported_at)
+            logging.info("Уведомление в Telegram успешно отправлено.")
+    else:
+        logging.error("Не удалось сгенерировать отчет, уведомление в Telegram не отправлено.")
+
+
 async def main():
-    """Запускает скрипты wordpress_post_indexer.py и tripster_link_processor.py последовательно."""
+    """Запускает конвейер обработки постов, анализ базы данных, отчет и уведомление."""
     try:
-        logging.info("Запуск wordpress_post_indexer.py...")
-        subprocess.run(["python", "-m", "scripts.wordpress_post_indexer"], check=True)
-        logging.info("wordpress_post_indexer.py успешно завершен.")
-
-        logging.info("Запуск tripster_link_processor.py...")
-        subprocess.run(["python", "-m", "scripts.tripster_link_processor"], check=True)
-        logging.info("tripster_link_processor.py успешно завершен.")
+        if DISTRIBUTED_SWEEP:
+            logging.info("Запуск распределенной обработки постов через очередь работ...")
+            if not work_queue.run_all_sites():
+                logging.error("Очередь работ обработана не полностью, анализ базы данных пропущен.")
+                return
+            logging.info("Распределенная обработка постов успешно завершена.")
+        else:
+            logging.info("Запуск конвейера обработки постов...")
+            if not link_pipeline.run_pipeline():
+                logging.error("Конвейер обработал посты не полностью, анализ базы данных пропущен.")
+                return
+            logging.info("Конвейер обработки постов успешно завершен.")
 
-        # Вызываем функцию analyze_database() после tripster_link_processor.py
+        # Анализ выполняется по индексу статуса; строки читаются из БД потоково
         logging.info("Анализ данных в базе данных...")
-        inactive_items = db.analyze_database()
+        reported_at = db.get_server_time()
+        db.analyze_database(db.get_run_started_at())
         logging.info("Анализ данных в базе данных завершен.")
 
-        if inactive_items:
-            logging.info(f"Найдено {len(inactive_items)} неактивных элементов.")
-            # Генерируем отчет
-            logging.info("Генерация отчета...")
-            report_path = report_generator.generate_report(inactive_items)
-            logging.info("Отчет успешно сгенерирован.")
-
-             # Send Telegram notification
-            if report_path:
-                logging.info("Отправка уведомления в Telegram...")
-                await telegram_notifier.send_telegram_notification(report_path)
-                logging.info("Уведомление в Telegram успешно отправлено.")
-            else:
-                logging.error("Не удалось сгенерировать отчет, уведомление в Telegram не отправлено.")
-        else:
-            logging.info("Неактивные элементы не найдены.")
+        await report_inactive_items(reported_at)
 
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Ошибка при выполнении скрипта: {e}")
     except Exception as e:
         logging.error(f"Непредвиденная ошибка: {e}")
 
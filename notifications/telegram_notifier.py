@@ -17,48 +17,83 @@ TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")  # todo получить Chat I
 MAX_RETRIES = 3  # Maximum number of retries for sending the report
 
 
-async def send_telegram_notification(report_path):
+async def send_document(bot, chat_id, report_path):
+    """
+    Sends a report file to the Telegram chat, retrying up to MAX_RETRIES times.
+
+    Args:
+        bot (telegram.Bot): The Telegram bot.
+        chat_id (str): The chat ID.
+        report_path (str): The path to the report file.
+
+    Returns:
+        bool: True if the file was sent.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            with open(report_path, 'rb') as document:
+                await bot.send_document(chat_id=chat_id, document=document, filename=os.path.basename(report_path))
+            logging.info(f"Отчет {report_path} успешно отправлен в Telegram чат {chat_id} (попытка {attempt + 1})")
+            return True
+        except TelegramError as e:
+            logging.error(f"Ошибка при отправке отчета в Telegram (попытка {attempt + 1}): {e}")
+            if attempt == MAX_RETRIES - 1:
+                logging.error(f"Превышено максимальное количество попыток отправки отчета в Telegram.")
+                return False
+            await asyncio.sleep(5)  # Wait before retrying
+        except OSError as e:
+            # The file is missing or unreadable: retrying will not help, the other files are still sent
+            logging.error(f"Не удалось прочитать файл отчета {report_path}: {e}")
+            return False
+    return False
+
+
+async def send_telegram_notification(report_paths=None, summary="Полный отчет прилагается."):
     """
     Sends a notification to a Telegram bot with the generated report.
 
     Args:
-        report_path (str): The path to the generated PDF report.
+        report_paths (list or str, optional): The paths to the generated report files
+            (PDF chunks and other formats), or the path to a single report. Without
+            report files only the message is sent.
+        summary (str): The second line of the message, e.g. "no changes" when the
+            report is skipped.
+
+    Returns:
+        bool: True if the message and all report files were sent.
     """
+    if isinstance(report_paths, str):
+        report_paths = [report_paths]
     try:
         if not TELEGRAM_BOT_TOKEN:
             logging.error("Отсутствует токен Telegram-бота. Пожалуйста, укажите TELEGRAM_BOT_TOKEN в файле .env.")
-            return
+            return False
 
         if not TELEGRAM_CHAT_ID:
             logging.error("Отсутствует Chat ID Telegram. Пожалуйста, укажите TELEGRAM_CHAT_ID в файле .env.")
-            return
+            return False
 
         bot = Bot(token=TELEGRAM_BOT_TOKEN)
         chat_id = TELEGRAM_CHAT_ID
 
         # Prepare the message
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        message_text = f"Проверка виджетов и ссылок Tripster завершена: {now}\nПолный отчет прилагается."
+        message_text = f"Проверка виджетов и ссылок Tripster завершена: {now}\n{summary}"
 
         # Send the message
+        sent = True
         try:
             await bot.send_message(chat_id=chat_id, text=message_text)
             logging.info(f"Уведомление успешно отправлено в Telegram чат {chat_id}")
         except TelegramError as e:
             logging.error(f"Ошибка при отправке уведомления в Telegram: {e}")
+            sent = False
 
-        # Send the report document with retries
-        for attempt in range(MAX_RETRIES):
-            try:
-                with open(report_path, 'rb') as document:
-                    await bot.send_document(chat_id=chat_id, document=document, filename="tripster_report.pdf")
-                logging.info(f"Отчет успешно отправлен в Telegram чат {chat_id} (попытка {attempt + 1})")
-                break  # Отправка успешна, выходим из цикла
-            except TelegramError as e:
-                logging.error(f"Ошибка при отправке отчета в Telegram (попытка {attempt + 1}): {e}")
-                if attempt == MAX_RETRIES - 1:
-                    logging.error(f"Превышено максимальное количество попыток отправки отчета в Telegram.")
-                await asyncio.sleep(5)  # Wait before retrying
+        # Send the report documents with retries
+        for report_path in report_paths or []:
+            sent = await send_document(bot, chat_id, report_path) and sent
+        return sent
 
     except Exception as e:
-        logging.error(f"Ошибка при отправке уведомления в Telegram: {e}")
\ No newline at end of file
+        logging.error(f"Ошибка при отправке уведомления в Telegram: {e}")
+        return False
@@ -1,47 +1,275 @@
 import os
+import csv
+import json
 import logging
-from weasyprint import HTML
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
 from jinja2 import Environment, FileSystemLoader
 
+load_dotenv()
+
 # Настройка логирования
 DEFAULT_LOG_LEVEL = logging.INFO
 logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 
+REPORT_FORMATS = [fmt.strip().lower() for fmt in os.getenv("REPORT_FORMATS", "pdf").split(',') if fmt.strip()]
+REPORT_PDF_CHUNK_ROWS = int(os.getenv("REPORT_PDF_CHUNK_ROWS", 1000))
+REPORT_PDF_WORKERS = int(os.getenv("REPORT_PDF_WORKERS", 1))
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_NAME = 'report_template.html'
+REPORT_COLUMNS = ('site', 'post_id', 'post_title', 'link_type', 'exp_id', 'exp_title', 'exp_url', 'link_status',
+                  'inactivity_reason', 'previous_status', 'status_changed_at')
+
+_environment = None
+
+
+def get_environment():
+    """
+    Returns the Jinja2 environment of the report templates.
+
+    The environment is created once per process, so templates are compiled only once
+    and reused by every report and every PDF chunk rendered by the same process.
 
-def generate_report(inactive_items, output_filename="tripster_report.pdf"):
+    Returns:
+        jinja2.Environment: The shared environment.
     """
-    Generates a PDF report of inactive Tripster widgets and deeplinks using WeasyPrint.
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), auto_reload=False)
+    return _environment
+
+
+def get_template():
+    """Returns the compiled report template."""
+    return get_environment().get_template(TEMPLATE_NAME)
+
+
+def output_path(output_filename, extension, part=1):
+    """
+    Builds the path of a report file of the given format.
 
     Args:
-        inactive_items (list): A list of dictionaries, where each dictionary
-                               represents an inactive widget or deeplink.
-        output_filename (str): The name of the output PDF file.
+        output_filename (str): The base name of the report (e.g. tripster_report.pdf).
+        extension (str): The file extension without a dot (pdf, csv, jsonl, html).
+        part (int): The PDF chunk number; chunks after the first get a -partN suffix.
+
     Returns:
-        str: The path to the generated PDF file.
+        str: The path of the report file.
     """
-    try:
-        logging.info(f"Генерация отчета с использованием WeasyPrint: {output_filename}")
+    stem = os.path.splitext(output_filename)[0]
+    suffix = f"-part{part}" if part > 1 else ""
+    return f"{stem}{suffix}.{extension}"
+
+
+def write_csv_report(items, path):
+    """
+    Writes the report to a CSV file row by row.
+
+    Args:
+        items (iterable): Inactive widgets and deeplinks.
+        path (str): The path of the CSV file.
+
+    Returns:
+        int: The number of written rows.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for item in items:
+            writer.writerow(item)
+            count += 1
+    return count
+
+
+def write_jsonl_report(items, path):
+    """
+    Writes the report to a JSON Lines file, one item per line.
+
+    Args:
+        items (iterable): Inactive widgets and deeplinks.
+        path (str): The path of the JSONL file.
+
+    Returns:
+        int: The number of written rows.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            row = {column: item.get(column) for column in REPORT_COLUMNS}
+            f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            count += 1
+    return count
+
+
+def write_html_report(items, path, total=None):
+    """
+    Writes the report to an HTML file, streaming the rendered template row by row.
+
+    Args:
+        items (iterable): Inactive widgets and deeplinks.
+        path (str): The path of the HTML file.
+        total (int, optional): The number of items, shown in the header if known.
+            Otherwise the number of rows is shown after the table.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        get_template().stream(inactive_items=items, total_inactive=total).dump(f)
 
-        # Configure Jinja2 environment
-        template_dir = os.path.dirname(os.path.abspath(__file__))  # Use the directory of the script
-        env = Environment(loader=FileSystemLoader(template_dir))
-        template = env.get_template('report_template.html')
 
-        # Prepare data for the template
-        report_data = {
-            'total_analyzed': len(inactive_items),
-            'total_inactive': len(inactive_items),
-            'inactive_items': inactive_items
-        }
+def render_pdf_chunk(items, path, part=None, first_row=1, total=None):
+    """
+    Renders one chunk of the report to a PDF file using WeasyPrint.
+
+    Runs in a worker process when REPORT_PDF_WORKERS > 1, so it is defined at module
+    level and receives plain dictionaries.
+
+    Args:
+        items (list): The items of the chunk.
+        path (str): The path of the PDF file.
+        part (int, optional): The chunk number, shown in the header of split reports.
+        first_row (int): The number of the first item of the chunk in the whole report.
+        total (int, optional): The number of items in the whole report.
+
+    Returns:
+        str: The path of the PDF file.
+    """
+    # WeasyPrint загружает системные библиотеки (Pango), поэтому импортируется только при рендеринге PDF
+    from weasyprint import HTML
+
+    html_content = get_template().render(
+        inactive_items=items, total_inactive=total, part=part, first_row=first_row,
+        last_row=first_row + len(items) - 1
+    )
+    HTML(string=html_content, base_url=TEMPLATE_DIR).write_pdf(path)
+    return path
+
+
+def chunk_items(items, chunk_rows=REPORT_PDF_CHUNK_ROWS):
+    """
+    Splits the items into chunks of at most chunk_rows items.
+
+    A new chunk is also started when the 'site' of the items changes, so items of
+    different sites never share a PDF file.
+
+    Args:
+        items (iterable): Report items.
+        chunk_rows (int): The maximum number of items per chunk (0 - no limit).
+
+    Yields:
+        list: Chunks of items.
+    """
+    chunk = []
+    for item in items:
+        if chunk and ((chunk_rows and len(chunk) >= chunk_rows) or item.get('site') != chunk[-1].get('site')):
+            yield chunk
+            chunk = []
+        chunk.append(item)
+    if chunk:
+        yield chunk
+
+
+def write_pdf_report(items, output_filename, total=None, chunk_rows=REPORT_PDF_CHUNK_ROWS, workers=REPORT_PDF_WORKERS):
+    """
+    Renders the report to one or more PDF files.
 
-        # Render the HTML template with the data
-        html_content = template.render(report_data)
+    The items are split into chunks (chunk_items) that are rendered independently;
+    with workers > 1 the chunks are rendered in parallel worker processes. Only a
+    few chunks are kept in memory at a time.
 
-        # Convert the HTML content to PDF using WeasyPrint
-        HTML(string=html_content, base_url=template_dir).write_pdf(output_filename)
+    Args:
+        items (iterable): Inactive widgets and deeplinks.
+        output_filename (str): The path of the first PDF file; further chunks get a -partN suffix.
+        total (int, optional): The number of items.
+        chunk_rows (int): The maximum number of items per PDF file.
+        workers (int): The number of rendering processes (0 or 1 - render in the current process).
+
+    Returns:
+        list: The paths of the generated PDF files in chunk order.
+    """
+    chunks = chunk_items(items, chunk_rows)
+    paths = []
+    first_row = 1
+
+    if workers <= 1:
+        for part, chunk in enumerate(chunks, start=1):
+            split = part > 1 or len(chunk) == chunk_rows
+            paths.append(render_pdf_chunk(chunk, output_path(output_filename, 'pdf', part), part if split else None,
+                                          first_row, total))
+            first_row += len(chunk)
+        return paths
+
+    # Процессы запускаются методом spawn, как и пул разбора HTML (core/parse_pool.py)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = set()
+        for part, chunk in enumerate(chunks, start=1):
+            if len(pending) >= workers * 2:
+                # Ограничиваем число частей в памяти; ошибка рендеринга части прерывает генерацию отчета
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            path = output_path(output_filename, 'pdf', part)
+            split = part > 1 or len(chunk) == chunk_rows
+            pending.add(executor.submit(render_pdf_chunk, chunk, path, part if split else None, first_row, total))
+            paths.append(path)
+            first_row += len(chunk)
+        for future in pending:
+            future.result()
+    return paths
+
+
+def _item_source(items, formats):
+    """Returns a function producing a fresh iterator over the items for each report format."""
+    if callable(items):
+        return items
+    if iter(items) is items and len(formats) > 1:
+        # Одноразовый итератор нельзя прочитать для каждого формата отдельно
+        items = list(items)
+    return lambda: items
+
+
+def generate_report(inactive_items, output_filename="tripster_report.pdf", formats=None, total=None):
+    """
+    Generates reports of inactive Tripster widgets and deeplinks in the requested formats.
+
+    CSV, JSONL and HTML reports are written row by row; the PDF report is rendered by
+    WeasyPrint in chunks of REPORT_PDF_CHUNK_ROWS items (write_pdf_report).
+
+    Args:
+        inactive_items (iterable or callable): Inactive items (a list or an iterator), or a
+            function returning a fresh iterator of them, e.g. db.iter_inactive_links. A
+            function lets every format stream the items from the database separately.
+        output_filename (str): The name of the output PDF file; other formats use the same
+            name with their own extension.
+        formats (list, optional): Report formats: pdf, csv, jsonl, html. Defaults to REPORT_FORMATS.
+        total (int, optional): The number of items, shown in the report header.
+
+    Returns:
+        list: The paths of the generated files, or None in case of an error.
+    """
+    formats = formats or REPORT_FORMATS
+    source = _item_source(inactive_items, formats)
+    paths = []
+    try:
+        for fmt in formats:
+            logging.info(f"Генерация отчета в формате {fmt}: {output_path(output_filename, fmt)}")
+            if fmt == 'pdf':
+                paths += write_pdf_report(source(), output_filename, total)
+            elif fmt == 'csv':
+                write_csv_report(source(), output_path(output_filename, 'csv'))
+                paths.append(output_path(output_filename, 'csv'))
+            elif fmt == 'jsonl':
+                write_jsonl_report(source(), output_path(output_filename, 'jsonl'))
+                paths.append(output_path(output_filename, 'jsonl'))
+            elif fmt == 'html':
+                write_html_report(source(), output_path(output_filename, 'html'), total)
+                paths.append(output_path(output_filename, 'html'))
+            else:
+                logging.warning(f"Неизвестный формат отчета: {fmt}")
 
-        logging.info(f"Отчет успешно сгенерирован: {output_filename}")
-        return output_filename  # Return the report path
+        logging.info(f"Отчет успешно сгенерирован: {', '.join(paths)}")
+        return paths
 
     except Exception as e:
         logging.error(f"Ошибка при генерации отчета: {e}")
@@ -54,8 +282,8 @@ if __name__ == '__main__':
         {'post_title': 'My Trip to Paris', 'link_type': 'widget', 'exp_id': '123', 'exp_title': 'Eiffel Tower Tour', 'link_status': 'inactive', 'inactivity_reason': 'Deleted from Tripster'},
         {'post_title': 'Best Restaurants in Rome', 'link_type': 'deeplink', 'exp_id': None, 'anchor': 'Best Restaurants', 'link_status': 'inactive', 'inactivity_reason': '404 Error'}
     ]
-    report_path = generate_report(inactive_items)
-    if report_path:
-        print(f"Report generated at: {report_path}")
+    report_paths = generate_report(inactive_items)
+    if report_paths:
+        print(f"Report generated at: {', '.join(report_paths)}")
     else:
-        print("Report generation failed.")
\ No newline at end of file
+        print("Report generation failed.")
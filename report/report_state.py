@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+from core.wp_api_utils import construct_json_file_path
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+REPORT_STATE_FILE = os.getenv("REPORT_STATE_FILE", "report_state.json")
+REPORT_DELTA_MAX_CHANGES = int(os.getenv("REPORT_DELTA_MAX_CHANGES", 0))
+
+# Поля, определяющие неактивную ссылку в отчете; ID строки не используется, он меняется при перезаписи поста
+FINGERPRINT_FIELDS = ('site', 'post_id', 'post_title', 'link_type', 'exp_id', 'exp_title', 'exp_url', 'inactivity_reason')
+FINGERPRINT_MODULUS = 2 ** 256
+
+
+def inactive_fingerprint(items):
+    """
+    Вычисляет отпечаток набора неактивных ссылок, не зависящий от порядка строк.
+
+    Отпечаток - сумма хешей SHA-256 строк по модулю 2^256, поэтому строки читаются
+    потоково и не сортируются в памяти.
+
+    Args:
+        items (iterable): Неактивные ссылки (например, db.iter_inactive_links()).
+
+    Returns:
+        tuple: (fingerprint, count) - отпечаток в шестнадцатеричном виде и количество строк.
+    """
+    total = 0
+    count = 0
+    for item in items:
+        row = json.dumps([str(item.get(field) or '') for field in FINGERPRINT_FIELDS], ensure_ascii=False)
+        total = (total + int.from_bytes(hashlib.sha256(row.encode('utf-8')).digest(), 'big')) % FINGERPRINT_MODULUS
+        count += 1
+    return f"{total:064x}", count
+
+
+def load_report_state():
+    """
+    Загружает состояние последнего отправленного отчета.
+
+    Returns:
+        dict: {'fingerprint', 'count', 'reported_at'} или пустой словарь, если отчет еще не отправлялся.
+    """
+    filename = construct_json_file_path(REPORT_STATE_FILE)
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Ошибка при чтении состояния отчета из файла {filename}: {e}")
+        return {}
+
+
+def save_report_state(fingerprint, count, reported_at):
+    """
+    Сохраняет состояние отправленного отчета.
+
+    Args:
+        fingerprint (str): Отпечаток набора неактивных ссылок.
+        count (int): Количество неактивных ссылок.
+        reported_at (datetime): Время сервера БД, на которое составлен отчет.
+    """
+    filename = construct_json_file_path(REPORT_STATE_FILE)
+    state = {
+        'fingerprint': fingerprint,
+        'count': count,
+        'reported_at': reported_at.isoformat() if reported_at else None,
+    }
+    try:
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_filename, filename)
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении состояния отчета в файл {filename}: {e}")
+
+
+def reported_at(state):
+    """Возвращает время последнего отчета из состояния или None."""
+    value = state.get('reported_at')
+    return datetime.fromisoformat(value) if value else None
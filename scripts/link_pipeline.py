@@ -0,0 +1,293 @@
+import os
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import core.wp_api_utils
+from core import metrics
+from core import parse_pool
+from core import run_memo
+from db import db
+from scripts import wordpress_post_indexer as indexer
+from scripts import tripster_link_processor as processor
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 100))
+PIPELINE_CONTENT_WORKERS = int(os.getenv("PIPELINE_CONTENT_WORKERS", 2))
+PIPELINE_STATUS_WORKERS = int(os.getenv("PIPELINE_STATUS_WORKERS", 4))
+SITE_WORKERS = int(os.getenv("SITE_WORKERS", 4))
+
+# Признак конца потока данных в очереди
+_DONE = object()
+
+
+def start_stage(name, handler, in_queue, out_queue, workers=1, failed=None):
+    """
+    Запускает этап конвейера в отдельных потоках.
+
+    Каждый поток берет элементы из in_queue, обрабатывает их функцией handler и кладет
+    непустые результаты в out_queue. Ошибка обработки элемента записывается в лог,
+    ID элемента добавляется в failed, а сам элемент пропускается. Когда все потоки этапа получили признак конца данных,
+    признак передается следующему этапу.
+
+    Args:
+        name (str): Название этапа (для имен потоков и логов).
+        handler (callable): Функция, получающая элемент и возвращающая результат или None.
+        in_queue (queue.Queue): Входная очередь.
+        out_queue (queue.Queue): Выходная очередь.
+        workers (int): Количество потоков этапа.
+        failed (list, optional): Список, в который добавляются ID необработанных элементов.
+
+    Returns:
+        list: Запущенные потоки.
+    """
+    workers = max(1, workers)
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                # Возвращаем признак в очередь для остальных потоков этапа
+                in_queue.put(_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    if remaining[0] == 0:
+                        out_queue.put(_DONE)
+                return
+
+            try:
+                result = handler(item)
+            except Exception as e:
+                logging.error(f"Ошибка на этапе '{name}' при обработке поста {item.get('id')}: {e}")
+                metrics.inc('pipeline_failed_posts_total', labels={'stage': name.split('-')[0]})
+                if failed is not None:
+                    failed.append(item.get('id'))
+                continue
+            if result is not None:
+                out_queue.put(result)
+
+    threads = [threading.Thread(target=worker, name=f"{name}-{i + 1}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def list_posts(out_queue, progress, finished, site=None, recheck_queue=None):
+    """
+    Этап получения списка постов: постранично запрашивает посты сайта и передает их дальше.
+
+    Для постов каждой страницы одним запросом загружаются сохраненные отпечатки контента.
+    Посты, уже обработанные в продолжаемом запуске, дальше не передаются. После полного
+    списка инкрементального обхода остальные сохраненные посты сайта со ссылками передаются
+    в recheck_queue: их контент не изменился, но статусы ссылок проверяются в каждом запуске.
+
+    Args:
+        out_queue (queue.Queue): Очередь постов для получения контента.
+        progress (dict): Словарь, в который записываются 'is_complete' и данные для finish_crawl:
+            'crawl_state', 'full_sweep', 'watermark', 'post_ids'.
+        finished (set): ID постов (str), уже обработанных в этом запуске.
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+        recheck_queue (queue.Queue, optional): Очередь проверки статусов для постов, не попавших в список.
+    """
+    try:
+        config = core.wp_api_utils.get_site(site)
+        site = config['domain']
+        crawl_state, full_sweep, params = indexer.start_crawl(site)
+        watermark = None
+        post_ids = []
+        listed = set()
+        order = 0
+        progress.update(crawl_state=crawl_state, full_sweep=full_sweep)
+
+        for posts in indexer.iter_post_pages(config['api_url'], params, progress, config['auth']):
+            ids = [post.get('id') for post in posts if post.get('id') and str(post.get('id')) not in finished]
+            fingerprints = db.get_post_fingerprints(ids, site)
+
+            for post in posts:
+                order += 1
+                watermark = indexer.latest_watermark(watermark, post)
+                post_id = post.get('id')
+                if not post_id:
+                    logging.warning("Ошибка: Не найден ID поста.")
+                    continue
+                if full_sweep:
+                    post_ids.append(post_id)
+                listed.add(str(post_id))
+                if str(post_id) in finished:
+                    continue
+
+                record = indexer.to_post_record(post, order)
+                stored = fingerprints.get(str(post_id))
+                record['fingerprints'] = {str(post_id): stored} if stored else {}
+                out_queue.put(record)
+
+        logging.info(f"Всего получено {order} постов сайта {site} из API.")
+        progress.update(watermark=watermark, post_ids=post_ids)
+
+        if recheck_queue is not None and progress['is_complete'] and not full_sweep:
+            # Очередь проверки статусов получит признак конца только после признака конца этой очереди
+            for post in processor.iter_unlisted_posts(listed, finished, site):
+                recheck_queue.put(post)
+    except Exception as e:
+        logging.error(f"Ошибка при получении списка постов сайта {site}: {e}")
+        progress['is_complete'] = False
+    finally:
+        db.close_connection()
+        out_queue.put(_DONE)
+
+
+def fetch_content(post, site=None):
+    """Этап получения контента: дополняет пост сайта site HTML-контентом."""
+    post['content'] = processor.load_post_content(post, site)
+    if post['content'] is None:
+        # Пост считается необработанным: запуск не будет завершен, и пост обработается при продолжении
+        raise ValueError("не удалось получить данные поста")
+    return post
+
+
+def extract_links(post):
+    """Этап извлечения: находит ссылки Tripster в контенте поста."""
+    logging.info(f"Обрабатывается пост ID: {post['id']}, title: {post['title']}")
+    links, fingerprint = processor.extract_post_links(post['id'], post.pop('content'), post.pop('fingerprints'))
+    post['links'] = links
+    post['fingerprint'] = fingerprint
+    return post
+
+
+def check_statuses(post):
+    """Этап проверки статусов: формирует записи о ссылках поста."""
+    records = processor.resolve_post_links(post['id'], post['title'], post.pop('links'))
+    return {'id': post['id'], 'records': records, 'fingerprint': post['fingerprint']}
+
+
+def sweep_site(site):
+    """
+    Обрабатывает посты одного сайта WordPress потоковым конвейером.
+
+    Этапы (получение списка постов -> получение контента -> извлечение ссылок -> проверка
+    статусов -> запись в БД) работают одновременно и связаны очередями ограниченного
+    размера PIPELINE_QUEUE_SIZE: проверка ссылок начинается, пока следующие страницы списка
+    еще загружаются, а объем памяти не зависит от числа постов на сайте.
+
+    Обработанные посты отмечаются в журнале запуска в одной транзакции с их ссылками.
+    Прерванный запуск при следующем старте продолжается: уже обработанные посты пропускаются.
+
+    Args:
+        site (str): Домен сайта.
+
+    Returns:
+        bool: True, если все посты сайта обработаны и запуск завершен.
+    """
+    run_id = core.wp_api_utils.start_run(site)
+    db.register_run(run_id, site)
+    finished = db.get_finished_posts(run_id)
+    if finished:
+        logging.info(f"В запуске {run_id} уже обработано постов: {len(finished)}, они будут пропущены.")
+
+    progress = {'is_complete': False}
+    content_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    extract_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    status_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    write_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+
+    threads = [threading.Thread(target=list_posts, args=(content_queue, progress, finished, site, status_queue),
+                                name=f"listing-{site}", daemon=True)]
+    threads[0].start()
+    failed = []
+    threads += start_stage(f"content-{site}", lambda post: fetch_content(post, site), content_queue, extract_queue,
+                           PIPELINE_CONTENT_WORKERS, failed)
+    # При включенном пуле процессов каждый поток этапа ожидает разбор в своем процессе пула
+    threads += start_stage(f"extract-{site}", extract_links, extract_queue, status_queue, max(1, parse_pool.PARSE_WORKERS),
+                           failed)
+    threads += start_stage(f"status-{site}", check_statuses, status_queue, write_queue, PIPELINE_STATUS_WORKERS, failed)
+
+    # Запись в БД выполняется в текущем потоке
+    written = 0
+    with db.LinkWriter(run_id=run_id, site=site) as writer:
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            writer.add_post(item['records'], item['fingerprint'])
+            written += 1
+
+    for thread in threads:
+        thread.join()
+    failures = len(failed) + writer.failed_posts
+    completed = False
+    logging.info(f"Конвейер сайта {site} завершен, обработано постов: {written}, с ошибками: {failures}.")
+
+    if failures:
+        # Необработанные посты не отмечены в журнале: запуск продолжится с ними при следующем старте,
+        # а отметка последнего изменения не сдвигается за них
+        logging.error(f"Запуск {run_id} сайта {site} не завершен: постов с ошибками {failures}, "
+                      "он будет продолжен при следующем старте.")
+    elif progress['is_complete']:
+        # Состояние обхода сохраняется только после обработки всех постов, чтобы прерванный
+        # запуск продолжился в том же режиме и с той же отметкой
+        indexer.finish_crawl(progress['crawl_state'], progress['full_sweep'], progress['watermark'], progress['post_ids'],
+                             site)
+        # Изменения постов обработаны, следующий инкрементальный обход начнется с новой отметки
+        core.wp_api_utils.commit_pending_watermark(site)
+        db.complete_run(run_id)
+        db.clear_run_journal(run_id)
+        core.wp_api_utils.finish_run(run_id, site)
+        completed = True
+    db.close_connection()
+    return completed
+
+
+def run_pipeline(sites=None):
+    """
+    Обрабатывает посты всех сайтов WordPress конвейерами sweep_site в одном процессе.
+
+    До SITE_WORKERS сайтов обрабатываются одновременно. Результаты проверки страниц Tripster
+    (run_memo, кеш статусов) общие для всех сайтов, поэтому страница, на которую ссылаются
+    несколько сайтов, проверяется за запуск один раз. Ошибка обработки одного сайта
+    не прерывает обработку остальных.
+
+    Args:
+        sites (list, optional): Домены сайтов. По умолчанию все сайты из load_sites.
+
+    Returns:
+        bool: True, если посты всех сайтов обработаны полностью.
+    """
+    metrics.reset()
+    sites = sites or [site['domain'] for site in core.wp_api_utils.load_sites()]
+    if not sites:
+        logging.error("Не задан ни один сайт для проверки (DOMAIN_TO_CHECK или SITES_FILE).")
+        return False
+
+    completed = True
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(SITE_WORKERS, len(sites))), thread_name_prefix="site") as executor:
+            futures = {executor.submit(sweep_site, site): site for site in sites}
+            for future, site in futures.items():
+                try:
+                    completed = future.result() and completed
+                except Exception as e:
+                    logging.error(f"Ошибка при обработке сайта {site}: {e}")
+                    completed = False
+    finally:
+        run_memo.reset_all()
+        parse_pool.shutdown()
+    metrics.dump()
+    return completed
+
+
+def main():
+    """Главная функция, запускает конвейер обработки постов всех сайтов."""
+    run_pipeline()
+
+
+if __name__ == "__main__":
+    main()
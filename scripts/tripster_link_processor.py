@@ -1,12 +1,16 @@
 import os
 import json
+import argparse
+import itertools
 from dotenv import load_dotenv
 import core.wp_api_utils
 import core.tripster_data_extractor
+from core import metrics
+from core import parse_pool
+from core import run_memo
 import logging
 import requests
 import time
-import pymysql
 
 # Импортируем функции для работы с БД из db.py
 from db import db
@@ -22,7 +26,7 @@ MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
 RETRY_DELAY = int(os.getenv("RETRY_DELAY", 2))
 
 
-def fetch_wordpress_post(api_url, post_id, max_retries=3, retry_delay=2):
+def fetch_wordpress_post(api_url, post_id, max_retries=3, retry_delay=2, auth=None):
     """
     Получает данные поста по его ID из API WordPress с повторными попытками.
 
@@ -31,25 +35,25 @@ def fetch_wordpress_post(api_url, post_id, max_retries=3, retry_delay=2):
         post_id (int): ID поста.
         max_retries (int): Максимальное количество попыток.
         retry_delay (int): Задержка между попытками в секундах.
+        auth (tuple, optional): Имя пользователя и пароль приложения WordPress.
 
     Returns:
         dict: Данные поста в формате JSON или None в случае ошибки.
     """
     for attempt in range(max_retries):
         try:
-            response = requests.get(f"{api_url}/{post_id}")
-            response.raise_for_status()  # Проверяем статус код ответа
-
-            # Явно декодируем контент в UTF-8
-            try:
-                content = response.json()
-            except Exception as e:
-                logging.error(f"Ошибка при декодировании JSON для поста с ID {post_id}: {e}")
-                return None
+            with metrics.timer('wp_post_fetch_seconds'):
+                content = core.wp_api_utils.fetch_wordpress_post_json(api_url, post_id, auth)
+            metrics.inc('wp_posts_fetched_total')
             return content
+        except ValueError as e:
+            # Ответ получен, но не является корректным JSON: повторный запрос не поможет
+            logging.error(f"Ошибка при декодировании JSON для поста с ID {post_id}: {e}")
+            return None
         except requests.exceptions.RequestException as e:
             logging.error(f"Ошибка requests при получении поста с ID {post_id}, попытка {attempt + 1}: {e}")
             if attempt < max_retries - 1:
+                metrics.inc('retries_total', labels={'operation': 'wp_post'})
                 time.sleep(retry_delay ** (attempt + 1))  # Экспоненциальная задержка
             else:
                 logging.error(f"Превышено максимальное количество попыток для поста с ID {post_id}")
@@ -57,6 +61,7 @@ def fetch_wordpress_post(api_url, post_id, max_retries=3, retry_delay=2):
         except Exception as e:
             logging.error(f"Непредвиденная ошибка при получении поста с ID {post_id}, попытка {attempt + 1}: {e}")
             if attempt < max_retries - 1:
+                metrics.inc('retries_total', labels={'operation': 'wp_post'})
                 time.sleep(retry_delay ** (attempt + 1))  # Экспоненциальная задержка
             else:
                 logging.error(f"Превышено максимальное количество попыток для поста с ID {post_id}")
@@ -65,9 +70,9 @@ def fetch_wordpress_post(api_url, post_id, max_retries=3, retry_delay=2):
     return None
 
 
-def save_tripster_data(post_id, post_title, link_type, data):
-    """Сохраняет данные о виджете или диплинке в базу данных."""
-    record = {
+def build_tripster_record(post_id, post_title, link_type, data):
+    """Формирует запись о виджете или диплинке для сохранения в базу данных."""
+    return {
         'post_id': str(post_id),
         'post_title': str(post_title),
         'link_type': link_type,
@@ -78,62 +83,300 @@ def save_tripster_data(post_id, post_title, link_type, data):
         'inactivity_reason': str(data.get('inactivity_reason') or ''),
         'is_unknown_type': data.get('is_unknown_type') if data.get('is_unknown_type') is not None else False
     }
-    logging.info(f"Вставляем {link_type}: {record}")
-    db.insert_or_update_data(record)
 
 
-def process_tripster_links():
-    """Извлекает и сохраняет виджеты и диплинки из постов WordPress."""
-    try:
-        post_data_file = core.wp_api_utils.construct_json_file_path(core.wp_api_utils.POST_DATA_FILE)
+def get_post_links(post_id, content, content_hash, fingerprints):
+    """
+    Возвращает ссылки Tripster, найденные в контенте поста.
 
-        with open(post_data_file, 'r', encoding='utf-8') as f:
-            post_data = json.load(f)
+    Если отпечаток контента совпадает с сохраненным, разбор HTML пропускается
+    и используются ссылки, найденные при предыдущей обработке.
 
-    except FileNotFoundError as e:
-        logging.error(f"Ошибка: Файл {post_data_file} не найден: {e}")
-        return
-    except json.JSONDecodeError as e:
-        logging.error(f"Ошибка: Некорректный JSON в файле {post_data_file}: {e}")
-        return
-    except Exception as e:
-        logging.error(f"Непредвиденная ошибка при чтении файла: {e}")
-        return
+    Args:
+        post_id (int): ID поста.
+        content (str): HTML-контент поста.
+        content_hash (str): Отпечаток контента (content_fingerprint).
+        fingerprints (dict): Сохраненные отпечатки (db.get_post_fingerprints).
 
-    if not post_data:
-        logging.warning("Нет данных о постах для обработки.")
-        return
+    Returns:
+        dict: {'widgets': [...], 'deeplinks': [...]} - кандидаты для resolve_widgets и resolve_deeplinks.
+    """
+    stored = fingerprints.get(str(post_id))
+    if stored and stored[0] == content_hash:
+        logging.info(f"Контент поста ID {post_id} не изменился, разбор HTML пропущен.")
+        metrics.inc('cache_hits_total', labels={'cache': 'post_fingerprints'})
+        return stored[1]
+
+    metrics.inc('cache_misses_total', labels={'cache': 'post_fingerprints'})
+    if not core.tripster_data_extractor.has_link_candidates(content, TRIPSTER_DOMAIN):
+        # В контенте нет упоминаний Tripster: разбор HTML и передача контента в пул процессов не нужны
+        metrics.inc('posts_prefiltered_total')
+        return {'widgets': [], 'deeplinks': []}
+
+    # Разбор выполняется в пуле процессов, если он включен (PARSE_WORKERS)
+    with metrics.timer('post_parse_seconds'):
+        return parse_pool.run(core.tripster_data_extractor.parse_link_candidates, content, TRIPSTER_DOMAIN)
+
+
+def load_post_content(post, site=None):
+    """
+    Возвращает HTML-контент поста.
+
+    Контент обычно уже получен индексатором вместе со списком постов; если его нет,
+    пост запрашивается из API отдельно.
+
+    Args:
+        post (dict): Запись о посте {'id', 'title', 'content'}.
+        site (str, optional): Домен сайта поста. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        str: HTML-контент поста или None, если его не удалось получить.
+    """
+    content = post.get('content')
+    if content is None:
+        config = core.wp_api_utils.get_site(site)
+        full_post = fetch_wordpress_post(config['api_url'], post['id'], MAX_RETRIES, RETRY_DELAY, config['auth'])
+        content = full_post['content']['rendered'] if full_post else None
+    return content
+
+
+def extract_post_links(post_id, content, fingerprints):
+    """
+    Находит ссылки Tripster в контенте поста и строит отпечаток для сохранения.
+
+    Args:
+        post_id (int): ID поста.
+        content (str): HTML-контент поста.
+        fingerprints (dict): Сохраненные отпечатки (db.get_post_fingerprints).
+
+    Returns:
+        tuple: (links, fingerprint) - кандидаты ссылок и отпечаток {'post_id', 'content_hash', 'links'}.
+    """
+    content_hash = core.tripster_data_extractor.content_fingerprint(content, TRIPSTER_DOMAIN)
+    links = get_post_links(post_id, content, content_hash, fingerprints)
+    fingerprint = {
+        'post_id': str(post_id),
+        'content_hash': content_hash,
+        'links': json.dumps(links, ensure_ascii=False)
+    }
+    return links, fingerprint
+
+
+def resolve_post_links(post_id, post_title, links):
+    """
+    Проверяет статусы ссылок поста и формирует записи для сохранения в базу данных.
+
+    Args:
+        post_id (int): ID поста.
+        post_title (str): Заголовок поста.
+        links (dict): Кандидаты ссылок {'widgets': [...], 'deeplinks': [...]}.
+
+    Returns:
+        list: Записи о виджетах и диплинках (формат build_tripster_record).
+    """
+    widgets = core.tripster_data_extractor.resolve_widgets(links['widgets'], MAX_RETRIES, RETRY_DELAY)
+    deeplinks = core.tripster_data_extractor.resolve_deeplinks(links['deeplinks'])
+
+    records = [build_tripster_record(post_id, post_title, 'widget', widget) for widget in widgets]
+    records += [build_tripster_record(post_id, post_title, 'deeplink', deeplink) for deeplink in deeplinks]
+    metrics.inc('posts_processed_total')
+    logging.info(f"Пост ID {post_id}: виджетов {len(widgets)}, диплинков {len(deeplinks)}")
+    return records
+
+
+def iter_unlisted_posts(listed, finished, site=None):
+    """
+    Возвращает сохраненные посты сайта со ссылками, не попавшие в список постов инкрементального обхода.
+
+    Контент таких постов не изменился, поэтому разбор HTML не нужен, но статусы их ссылок
+    проверяются в каждом запуске: экскурсия в старом посте может стать неактивной в любой момент.
 
-    for post in post_data:
+    Args:
+        listed (set): ID постов (str), полученных при обходе.
+        finished (set): ID постов (str), уже обработанных в этом запуске.
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+
+    Yields:
+        dict: {'id', 'title', 'links', 'fingerprint'} - данные для resolve_post_links и LinkWriter.add_post.
+    """
+    for post in db.iter_stored_posts(site):
+        if post['id'] in listed or post['id'] in finished:
+            continue
+        post['links'] = json.loads(post['fingerprint']['links'])
+        metrics.inc('posts_rechecked_total')
+        yield post
+
+
+def recheck_unlisted_posts(listed, finished, writer, site=None):
+    """
+    Перепроверяет статусы ссылок постов, не попавших в список постов инкрементального обхода.
+
+    Args:
+        listed (set): ID постов (str), полученных при обходе.
+        finished (set): ID постов (str), уже обработанных в этом запуске.
+        writer (db.LinkWriter): Буфер записи ссылок.
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        int: Количество постов, ссылки которых перепроверить не удалось.
+    """
+    rechecked = 0
+    failures = 0
+    for post in iter_unlisted_posts(listed, finished, site):
+        try:
+            records = resolve_post_links(post['id'], post['title'], post['links'])
+            writer.add_post(records, post['fingerprint'])
+            rechecked += 1
+        except Exception as e:
+            logging.error(f"Ошибка при перепроверке ссылок поста {post['id']}: {e}")
+            failures += 1
+    logging.info(f"Перепроверены ссылки постов, не изменившихся с прошлого обхода: {rechecked}.")
+    return failures
+
+
+def iter_post_batches(posts, batch_size):
+    """Разбивает поток записей о постах на пакеты по batch_size записей."""
+    posts = iter(posts)
+    while True:
+        batch = list(itertools.islice(posts, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def process_post_batch(posts, finished, writer, site=None):
+    """
+    Извлекает и проверяет ссылки пакета постов и передает записи в writer.
+
+    Args:
+        posts (list): Записи о постах {'order', 'id', 'title', 'content'}.
+        finished (set): ID постов, уже обработанных в этом запуске.
+        writer (db.LinkWriter): Буфер записи ссылок.
+        site (str, optional): Домен сайта постов. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        int: Количество постов, которые не удалось обработать.
+    """
+    failures = 0
+    fingerprints = db.get_post_fingerprints(
+        (post['id'] for post in posts if post.get('id') and str(post['id']) not in finished), site
+    )
+
+    for post in posts:
         post_id = post.get('id')
         post_title = post.get('title')
 
+        if post_id and str(post_id) in finished:
+            continue
+
         if post_id:
             try:
-                full_post = fetch_wordpress_post(core.wp_api_utils.API_URL, post_id, MAX_RETRIES, RETRY_DELAY)
+                content = load_post_content(post, site)
 
-                if full_post:
-                    content = full_post['content']['rendered']
+                if content is not None:
                     logging.info(f"Обрабатывается пост ID: {post_id}, title: {post_title}")
-                    widgets = core.tripster_data_extractor.extract_tripster_widgets(content, TRIPSTER_DOMAIN)
-                    deeplinks = core.tripster_data_extractor.extract_deeplinks(content, TRIPSTER_DOMAIN)
-
-                    for widget in widgets:
-                        save_tripster_data(post_id, post_title, 'widget', widget)
-
-                    for deeplink in deeplinks:
-                        save_tripster_data(post_id, post_title, 'deeplink', deeplink)
+                    links, fingerprint = extract_post_links(post_id, content, fingerprints)
+                    records = resolve_post_links(post_id, post_title, links)
+                    writer.add_post(records, fingerprint)
 
                 else:
                     logging.warning(f"Не удалось получить данные поста с ID {post_id}.")
+                    failures += 1
             except Exception as e:
                 logging.error(f"Ошибка при обработке поста {post_id}: {e}")
+                failures += 1
         else:
             logging.warning("Ошибка: Не найден ID поста.")
+    return failures
+
+
+def process_tripster_links(follow=False, site=None):
+    """
+    Извлекает и сохраняет виджеты и диплинки из постов WordPress одного сайта.
+
+    Посты читаются из индекса постов сайта (iter_post_index) по одному и обрабатываются пакетами
+    по POSTS_PER_PAGE, поэтому память не зависит от размера сайта. Если индекс построен
+    инкрементальным обходом, затем перепроверяются ссылки остальных сохраненных постов сайта.
+
+    Args:
+        follow (bool): Обрабатывать посты по мере записи индекса индексатором, пока
+            он не допишет маркер конца индекса.
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+    """
+    site = site or core.wp_api_utils.default_site()
+    post_data_file = core.wp_api_utils.post_index_path(site)
+    if not os.path.exists(post_data_file):
+        logging.error(f"Ошибка: Файл {post_data_file} не найден.")
+        return
+
+    # Посты, обработанные до прерывания того же запуска, пропускаются
+    run_id = core.wp_api_utils.start_run(site)
+    db.register_run(run_id, site)
+    finished = db.get_finished_posts(run_id)
+    if finished:
+        logging.info(f"В запуске {run_id} уже обработано постов: {len(finished)}, обработка продолжается со следующего.")
+
+    processed = 0
+    failures = 0
+    listed = set()
+    end = {}
+    try:
+        with db.LinkWriter(run_id=run_id, site=site) as writer:
+            posts = core.wp_api_utils.iter_post_index(post_data_file, follow=follow, end=end)
+            for batch in iter_post_batches(posts, core.wp_api_utils.POSTS_PER_PAGE):
+                failures += process_post_batch(batch, finished, writer, site)
+                listed.update(str(post['id']) for post in batch if post.get('id'))
+                processed += len(batch)
+            if end and not end.get('full_sweep'):
+                # Индекс содержит только измененные посты: ссылки остальных постов тоже перепроверяются
+                failures += recheck_unlisted_posts(listed, finished, writer, site)
+    except json.JSONDecodeError as e:
+        logging.error(f"Ошибка: Некорректная строка JSON в файле {post_data_file}: {e}")
+        return
+    except Exception as e:
+        logging.error(f"Непредвиденная ошибка при обработке индекса постов {post_data_file}: {e}")
+        return
+
+    if not processed:
+        logging.warning(f"Нет данных о постах сайта {site} для обработки.")
+
+    failures += writer.failed_posts
+    if failures:
+        # Необработанные посты не отмечены в журнале: запуск продолжится с ними при следующем старте
+        logging.error(f"Запуск {run_id} сайта {site} не завершен: постов с ошибками {failures}, "
+                      "он будет продолжен при следующем старте.")
+        db.close_connection()
+        return
+
+    # Изменения постов обработаны, следующий инкрементальный обход начнется с новой отметки
+    core.wp_api_utils.commit_pending_watermark(site)
+    db.complete_run(run_id)
+    db.clear_run_journal(run_id)
+    db.close_connection()
+    core.wp_api_utils.finish_run(run_id, site)
+
 
 def main():
-    """Главная функция, запускает обработку ссылок Tripster."""
-    process_tripster_links()
+    """
+    Главная функция, запускает обработку ссылок Tripster всех сайтов (load_sites) или одного сайта.
+
+    Результаты проверки страниц Tripster (run_memo) общие для всех сайтов запуска,
+    поэтому страница, на которую ссылаются несколько сайтов, проверяется один раз.
+    """
+    parser = argparse.ArgumentParser(description="Извлечение и проверка ссылок Tripster из индекса постов.")
+    parser.add_argument('--follow', action='store_true',
+                        help="Обрабатывать посты одновременно с индексацией, ожидая новых записей индекса.")
+    parser.add_argument('--site', help="Домен сайта; по умолчанию обрабатываются все сайты.")
+    args = parser.parse_args()
+
+    sites = [args.site] if args.site else [site['domain'] for site in core.wp_api_utils.load_sites()]
+    try:
+        for site in sites:
+            process_tripster_links(follow=args.follow, site=site)
+    finally:
+        run_memo.reset_all()
+        parse_pool.shutdown()
+    metrics.dump()
 
 
 if __name__ == "__main__":
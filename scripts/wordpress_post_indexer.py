@@ -2,9 +2,13 @@ import os
 import json
 from dotenv import load_dotenv
 import core.wp_api_utils
+from core import http_client
+from core import metrics
 import html
 import logging
 import requests
+from datetime import datetime, timedelta, timezone
+from db import db
 
 load_dotenv()
 
@@ -17,6 +21,10 @@ logging.basicConfig(
     # filename=LOG_FILE,  # Убираем пока запись в файл
 )
 
+INCREMENTAL_INDEXING = os.getenv("INCREMENTAL_INDEXING", "true").lower() in ("1", "true", "yes")
+FULL_SWEEP_INTERVAL_DAYS = int(os.getenv("FULL_SWEEP_INTERVAL_DAYS", 7))
+INCREMENTAL_OVERLAP_SECONDS = int(os.getenv("INCREMENTAL_OVERLAP_SECONDS", 60))
+
 
 def unescape_html(text):
     """
@@ -35,68 +43,246 @@ def unescape_html(text):
         return text
 
 
-def process_wordpress_posts():
+def is_full_sweep_due(crawl_state):
+    """
+    Определяет, нужен ли полный обход сайта.
+
+    Полный обход выполняется, если инкрементальная индексация отключена, отметка
+    последнего изменения еще не сохранена или с последнего полного обхода прошло
+    не меньше FULL_SWEEP_INTERVAL_DAYS дней.
+
+    Args:
+        crawl_state (dict): Состояние обхода сайта.
+
+    Returns:
+        bool: True, если нужен полный обход.
+    """
+    if not INCREMENTAL_INDEXING or not crawl_state.get('watermark'):
+        return True
+
+    last_full_sweep = crawl_state.get('last_full_sweep')
+    if not last_full_sweep:
+        return True
+
+    elapsed = datetime.now(timezone.utc) - datetime.fromisoformat(last_full_sweep)
+    return elapsed >= timedelta(days=FULL_SWEEP_INTERVAL_DAYS)
+
+
+def modified_after_param(watermark):
+    """
+    Формирует значение параметра modified_after по отметке последнего изменения.
+
+    WordPress сравнивает modified_after с локальным временем изменения поста, поэтому
+    используется поле modified поста с наибольшим modified_gmt. Значение сдвигается
+    назад на INCREMENTAL_OVERLAP_SECONDS, чтобы не пропустить посты, измененные
+    в ту же секунду.
+
+    Args:
+        watermark (dict): Отметка {'modified_gmt': str, 'modified': str}.
+
+    Returns:
+        str: Дата в формате ISO 8601.
+    """
+    modified = datetime.fromisoformat(watermark['modified'])
+    return (modified - timedelta(seconds=INCREMENTAL_OVERLAP_SECONDS)).isoformat()
+
+
+def start_crawl(site=None):
     """
-    Получает и обрабатывает посты из WordPress API, сохраняя их в JSON.
+    Загружает состояние обхода сайта и определяет его режим.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        tuple: (crawl_state, full_sweep, params) - состояние обхода, признак полного обхода
+               и дополнительные параметры запроса списка постов.
     """
-    all_posts = []
+    site = site or core.wp_api_utils.default_site()
+    crawl_state = core.wp_api_utils.load_crawl_state(site)
+    full_sweep = is_full_sweep_due(crawl_state)
+
+    params = {}
+    if full_sweep:
+        logging.info(f"Полный обход постов сайта {site}.")
+    else:
+        params['modified_after'] = modified_after_param(crawl_state['watermark'])
+        logging.info(f"Инкрементальный обход сайта {site}: посты, измененные после {params['modified_after']}")
+
+    return crawl_state, full_sweep, params
+
+
+def iter_post_pages(api_url, params, progress, auth=None):
+    """
+    Постранично получает посты из WordPress API.
+
+    Args:
+        api_url (str): URL API WordPress.
+        params (dict): Дополнительные параметры запроса (например, modified_after).
+        progress (dict): Словарь, в который записывается 'is_complete' - True, если
+            получены все страницы списка.
+        auth (tuple, optional): Имя пользователя и пароль приложения WordPress.
+
+    Yields:
+        list: Посты очередной страницы в формате WordPress API.
+    """
+    progress['is_complete'] = False
     page_number = 1
-    api_url = core.wp_api_utils.API_URL  # Получаем URL API
 
     while True:
         try:
-            response = requests.get(f"{api_url}?page={page_number}")
+            with metrics.timer('wp_listing_page_seconds'):
+                response = http_client.get(api_url, params=core.wp_api_utils.listing_params(page_number, **params),
+                                           auth=auth)
             response.raise_for_status()  # Проверяем статус код ответа
 
             posts = response.json()
             if not posts:
                 logging.info("Нет данных на текущей странице.")
-                break
+                progress['is_complete'] = True
+                return
 
-            all_posts.extend(posts)
             total_pages = int(response.headers.get('X-WP-TotalPages', 1))
-
             logging.info(f"Загружена страница {page_number} из {total_pages}")
-            page_number += 1
-
-            if page_number > total_pages:
-                break
+            metrics.inc('wp_listing_pages_total')
+            metrics.inc('wp_posts_listed_total', len(posts))
 
         except requests.exceptions.RequestException as e:
+            metrics.inc('wp_listing_errors_total')
             logging.error(f"Ошибка при получении данных из API (страница {page_number}): {e}")
-            break  # Прерываем цикл при ошибке
+            return  # Прерываем обход при ошибке
 
         except json.JSONDecodeError as e:
             logging.error(f"Ошибка при разборе JSON (страница {page_number}): {e}")
-            break
+            return
 
         except Exception as e:
             logging.error(f"Непредвиденная ошибка при обработке страницы {page_number}: {e}")
-            break
+            return
 
-    if all_posts:
-        logging.info(f"Всего получено {len(all_posts)} постов из API.")
+        yield posts
 
-        post_data = []
-        for i, post in enumerate(all_posts):
-            post_id = post.get('id')
-            title = post.get('title', {}).get('rendered', 'Нет заголовка')
-            decoded_title = unescape_html(title)
-            post_data.append({'order': i + 1, 'id': post_id, 'title': decoded_title})
+        page_number += 1
+        if page_number > total_pages:
+            progress['is_complete'] = True
+            return
 
-        try:
-            core.wp_api_utils.save_data_to_json_file(post_data)
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении данных в JSON файл: {e}")
+
+def to_post_record(post, order):
+    """
+    Формирует запись о посте для дальнейшей обработки.
+
+    Args:
+        post (dict): Пост в формате WordPress API.
+        order (int): Порядковый номер поста.
+
+    Returns:
+        dict: {'order', 'id', 'title', 'content'}.
+    """
+    title = post.get('title', {}).get('rendered', 'Нет заголовка')
+    content = post.get('content', {}).get('rendered')
+    return {'order': order, 'id': post.get('id'), 'title': unescape_html(title), 'content': content}
+
+
+def latest_watermark(current, post):
+    """
+    Возвращает отметку последнего изменения с учетом очередного поста.
+
+    Args:
+        current (dict): Текущая отметка {'modified_gmt', 'modified'} или None.
+        post (dict): Пост в формате WordPress API.
+
+    Returns:
+        dict: Отметка поста, если он изменен позже текущей отметки, иначе current.
+    """
+    if not post.get('modified_gmt') or not post.get('modified'):
+        return current
+    if current is None or post['modified_gmt'] > current['modified_gmt']:
+        return {'modified_gmt': post['modified_gmt'], 'modified': post['modified']}
+    return current
+
+
+def finish_crawl(crawl_state, full_sweep, watermark, post_ids, site=None):
+    """
+    Сохраняет состояние завершенного обхода.
+
+    Новая отметка сохраняется как ожидающая: рабочей она станет после успешной обработки
+    постов (commit_pending_watermark). После полного обхода из БД удаляются ссылки постов,
+    отсутствующих на сайте.
+
+    Args:
+        crawl_state (dict): Состояние обхода сайта.
+        full_sweep (bool): Признак полного обхода.
+        watermark (dict): Отметка последнего изменения среди полученных постов или None.
+        post_ids (iterable): ID всех полученных постов.
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+    """
+    if watermark:
+        crawl_state['pending_watermark'] = watermark
+
+    if full_sweep:
+        crawl_state['last_full_sweep'] = datetime.now(timezone.utc).isoformat()
+        db.delete_links_of_missing_posts(post_ids, site)
+
+    core.wp_api_utils.save_crawl_state(crawl_state, site)
+
+
+def process_wordpress_posts(site=None):
+    """
+    Получает и обрабатывает посты сайта из WordPress API, записывая их в индекс постов сайта JSONL.
+
+    Посты дописываются в индекс (PostIndexWriter) по мере получения страниц списка, поэтому
+    в памяти хранится только текущая страница. В инкрементальном режиме запрашиваются только
+    посты, измененные после сохраненной отметки последнего изменения. Периодически выполняется
+    полный обход, после которого из БД удаляются ссылки постов, отсутствующих на сайте.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+    """
+    config = core.wp_api_utils.get_site(site)
+    site = config['domain']
+    crawl_state, full_sweep, params = start_crawl(site)
+    progress = {}
+    watermark = None
+    post_ids = []
+    order = 0
+
+    try:
+        with core.wp_api_utils.PostIndexWriter(core.wp_api_utils.post_index_path(site), full_sweep) as index:
+            for posts in iter_post_pages(config['api_url'], params, progress, config['auth']):
+                records = []
+                for post in posts:
+                    order += 1
+                    watermark = latest_watermark(watermark, post)
+                    if full_sweep and post.get('id'):
+                        post_ids.append(post['id'])
+                    records.append(to_post_record(post, order))
+                index.add_posts(records)
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении индекса постов: {e}")
+        return
+
+    is_complete = progress['is_complete']
+    if order or (is_complete and not full_sweep):
+        logging.info(f"Всего получено {order} постов сайта {site} из API.")
     else:
-        logging.warning("Не удалось получить данные из API.")
+        logging.warning(f"Не удалось получить данные сайта {site} из API.")
+
+    if not is_complete:
+        # Отметку и дату полного обхода обновляем только после полного прохода по страницам
+        return
+
+    finish_crawl(crawl_state, full_sweep, watermark, post_ids, site)
 
 
 def main():
     """
-    Главная функция, запускает обработку постов WordPress.
+    Главная функция, запускает обработку постов WordPress всех сайтов (load_sites).
     """
-    process_wordpress_posts()
+    metrics.start()
+    for site in core.wp_api_utils.load_sites():
+        process_wordpress_posts(site['domain'])
+    metrics.dump()
 
 
 if __name__ == "__main__":
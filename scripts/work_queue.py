@@ -0,0 +1,326 @@
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import subprocess
+from dotenv import load_dotenv
+import core.wp_api_utils
+from core import metrics
+from core import parse_pool
+from core import run_memo
+from db import db
+from scripts import wordpress_post_indexer as indexer
+from scripts import tripster_link_processor as processor
+
+load_dotenv()
+
+# Настройка логирования
+DEFAULT_LOG_LEVEL = logging.INFO
+logging.basicConfig(level=DEFAULT_LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+WORK_BATCH_SIZE = int(os.getenv("WORK_BATCH_SIZE", 20))
+WORK_LEASE_SECONDS = int(os.getenv("WORK_LEASE_SECONDS", 600))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", 3))
+WORK_POLL_INTERVAL = int(os.getenv("WORK_POLL_INTERVAL", 5))
+WORK_LOCAL_WORKERS = int(os.getenv("WORK_LOCAL_WORKERS", 1))
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def worker_name():
+    """Возвращает имя обработчика для аренды: хост и PID процесса."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def process_batch(run_id, lease_token, posts, site=None):
+    """
+    Обрабатывает арендованный пакет постов и отмечает его выполненным.
+
+    Аренда продлевается после каждого поста. Если она истекла и пакет передан другому
+    обработчику, обработка пакета прекращается: записи постов идемпотентны, поэтому уже
+    записанные посты другой обработчик просто перезапишет. Посты, которые не удалось
+    обработать, возвращаются в очередь (release_work), а не отмечаются выполненными;
+    если не удалось записать ссылки, в очередь возвращается весь пакет.
+
+    Args:
+        run_id (str): ID запуска.
+        lease_token (str): Токен аренды.
+        posts (list): Записи о постах {'order', 'id', 'title', 'content'}.
+        site (str, optional): Домен сайта запуска. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        int: Количество обработанных постов.
+    """
+    fingerprints = db.get_post_fingerprints((post['id'] for post in posts), site)
+    processed = 0
+    failed = []
+
+    with db.LinkWriter(run_id=run_id, site=site) as writer:
+        for post in posts:
+            post_id = post['id']
+            try:
+                content = processor.load_post_content(post, site)
+                if content is not None:
+                    logging.info(f"Обрабатывается пост ID: {post_id}, title: {post['title']}")
+                    links, fingerprint = processor.extract_post_links(post_id, content, fingerprints)
+                    records = processor.resolve_post_links(post_id, post['title'], links)
+                    writer.add_post(records, fingerprint)
+                    processed += 1
+                else:
+                    logging.warning(f"Не удалось получить данные поста с ID {post_id}.")
+                    failed.append(post_id)
+            except Exception as e:
+                logging.error(f"Ошибка при обработке поста {post_id}: {e}")
+                failed.append(post_id)
+
+            if not db.extend_lease(lease_token, WORK_LEASE_SECONDS):
+                logging.warning(f"Аренда пакета {lease_token} истекла, пакет передан другому обработчику.")
+                return processed
+
+    if writer.failed_posts:
+        failed = [post['id'] for post in posts]
+        processed = 0
+    if failed:
+        logging.warning(f"Постов пакета {lease_token}, возвращенных в очередь: {len(failed)}.")
+        db.release_work(lease_token, failed)
+    db.complete_work(lease_token)
+    return processed
+
+
+def run_worker(run_id=None):
+    """
+    Обрабатывает посты из очереди работ, пока в ней есть необработанные посты.
+
+    Обработчиков можно запускать в любом количестве процессов и на любых хостах с доступом
+    к одной базе MySQL: каждый берет в аренду пакеты по WORK_BATCH_SIZE постов на
+    WORK_LEASE_SECONDS секунд. Пакеты обработчика, завершившегося аварийно, после окончания
+    аренды достаются другим обработчикам.
+
+    Args:
+        run_id (str, optional): ID запуска. По умолчанию RUN_ID или последний запуск
+            с необработанными постами в очереди.
+    """
+    run_id = run_id or core.wp_api_utils.RUN_ID or db.get_active_work_run()
+    if not run_id:
+        logging.info("В очереди нет необработанных постов.")
+        return
+
+    metrics.start()
+    owner = worker_name()
+    # Сайт запуска сохранен координатором в таблице запусков
+    site = db.get_run_site(run_id)
+    logging.info(f"Обработчик {owner} подключен к запуску {run_id} сайта {site or core.wp_api_utils.default_site()}.")
+    processed = 0
+    try:
+        while True:
+            lease_token, posts = db.lease_work(run_id, owner, WORK_BATCH_SIZE, WORK_LEASE_SECONDS, WORK_MAX_ATTEMPTS)
+            if posts:
+                processed += process_batch(run_id, lease_token, posts, site)
+                continue
+
+            progress = db.get_work_progress(run_id, WORK_MAX_ATTEMPTS)
+            if progress is None or (not progress['pending'] and not progress['leased']):
+                break
+            # Остальные посты арендованы другими обработчиками; ждем завершения или окончания их аренды
+            time.sleep(WORK_POLL_INTERVAL)
+    finally:
+        db.close_connection()
+        run_memo.reset_all()
+        parse_pool.shutdown()
+    logging.info(f"Обработчик {owner} завершил работу, обработано постов: {processed}.")
+
+
+def enqueue_sweep(run_id, site=None):
+    """
+    Получает список постов сайта и добавляет его в очередь работ запуска постранично.
+
+    Args:
+        run_id (str): ID запуска.
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        dict: Данные для finish_crawl: 'crawl_state', 'full_sweep', 'watermark', 'post_ids',
+              а также 'is_complete' - получен ли весь список постов, и 'listed' - ID (str) полученных постов.
+    """
+    config = core.wp_api_utils.get_site(site)
+    crawl_state, full_sweep, params = indexer.start_crawl(config['domain'])
+    progress = {'crawl_state': crawl_state, 'full_sweep': full_sweep, 'watermark': None, 'post_ids': [], 'listed': set()}
+    order = 0
+
+    for posts in indexer.iter_post_pages(config['api_url'], params, progress, config['auth']):
+        records = []
+        for post in posts:
+            order += 1
+            progress['watermark'] = indexer.latest_watermark(progress['watermark'], post)
+            if not post.get('id'):
+                logging.warning("Ошибка: Не найден ID поста.")
+                continue
+            if full_sweep:
+                progress['post_ids'].append(post['id'])
+            progress['listed'].add(str(post['id']))
+            records.append(indexer.to_post_record(post, order))
+        if not db.enqueue_posts(run_id, records):
+            progress['is_complete'] = False
+            break
+
+    logging.info(f"В очередь запуска {run_id} добавлено постов: {order}.")
+    return progress
+
+
+def start_local_workers(run_id, count):
+    """
+    Запускает count обработчиков очереди в отдельных процессах на этом хосте.
+
+    Каждый обработчик сохраняет свои метрики в отдельный файл (metrics-worker-N.json),
+    чтобы не перезаписывать метрики координатора.
+    """
+    workers = []
+    for number in range(1, count + 1):
+        env = dict(os.environ, METRICS_FILE=f"metrics-worker-{number}.json")
+        command = [sys.executable, '-m', 'scripts.work_queue', 'worker', '--run-id', run_id]
+        workers.append(subprocess.Popen(command, cwd=PROJECT_ROOT, env=env))
+    return workers
+
+
+def wait_for_completion(run_id, workers):
+    """
+    Ожидает, пока все посты очереди запуска будут обработаны или исчерпают попытки.
+
+    Args:
+        run_id (str): ID запуска.
+        workers (list): Локальные процессы обработчиков.
+
+    Returns:
+        dict: Итоговое состояние очереди (get_work_progress) или None в случае ошибки.
+    """
+    while True:
+        progress = db.get_work_progress(run_id, WORK_MAX_ATTEMPTS)
+        if progress is None:
+            return None
+        logging.info(
+            f"Очередь запуска {run_id}: обработано {progress['done']} из {progress['total']}, "
+            f"в работе {progress['leased']}, ожидают {progress['pending']}, с ошибками {progress['failed']}."
+        )
+        if not progress['pending'] and not progress['leased']:
+            return progress
+
+        if workers and all(worker.poll() is not None for worker in workers):
+            # Локальные обработчики завершились, а посты остались (например, аренда не истекла): запускаем новые
+            logging.warning("Локальные обработчики завершились до окончания очереди, запускаются новые.")
+            workers[:] = start_local_workers(run_id, len(workers))
+        time.sleep(WORK_POLL_INTERVAL)
+
+
+def run_coordinator(site=None):
+    """
+    Выполняет обход сайта в распределенном режиме.
+
+    Список постов добавляется в очередь работ в MySQL, посты обрабатывают WORK_LOCAL_WORKERS
+    локальных обработчиков и обработчики, запущенные на других хостах
+    (python -m scripts.work_queue worker). После обработки всей очереди сохраняется
+    состояние обхода, как и в конвейере. При инкрементальном обходе координатор затем сам
+    перепроверяет статусы ссылок постов, не попавших в список (их контент не изменился).
+
+    Если часть постов не обработана (исчерпала WORK_MAX_ATTEMPTS попыток), состояние обхода
+    и отметка последнего изменения не сохраняются, а очередь не удаляется: при следующем старте
+    запуск продолжается, и счетчик попыток таких постов сбрасывается.
+
+    Args:
+        site (str, optional): Домен сайта. По умолчанию сайт по умолчанию (default_site).
+
+    Returns:
+        bool: True, если очередь обработана полностью.
+    """
+    site = site or core.wp_api_utils.default_site()
+    run_id = core.wp_api_utils.start_run(site)
+    db.register_run(run_id, site)
+    sweep = enqueue_sweep(run_id, site)
+    retried = db.retry_failed_work(run_id, WORK_MAX_ATTEMPTS)
+    if retried:
+        logging.info(f"В очередь запуска {run_id} возвращены посты, не обработанные ранее: {retried}.")
+
+    workers = start_local_workers(run_id, WORK_LOCAL_WORKERS)
+    try:
+        progress = wait_for_completion(run_id, workers)
+    finally:
+        for worker in workers:
+            worker.wait()
+
+    if progress is None or not sweep['is_complete']:
+        logging.error(f"Запуск {run_id} не завершен, он будет продолжен при следующем старте.")
+        db.close_connection()
+        return False
+
+    if progress['failed']:
+        logging.error(f"Постов, не обработанных после {WORK_MAX_ATTEMPTS} попыток: {progress['failed']}. "
+                      f"Запуск {run_id} не завершен, он будет продолжен при следующем старте.")
+        db.close_connection()
+        return False
+
+    if not sweep['full_sweep']:
+        with db.LinkWriter(run_id=run_id, site=site) as writer:
+            failures = processor.recheck_unlisted_posts(sweep['listed'], db.get_finished_posts(run_id), writer, site)
+        failures += writer.failed_posts
+        if failures:
+            logging.error(f"Не удалось перепроверить ссылки постов: {failures}. "
+                          f"Запуск {run_id} не завершен, он будет продолжен при следующем старте.")
+            db.close_connection()
+            return False
+
+    indexer.finish_crawl(sweep['crawl_state'], sweep['full_sweep'], sweep['watermark'], sweep['post_ids'], site)
+    core.wp_api_utils.commit_pending_watermark(site)
+    db.analyze_database(db.get_run_started_at(run_id))
+    db.complete_run(run_id)
+    db.clear_run_journal(run_id)
+    db.delete_work(run_id)
+    db.close_connection()
+    core.wp_api_utils.finish_run(run_id, site)
+    return True
+
+
+def run_all_sites(sites=None):
+    """
+    Выполняет обход всех сайтов в распределенном режиме, по одному сайту за раз.
+
+    Обработчики очереди работают с одним запуском, поэтому сайты обрабатываются
+    последовательно; ошибка одного сайта не прерывает обработку остальных.
+
+    Args:
+        sites (list, optional): Домены сайтов. По умолчанию все сайты из load_sites.
+
+    Returns:
+        bool: True, если очереди всех сайтов обработаны полностью.
+    """
+    metrics.reset()
+    sites = sites or [site['domain'] for site in core.wp_api_utils.load_sites()]
+    completed = bool(sites)
+    for site in sites:
+        logging.info(f"Распределенная обработка сайта {site}.")
+        try:
+            completed = run_coordinator(site) and completed
+        except Exception as e:
+            logging.error(f"Ошибка при распределенной обработке сайта {site}: {e}")
+            completed = False
+    metrics.dump()
+    return completed
+
+
+def main():
+    """Главная функция: запускает координатор или обработчик очереди работ."""
+    parser = argparse.ArgumentParser(description="Распределенная обработка постов через очередь работ в MySQL.")
+    parser.add_argument('mode', choices=('coordinator', 'worker'))
+    parser.add_argument('--run-id', help="ID запуска (для обработчика).")
+    parser.add_argument('--site', help="Домен сайта (для координатора); по умолчанию обрабатываются все сайты.")
+    args = parser.parse_args()
+
+    if args.mode == 'coordinator':
+        run_all_sites([args.site] if args.site else None)
+    else:
+        run_worker(args.run_id)
+        metrics.dump()
+
+
+if __name__ == "__main__":
+    main()
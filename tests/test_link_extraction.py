@@ -0,0 +1,150 @@
+"""
+Проверяет, что однопроходное извлечение ссылок (parse_link_candidates) и быстрая проверка
+has_link_candidates дают тот же результат, что прежнее извлечение двумя обходами дерева.
+"""
+import pytest
+from bs4 import BeautifulSoup
+
+from core.tripster_data_extractor import (
+    extract_deeplink_id,
+    has_link_candidates,
+    parse_deeplink_candidates,
+    parse_link_candidates,
+    parse_widget_candidates,
+)
+
+
+def legacy_widget_candidates(html_content):
+    """Прежний parse_widget_candidates: поиск виджетов через find_all."""
+    candidates = []
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for widget_div in soup.find_all('div', class_='tripster-widget'):
+        widget_id = widget_div.get('data-experience-id')
+        widget_href = widget_div.get('data-experience-href')
+        title_element = widget_div.find('a', class_='expcard__title expcard__title__link')
+
+        candidates.append({
+            'id': widget_id if widget_id else None,
+            'url': widget_href if widget_id else None,
+            'card_title': title_element.text.strip() if title_element else None,
+        })
+
+    return candidates
+
+
+def legacy_deeplink_candidates(html_content, tripster_domain="tripster.ru"):
+    """Прежний parse_deeplink_candidates: поиск ссылок через find_all и find_parent."""
+    candidates = []
+    seen_links = set()
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+
+        if tripster_domain in href:
+            if link.find_parent('div', class_='tripster-widget'):
+                continue
+
+            anchor = link.text.strip()
+            if not anchor:
+                anchor = link.get_text(strip=True) or "Без названия"
+
+            link_tuple = (href, anchor)
+            if link_tuple not in seen_links:
+                candidates.append({'id': extract_deeplink_id(href), 'url': href, 'anchor': anchor})
+                seen_links.add(link_tuple)
+
+    return candidates
+
+
+WIDGET = (
+    '<div class="tripster-widget" data-experience-id="{id}" data-experience-href="https://experience.tripster.ru/experience/{id}/">'
+    '<div class="expcard"><a class="expcard__title expcard__title__link" href="https://experience.tripster.ru/experience/{id}/">'
+    ' Экскурсия {id} </a><a href="https://experience.tripster.ru/experience/{id}/?from=card">Подробнее</a></div></div>'
+)
+
+SAMPLE_POSTS = {
+    'empty': '',
+    'plain_text': '<p>Пост без ссылок на экскурсии.</p><p><a href="https://example.com/">Другой сайт</a></p>',
+    'deeplinks': (
+        '<p>Советуем <a href="https://experience.tripster.ru/experience/12345/">обзорную экскурсию</a> '
+        'и <a href="https://tripster.ru/experience/777/"> прогулку </a>.</p>'
+        '<p>Повтор: <a href="https://experience.tripster.ru/experience/12345/">обзорную экскурсию</a></p>'
+        '<p><a href="https://tripster.ru/experience/777/">другой анкор</a></p>'
+    ),
+    'partner_links': (
+        '<a href="https://tp.media/r?marker=1&amp;u=https%3A%2F%2Fexperience.tripster.ru%2Fexperience%2F4242%2F">Партнерская</a>'
+        '<a href="https://tripster.ru/moscow/"><img src="x.png"></a>'
+        '<a href="https://tripster.ru/moscow/"></a>'
+    ),
+    'widgets': WIDGET.format(id=1) + '<p>Текст</p>' + WIDGET.format(id=2),
+    'widget_without_id': (
+        '<div class="tripster-widget" data-experience-href="https://experience.tripster.ru/experience/5/">'
+        '<a href="https://experience.tripster.ru/experience/5/">Без ID</a></div>'
+    ),
+    'widget_without_title': '<div class="tripster-widget extra" data-experience-id="9" data-experience-href="https://tripster.ru/experience/9/"></div>',
+    'mixed': (
+        '<h2>Маршрут</h2><p>Начните с <a href="https://tripster.ru/experience/100/">экскурсии</a>.</p>'
+        + WIDGET.format(id=100)
+        + '<ul><li><a href="https://tripster.ru/experience/101/">Еще</a></li></ul>'
+    ),
+    'nested_widgets': (
+        '<div class="tripster-widget" data-experience-id="1" data-experience-href="https://tripster.ru/experience/1/">'
+        + WIDGET.format(id=2)
+        + '<a class="expcard__title expcard__title__link" href="https://tripster.ru/experience/1/">Внешний</a></div>'
+    ),
+    'malformed_nesting': (
+        '<p><div class="tripster-widget" data-experience-id="7" data-experience-href="https://tripster.ru/experience/7/">'
+        '<a href="https://tripster.ru/experience/7/">Внутри</a></p></div>'
+        '<a href="https://tripster.ru/experience/8/">Снаружи</a>'
+    ),
+    'unclosed_tags': '<div><p><a href="https://tripster.ru/experience/3/">Без закрытия<div class="tripster-widget" data-experience-id="4">',
+    'entity_encoded_domain': '<a href="https://experience.&#116;ripster.ru/experience/55/">Закодированный домен</a>',
+    'entity_encoded_class': '<div class="&#116;ripster-widget" data-experience-id="56" data-experience-href="https://x/"></div>',
+    'domain_in_text_only': '<p>Подробнее на сайте tripster.ru</p>',
+}
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLE_POSTS))
+def test_single_pass_extraction_matches_legacy(name):
+    html_content = SAMPLE_POSTS[name]
+
+    candidates = parse_link_candidates(html_content)
+
+    assert candidates['widgets'] == legacy_widget_candidates(html_content)
+    assert candidates['deeplinks'] == legacy_deeplink_candidates(html_content)
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLE_POSTS))
+def test_candidate_wrappers_match_legacy(name):
+    html_content = SAMPLE_POSTS[name]
+
+    assert parse_widget_candidates(html_content) == legacy_widget_candidates(html_content)
+    assert parse_deeplink_candidates(html_content) == legacy_deeplink_candidates(html_content)
+
+
+def test_custom_domain_matches_legacy():
+    html_content = SAMPLE_POSTS['mixed'] + '<a href="https://tripster.com/experience/200/">EN</a>'
+
+    assert (parse_link_candidates(html_content, 'tripster.com')['deeplinks']
+            == legacy_deeplink_candidates(html_content, 'tripster.com'))
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLE_POSTS))
+def test_prefilter_never_skips_posts_with_links(name):
+    html_content = SAMPLE_POSTS[name]
+
+    if not has_link_candidates(html_content):
+        assert legacy_widget_candidates(html_content) == []
+        assert legacy_deeplink_candidates(html_content) == []
+
+
+@pytest.mark.parametrize('name', ['entity_encoded_domain', 'entity_encoded_class'])
+def test_prefilter_decodes_character_references(name):
+    assert has_link_candidates(SAMPLE_POSTS[name])
+
+
+def test_prefilter_skips_posts_without_tripster():
+    assert not has_link_candidates(SAMPLE_POSTS['plain_text'])
+    assert not has_link_candidates('<p>Fish &amp; chips</p>')
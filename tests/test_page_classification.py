@@ -0,0 +1,117 @@
+"""
+Проверяет, что досрочная остановка чтения страницы (is_page_classifiable) не меняет
+тип страницы и причину паузы экскурсии по сравнению с разбором всей страницы.
+"""
+import pytest
+
+from core.tripster_data_extractor import (
+    extract_experience_info,
+    is_experience_page,
+    is_listing_page,
+    is_page_classifiable,
+    is_sputnik_page,
+    parse_page,
+)
+
+FILLER = '<div class="text">' + 'Описание экскурсии. ' * 40 + '</div>'
+
+SAMPLE_PAGES = {
+    'active_experience': (
+        '<html><head><title>Экскурсия</title></head><body>'
+        '<div class="page-experience"><div class="page-experience__wrap"><h1>Обзорная экскурсия</h1>'
+        + FILLER + '</div></div></body></html>'
+    ),
+    'paused_experience': (
+        '<html><body><div class="page-experience">'
+        '<div class="page-experience__wrap" style="display:none;">' + FILLER + '</div>'
+        '<div class="exp-paused"><h3 class="exp-paused__preview-name">Прогулка по центру</h3>'
+        '<p>Гид временно не проводит экскурсию</p></div>'
+        + FILLER + '</div></body></html>'
+    ),
+    'paused_experience_without_reason': (
+        '<html><body><div class="page-experience">'
+        '<div class="page-experience__wrap" style="display:none;"></div>'
+        '<div class="exp-paused"><h3 class="exp-paused__preview-name">Без причины</h3></div>'
+        + FILLER + '<p>Подвал</p></div></body></html>'
+    ),
+    'paused_experience_without_block': (
+        '<html><body><div class="page-experience">'
+        '<div class="page-experience__wrap" style="display:none;"></div>'
+        + FILLER + '</div></body></html>'
+    ),
+    'sputnik': '<html><body><div class="sputnik-hr"><h1>Спутник</h1></div>' + FILLER + '</body></html>',
+    'listing': '<html><body><div class="product-header"><h1>Экскурсии в Москве</h1></div>' + FILLER + '</body></html>',
+    'author_page': '<html><body><div class="author_page"><h1>Гид Иван</h1></div>' + FILLER + '</body></html>',
+    'listing_with_experience_below': (
+        '<html><body><div class="destination"><h1>Казань</h1></div>' + FILLER
+        + '<div class="page-experience"><div class="page-experience__wrap" style="display:none;"></div>'
+        '<div class="exp-paused"><h3 class="exp-paused__preview-name">Казань за день</h3><p>Снята с продажи</p></div>'
+        '</div></body></html>'
+    ),
+    'listing_with_sputnik_below': (
+        '<html><body><div class="welcome-top"><h1>Tripster</h1></div>' + FILLER
+        + '<div class="sputnik-hr"></div></body></html>'
+    ),
+    'sputnik_with_experience_below': (
+        '<html><body><div class="sputnik-hr"></div>' + FILLER
+        + '<div class="page-experience"><div class="page-experience__wrap"></div></div></body></html>'
+    ),
+    'unknown': '<html><body><h1>Страница не найдена</h1>' + FILLER + '</body></html>',
+}
+
+
+def early_stop_prefix(page):
+    """Возвращает начало страницы, на котором fetch_pages(stop_when=is_page_classifiable) остановит чтение."""
+    for end in range(1, len(page) + 1):
+        prefix = page[:end]
+        if is_page_classifiable(prefix):
+            return prefix
+    return page
+
+
+def page_decision(content):
+    """Определяет тип страницы по порядку проверок extract_widget_info."""
+    soup = parse_page(content)
+    if is_experience_page(soup):
+        return 'experience', extract_experience_info(soup)
+    if is_sputnik_page(soup):
+        return 'sputnik', None
+    return 'listing', is_listing_page(soup)
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLE_PAGES))
+def test_early_stop_matches_full_parse(name):
+    page = SAMPLE_PAGES[name].encode('utf-8')
+
+    assert page_decision(early_stop_prefix(page)) == page_decision(page)
+
+
+@pytest.mark.parametrize('name', ['active_experience', 'paused_experience', 'paused_experience_without_reason'])
+def test_experience_pages_stop_early(name):
+    page = SAMPLE_PAGES[name].encode('utf-8')
+
+    assert len(early_stop_prefix(page)) < len(page)
+
+
+@pytest.mark.parametrize('name', ['sputnik', 'listing', 'author_page', 'listing_with_sputnik_below', 'unknown'])
+def test_pages_without_experience_block_are_read_in_full(name):
+    page = SAMPLE_PAGES[name].encode('utf-8')
+
+    assert early_stop_prefix(page) == page
+
+
+@pytest.mark.parametrize('name', ['listing_with_experience_below', 'sputnik_with_experience_below'])
+def test_experience_block_below_other_markers_is_reached(name):
+    page = SAMPLE_PAGES[name].encode('utf-8')
+    decision = page_decision(early_stop_prefix(page))
+
+    assert decision[0] == 'experience'
+    assert decision == page_decision(page)
+
+
+def test_paused_experience_waits_for_reason():
+    page = SAMPLE_PAGES['paused_experience'].encode('utf-8')
+    prefix = early_stop_prefix(page)
+
+    assert prefix.endswith(b'</p>')
+    assert extract_experience_info(parse_page(prefix)) == ('Прогулка по центру', 'Гид временно не проводит экскурсию')
@@ -0,0 +1,109 @@
+"""
+Проверяет перенос истории статуса ссылок (with_status_history) и сохранение прежнего
+результата для ссылок, не проверенных из-за ограничения запросов (UNCHECKED).
+"""
+from datetime import datetime
+
+from core import link_status
+from core import tripster_data_extractor
+from db.db import with_status_history
+
+CHANGED_AT = datetime(2026, 1, 2, 3, 4, 5)
+
+
+def make_record(link_status, **fields):
+    record = {
+        'post_id': '42',
+        'post_title': 'Пост',
+        'link_type': 'deeplink',
+        'exp_id': '100',
+        'exp_title': 'Новый заголовок',
+        'exp_url': 'https://tripster.ru/experience/100/',
+        'link_status': link_status,
+        'inactivity_reason': None,
+        'is_unknown_type': False,
+    }
+    record.update(fields)
+    return record
+
+
+def make_stored(link_status, previous_status=None, **fields):
+    return dict(make_record(link_status, **fields), previous_status=previous_status, status_changed_at=CHANGED_AT)
+
+
+def test_new_link_starts_history():
+    result = with_status_history(make_record('active'), None)
+
+    assert result['previous_status'] is None
+    assert result['status_changed_at'] is None
+
+
+def test_unchanged_status_keeps_history():
+    stored = make_stored('inactive', previous_status='active')
+
+    result = with_status_history(make_record('inactive'), stored)
+
+    assert result['link_status'] == 'inactive'
+    assert result['previous_status'] == 'active'
+    assert result['status_changed_at'] == CHANGED_AT
+
+
+def test_changed_status_records_previous_status():
+    stored = make_stored('active', previous_status='inactive')
+
+    result = with_status_history(make_record('inactive', inactivity_reason='Снята с продажи'), stored)
+
+    assert result['link_status'] == 'inactive'
+    assert result['previous_status'] == 'active'
+    assert result['status_changed_at'] is None
+    assert result['inactivity_reason'] == 'Снята с продажи'
+
+
+def test_unchecked_link_keeps_stored_result():
+    stored = make_stored('inactive', previous_status='active', exp_title='Старый заголовок',
+                         inactivity_reason='Снята с продажи', is_unknown_type=True)
+
+    result = with_status_history(make_record(link_status.UNCHECKED, post_title='Новый пост'), stored)
+
+    for field in ('exp_title', 'link_status', 'inactivity_reason', 'is_unknown_type', 'previous_status', 'status_changed_at'):
+        assert result[field] == stored[field]
+    assert result['post_title'] == 'Новый пост'
+
+
+def test_unchecked_new_link_is_not_written():
+    assert with_status_history(make_record(link_status.UNCHECKED), None) is None
+
+
+def test_unchecked_carry_over_survives_repeated_runs():
+    stored = make_stored('inactive', previous_status='active')
+
+    first = with_status_history(make_record(link_status.UNCHECKED), stored)
+    second = with_status_history(make_record(link_status.UNCHECKED), first)
+    checked = with_status_history(make_record('inactive'), second)
+
+    assert second['link_status'] == 'inactive'
+    assert checked['previous_status'] == 'active'
+    assert checked['status_changed_at'] == CHANGED_AT
+
+
+def test_rate_limited_widget_is_unchecked(monkeypatch):
+    url = 'https://experience.tripster.ru/experience/100/'
+    monkeypatch.setattr(tripster_data_extractor, 'fetch_page_summaries',
+                        lambda urls, **kwargs: {url: tripster_data_extractor.RATE_LIMITED_SUMMARY})
+
+    widgets = tripster_data_extractor.resolve_widgets([{'id': '100', 'url': url, 'card_title': 'Карточка'}])
+
+    assert widgets[0]['status'] == link_status.UNCHECKED
+    assert widgets[0]['title'] == 'Карточка'
+
+
+def test_rate_limited_deeplink_is_unchecked(monkeypatch):
+    url = 'https://experience.tripster.ru/experience/100/'
+    monkeypatch.setattr(tripster_data_extractor, 'check_deeplink_statuses_api',
+                        lambda ids: {experience_id: (None, None, None) for experience_id in ids})
+    monkeypatch.setattr(tripster_data_extractor, 'fetch_page_summaries',
+                        lambda urls, **kwargs: {page_url: tripster_data_extractor.RATE_LIMITED_SUMMARY for page_url in urls})
+
+    deeplinks = tripster_data_extractor.resolve_deeplinks([{'id': 100, 'url': url, 'anchor': 'Экскурсия'}])
+
+    assert deeplinks[0]['status'] == link_status.UNCHECKED
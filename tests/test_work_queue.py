@@ -0,0 +1,131 @@
+"""
+Проверяет переходы состояний очереди работ в MySQL: аренду, истечение аренды, возврат постов и get_work_progress.
+
+Слой db работает только с MySQL, поэтому тесты выполняются, если задана отдельная тестовая база
+TEST_DB_NAME (на сервере DB_HOST). Рабочая база DB_NAME тестами не используется.
+"""
+import os
+import uuid
+
+import pytest
+
+from db import db
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DB_NAME = os.getenv("TEST_DB_NAME")
+MAX_ATTEMPTS = 2
+LEASE_SECONDS = 60
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DB_NAME or TEST_DB_NAME == os.getenv("DB_NAME"),
+    reason="Не задана отдельная тестовая база TEST_DB_NAME"
+)
+
+
+@pytest.fixture(scope='module')
+def connection():
+    db_name = os.environ.get('DB_NAME')
+    os.environ['DB_NAME'] = TEST_DB_NAME
+    db.close_connection()
+    connection = db.get_connection()
+    if connection is None:
+        pytest.skip("Не удалось подключиться к тестовой базе TEST_DB_NAME")
+    db.execute_sql_file(connection, os.path.join(PROJECT_ROOT, 'db', 'sql', 'db_create_tables.sql'))
+    yield connection
+    db.close_connection()
+    if db_name is None:
+        os.environ.pop('DB_NAME', None)
+    else:
+        os.environ['DB_NAME'] = db_name
+
+
+@pytest.fixture
+def run_id(connection):
+    run_id = f"test-{uuid.uuid4().hex}"
+    posts = [{'order': order, 'id': str(100 + order), 'title': f"Пост {order}", 'content': '<p>Текст</p>'}
+             for order in range(3)]
+    assert db.enqueue_posts(run_id, posts)
+    yield run_id
+    db.delete_work(run_id)
+
+
+def expire_lease(connection, lease_token):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE `wptq_tripster_work_queue` SET `lease_expires_at` = NOW() - INTERVAL 1 SECOND WHERE `lease_token` = %s",
+            (lease_token,)
+        )
+
+
+def progress(run_id):
+    return db.get_work_progress(run_id, MAX_ATTEMPTS)
+
+
+def test_enqueue_is_idempotent(run_id):
+    assert db.enqueue_posts(run_id, [{'order': 0, 'id': '100', 'title': 'Другой', 'content': ''}])
+
+    assert progress(run_id) == {'total': 3, 'done': 0, 'pending': 3, 'leased': 0, 'failed': 0}
+
+
+def test_lease_and_complete(run_id):
+    token, posts = db.lease_work(run_id, 'worker-1', 2, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    assert [post['id'] for post in posts] == ['100', '101']
+    assert progress(run_id) == {'total': 3, 'done': 0, 'pending': 1, 'leased': 2, 'failed': 0}
+
+    assert db.complete_work(token) == 2
+    assert progress(run_id) == {'total': 3, 'done': 2, 'pending': 1, 'leased': 0, 'failed': 0}
+
+
+def test_active_lease_is_not_leased_twice(run_id):
+    token, _ = db.lease_work(run_id, 'worker-1', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    assert db.lease_work(run_id, 'worker-2', 3, LEASE_SECONDS, MAX_ATTEMPTS) == (None, [])
+    assert db.extend_lease(token, LEASE_SECONDS)
+
+
+def test_expired_lease_is_taken_over(connection, run_id):
+    token, _ = db.lease_work(run_id, 'worker-1', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+    expire_lease(connection, token)
+
+    assert progress(run_id)['pending'] == 3
+    new_token, posts = db.lease_work(run_id, 'worker-2', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    assert len(posts) == 3
+    assert not db.extend_lease(token, LEASE_SECONDS)
+    assert db.complete_work(token) == 0
+    assert db.complete_work(new_token) == 3
+    assert progress(run_id)['done'] == 3
+
+
+def test_released_posts_return_to_queue(run_id):
+    token, _ = db.lease_work(run_id, 'worker-1', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    assert db.release_work(token, ['101']) == 1
+    assert db.complete_work(token) == 2
+    assert progress(run_id) == {'total': 3, 'done': 2, 'pending': 1, 'leased': 0, 'failed': 0}
+
+    _, posts = db.lease_work(run_id, 'worker-2', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+    assert [post['id'] for post in posts] == ['101']
+
+
+def test_exhausted_posts_are_failed_until_retried(connection, run_id):
+    for _ in range(MAX_ATTEMPTS):
+        token, posts = db.lease_work(run_id, 'worker-1', 1, LEASE_SECONDS, MAX_ATTEMPTS)
+        assert [post['id'] for post in posts] == ['100']
+        expire_lease(connection, token)
+
+    assert progress(run_id) == {'total': 3, 'done': 0, 'pending': 2, 'leased': 0, 'failed': 1}
+    _, posts = db.lease_work(run_id, 'worker-1', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+    assert [post['id'] for post in posts] == ['101', '102']
+
+    assert db.retry_failed_work(run_id, MAX_ATTEMPTS) == 1
+    assert progress(run_id) == {'total': 3, 'done': 0, 'pending': 1, 'leased': 2, 'failed': 0}
+
+
+def test_active_work_run(run_id):
+    token, _ = db.lease_work(run_id, 'worker-1', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+    assert db.get_active_work_run() == run_id
+
+    db.complete_work(token)
+    assert db.get_active_work_run() != run_id
@@ -0,0 +1,205 @@
+"""
+Проверяет переходы состояний очереди работ при обработке постов обработчиками (process_batch, run_worker)
+без MySQL: очередь заменяется очередью в памяти с теми же правилами аренды, истечения аренды и попыток.
+"""
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from db import db
+from scripts import tripster_link_processor as processor
+from scripts import work_queue
+
+RUN_ID = 'test-run'
+LEASE_SECONDS = work_queue.WORK_LEASE_SECONDS
+MAX_ATTEMPTS = work_queue.WORK_MAX_ATTEMPTS
+
+
+class FakeWorkQueue:
+    """
+    Очередь работ в памяти. Повторяет условия запросов db.lease_work, extend_lease, complete_work,
+    release_work, retry_failed_work и get_work_progress к таблице wptq_tripster_work_queue;
+    вместо NOW() используются часы now, которые двигает sleep.
+    """
+
+    def __init__(self, post_ids):
+        self.now = 0.0
+        self.tokens = itertools.count(1)
+        self.rows = [
+            {'order': order, 'id': post_id, 'title': f"Пост {post_id}", 'content': '<p>Текст</p>',
+             'status': 'pending', 'attempts': 0, 'owner': None, 'token': None, 'expires_at': None}
+            for order, post_id in enumerate(post_ids)
+        ]
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def expired(self, row):
+        return row['expires_at'] is not None and row['expires_at'] < self.now
+
+    def leased_rows(self, lease_token):
+        return [row for row in self.rows if row['token'] == lease_token and row['status'] == 'leased']
+
+    def row(self, post_id):
+        return next(row for row in self.rows if row['id'] == post_id)
+
+    def lease_work(self, run_id, owner, batch_size, lease_seconds, max_attempts):
+        available = [row for row in self.rows if row['attempts'] < max_attempts
+                     and (row['status'] == 'pending' or (row['status'] == 'leased' and self.expired(row)))]
+        if not available:
+            return None, []
+        token = f"token-{next(self.tokens)}"
+        for row in available[:batch_size]:
+            row.update(status='leased', owner=owner, token=token, expires_at=self.now + lease_seconds,
+                       attempts=row['attempts'] + 1)
+        return token, [{key: row[key] for key in ('order', 'id', 'title', 'content')} for row in available[:batch_size]]
+
+    def extend_lease(self, lease_token, lease_seconds):
+        rows = self.leased_rows(lease_token)
+        for row in rows:
+            row['expires_at'] = self.now + lease_seconds
+        return bool(rows)
+
+    def complete_work(self, lease_token):
+        rows = self.leased_rows(lease_token)
+        for row in rows:
+            row.update(status='done', content=None)
+        return len(rows)
+
+    def release_work(self, lease_token, post_ids):
+        ids = {str(post_id) for post_id in post_ids}
+        rows = [row for row in self.leased_rows(lease_token) if row['id'] in ids]
+        for row in rows:
+            row.update(status='pending', owner=None, token=None, expires_at=None)
+        return len(rows)
+
+    def retry_failed_work(self, run_id, max_attempts):
+        rows = [row for row in self.rows if row['attempts'] >= max_attempts
+                and (row['status'] == 'pending' or (row['status'] == 'leased' and self.expired(row)))]
+        for row in rows:
+            row.update(status='pending', attempts=0, owner=None, token=None, expires_at=None)
+        return len(rows)
+
+    def get_work_progress(self, run_id, max_attempts):
+        progress = {'total': 0, 'done': 0, 'pending': 0, 'leased': 0, 'failed': 0}
+        for row in self.rows:
+            progress['total'] += 1
+            if row['status'] == 'done':
+                progress['done'] += 1
+            elif row['status'] == 'leased' and not self.expired(row):
+                progress['leased'] += 1
+            elif row['attempts'] >= max_attempts:
+                progress['failed'] += 1
+            else:
+                progress['pending'] += 1
+        return progress
+
+
+class FakeLinkWriter:
+    """Замена db.LinkWriter: запоминает записанные посты, failed_posts задается тестом."""
+
+    failed_posts = 0
+
+    def __init__(self, *args, **kwargs):
+        self.posts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add_post(self, *args, **kwargs):
+        self.posts.append(args)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = FakeWorkQueue(['100', '101', '102'])
+    for name in ('lease_work', 'extend_lease', 'complete_work', 'release_work', 'retry_failed_work', 'get_work_progress'):
+        monkeypatch.setattr(db, name, getattr(queue, name))
+    monkeypatch.setattr(db, 'get_run_site', lambda run_id: None, raising=False)
+    monkeypatch.setattr(db, 'get_post_fingerprints', lambda *args, **kwargs: {})
+    monkeypatch.setattr(db, 'close_connection', lambda: None)
+    monkeypatch.setattr(db, 'LinkWriter', FakeLinkWriter)
+    monkeypatch.setattr(processor, 'load_post_content', lambda post, *args: post['content'])
+    monkeypatch.setattr(processor, 'extract_post_links', lambda *args: ([], None))
+    monkeypatch.setattr(processor, 'resolve_post_links', lambda *args: [])
+    monkeypatch.setattr(work_queue, 'time', SimpleNamespace(sleep=queue.sleep))
+    monkeypatch.setattr(work_queue, 'WORK_BATCH_SIZE', 2)
+    return queue
+
+
+def progress(queue):
+    return queue.get_work_progress(RUN_ID, MAX_ATTEMPTS)
+
+
+def test_worker_processes_queue_in_batches(queue):
+    work_queue.run_worker(RUN_ID)
+
+    assert progress(queue) == {'total': 3, 'done': 3, 'pending': 0, 'leased': 0, 'failed': 0}
+    assert [row['token'] for row in queue.rows] == ['token-1', 'token-1', 'token-2']
+    assert all(row['attempts'] == 1 for row in queue.rows)
+
+
+def test_expired_lease_stops_batch(queue, monkeypatch):
+    token, posts = queue.lease_work(RUN_ID, 'worker-1', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    def slow_load(post, *args):
+        # Пока пост обрабатывается, аренда истекает и пакет берет другой обработчик
+        queue.sleep(LEASE_SECONDS + 1)
+        queue.lease_work(RUN_ID, 'worker-2', 3, LEASE_SECONDS, MAX_ATTEMPTS)
+        return post['content']
+
+    monkeypatch.setattr(processor, 'load_post_content', slow_load)
+
+    assert work_queue.process_batch(RUN_ID, token, posts) == 1
+    assert progress(queue) == {'total': 3, 'done': 0, 'pending': 0, 'leased': 3, 'failed': 0}
+    assert {row['owner'] for row in queue.rows} == {'worker-2'}
+    assert queue.complete_work(token) == 0
+
+
+def test_worker_waits_for_lease_of_another_worker(queue):
+    queue.lease_work(RUN_ID, 'crashed', 1, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    work_queue.run_worker(RUN_ID)
+
+    assert progress(queue) == {'total': 3, 'done': 3, 'pending': 0, 'leased': 0, 'failed': 0}
+    assert queue.now > LEASE_SECONDS
+    assert queue.row('100')['attempts'] == 2
+
+
+def test_exhausted_posts_are_failed(queue):
+    for _ in range(MAX_ATTEMPTS):
+        queue.lease_work(RUN_ID, 'crashed', 1, LEASE_SECONDS, MAX_ATTEMPTS)
+        queue.sleep(LEASE_SECONDS + 1)
+
+    work_queue.run_worker(RUN_ID)
+
+    assert progress(queue) == {'total': 3, 'done': 2, 'pending': 0, 'leased': 0, 'failed': 1}
+    assert queue.row('100')['status'] == 'leased'
+
+
+def test_failed_posts_are_released_until_exhausted(queue, monkeypatch):
+    monkeypatch.setattr(processor, 'load_post_content',
+                        lambda post, *args: None if post['id'] == '101' else post['content'])
+
+    work_queue.run_worker(RUN_ID)
+
+    assert progress(queue) == {'total': 3, 'done': 2, 'pending': 0, 'leased': 0, 'failed': 1}
+    assert queue.row('101')['attempts'] == MAX_ATTEMPTS
+
+    assert queue.retry_failed_work(RUN_ID, MAX_ATTEMPTS) == 1
+    monkeypatch.setattr(processor, 'load_post_content', lambda post, *args: post['content'])
+    work_queue.run_worker(RUN_ID)
+
+    assert progress(queue) == {'total': 3, 'done': 3, 'pending': 0, 'leased': 0, 'failed': 0}
+
+
+def test_write_failure_releases_whole_batch(queue, monkeypatch):
+    monkeypatch.setattr(FakeLinkWriter, 'failed_posts', 1)
+    token, posts = queue.lease_work(RUN_ID, 'worker-1', 2, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    assert work_queue.process_batch(RUN_ID, token, posts) == 0
+    assert progress(queue) == {'total': 3, 'done': 0, 'pending': 3, 'leased': 0, 'failed': 0}